@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-from typing import Optional, List, Union, Any
+from typing import Optional, List, Union, Any, Literal
 from pydantic import BaseModel, Field
-from sqlmodel import Session
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from backend.models import Soul
 
@@ -9,13 +10,19 @@ from backend.models import Soul
 @dataclass
 class AgentDeps:
     user_soul: Soul
-    db_session: Session
+    db_session: Union[Session, AsyncSession]
     user_id: int
     mcp_url: Optional[str] = None
     mcp_type: Optional[str] = None
     skill_files: Any = None
 
 
+def save_record(session: Session, record: SQLModel) -> None:
+    """Add and commit a record; use with run_in_session so it also works on an AsyncSession."""
+    session.add(record)
+    session.commit()
+
+
 class AgentResponse(BaseModel):
     code: Optional[str] = Field(
         default=None,
@@ -38,3 +45,12 @@ class AgentResponse(BaseModel):
         default=None,
         description="LLM reasoning/thinking process if available."
     )
+
+
+class EndpointQuery(BaseModel):
+    query: str = Field(..., description="The search query for one dataset")
+    source: Literal["pdok", "cbs"] = Field(..., description="pdok for geographic OGC APIs, cbs for statistical tables")
+    filter_geojson: bool = Field(
+        default=False,
+        description="Only return GeoJSON-capable PDOK endpoints (OGC API Features with /collections)"
+    )
@@ -16,11 +16,17 @@ import plotly.graph_objects as go
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart, SystemPromptPart, ThinkingPart, ThinkingPartDelta
 from pydantic_ai.models.openai import OpenAIResponsesModel, OpenAIResponsesModelSettings
-from sqlmodel import select
 from textwrap import dedent
 
-from backend.agents.base import AgentDeps, AgentResponse
-from backend.models import ChatHistory, ResearchStep
+from backend.agents.base import AgentDeps, AgentResponse, EndpointQuery, save_record
+from backend.agents.history import (
+    HISTORY_COMPACT_THRESHOLD,
+    build_message_history,
+    compact_history_in_background,
+    load_chat_context
+)
+from backend.database import run_in_session
+from backend.models import ResearchStep
 from backend.tools.result_tool import map_content_to_frontend
 from backend.skills_manager import get_skills_toolsets
 
@@ -47,12 +53,13 @@ model_settings = OpenAIResponsesModelSettings(
 level = "medior"
 
 
-def sys_prompt(soul, memory) -> str:
-    return dedent(f"""
-        You are an expert Python data scientist talking to:
-        {soul}.
+# Static instructions, sent first: providers cache the longest prompt prefix they have seen before,
+# so nothing that differs per user or request may come before (or inside) this text.
+def sys_prompt() -> str:
+    return dedent("""
+        You are an expert Python data scientist talking to the user described at the end of these instructions.
         Always make sure user questions are specific, ask for information if necessary.
-        Remember {memory}
+        Remember what you know about the user.
 
         IMPORTANT: Always respond in Dutch. Both the `answer` field and any code comments (if needed) must be in Dutch.
 
@@ -82,7 +89,7 @@ def sys_prompt(soul, memory) -> str:
             - geopandas.GeoDataFrame
             - plotly.graph_objects.Figure
             - pandas.DataFrame
-            - {{'type': 'download', 'data': bytes, 'filename': str, 'mime': str, 'label': str}}
+            - {'type': 'download', 'data': bytes, 'filename': str, 'mime': str, 'label': str}
             - str
         2. Prioritize visualizing results as a geopandas.GeoDataFrame or plotly.graph_objects.Figure. If neither is possible, use a pandas.DataFrame or str, in that order.
         3. Visualization Style:
@@ -92,16 +99,18 @@ def sys_prompt(soul, memory) -> str:
     """)
 
 
+# Instructions in order: the static prompt, the skills (add_skills) and the user (build_system_prompt)
 agent = Agent(
     model,
     deps_type=AgentDeps,
     output_type=AgentResponse,
-    model_settings=model_settings
+    model_settings=model_settings,
+    instructions=sys_prompt()
 )
 
 
 @agent.tool
-def pdok_ogc_api(ctx: RunContext[AgentDeps], ogc_dataset: str, top_k: int = 5, filter_geojson: bool = True) -> str:
+async def pdok_ogc_api(ctx: RunContext[AgentDeps], ogc_dataset: str, top_k: int = 5, filter_geojson: bool = True) -> str:
     """Query the metadata database for the best matching OGC API endpoints. Use bbox of viewport.
 
     Args:
@@ -109,35 +118,59 @@ def pdok_ogc_api(ctx: RunContext[AgentDeps], ogc_dataset: str, top_k: int = 5, f
         top_k: Number of results to return (default 5, max 20)
         filter_geojson: If True (default), only return GeoJSON-capable endpoints (OGC API Features with /collections)
     """
-    from backend.tools.metadata_lookup import find_endpoint
+    from backend.tools.metadata_lookup import find_endpoint_async
     top_k = min(max(1, top_k), 20)
     logger.info(f"OGC_API: {ogc_dataset}, top_k={top_k}, filter_geojson={filter_geojson}")
-    return find_endpoint(ogc_dataset, source_type="pdok", top_k=top_k, filter_geojson=filter_geojson)
+    return await find_endpoint_async(ogc_dataset, source_type="pdok", top_k=top_k, filter_geojson=filter_geojson)
 
 
 @agent.tool
-def cbs_api(ctx: RunContext[AgentDeps], cbs_dataset: str, top_k: int = 5) -> str:
+async def cbs_api(ctx: RunContext[AgentDeps], cbs_dataset: str, top_k: int = 5) -> str:
     """Query the metadata database for the best matching CBS API endpoints.
 
     Args:
         cbs_dataset: The search query for CBS datasets
         top_k: Number of results to return (default 5, max 20)
     """
-    from backend.tools.metadata_lookup import find_endpoint
+    from backend.tools.metadata_lookup import find_endpoint_async
     top_k = min(max(1, top_k), 20)
     logger.info(f"CBS_API: {cbs_dataset}, top_k={top_k}")
-    return find_endpoint(cbs_dataset, source_type="cbs", top_k=top_k)
+    return await find_endpoint_async(cbs_dataset, source_type="cbs", top_k=top_k)
+
+
+@agent.tool
+async def search_endpoints(ctx: RunContext[AgentDeps], queries: List[EndpointQuery], top_k: int = 3) -> str:
+    """Query the metadata database for several datasets at once, e.g. a CBS table and a PDOK boundary layer.
+    Prefer this over several pdok_ogc_api/cbs_api calls when more than one dataset is needed.
+
+    Args:
+        queries: One search per dataset, each with its query, source ("pdok" or "cbs") and GeoJSON filter
+        top_k: Number of results per search (default 3, max 10)
+    """
+    from backend.tools.metadata_lookup import search_metadata_batch_async
+    queries = queries[:10]
+    top_k = min(max(1, top_k), 10)
+    logger.info(f"SEARCH_ENDPOINTS: {[q.query for q in queries]}, top_k={top_k}")
+    try:
+        results = await search_metadata_batch_async(
+            [{"query": q.query, "source_type": q.source, "filter_geojson": q.filter_geojson} for q in queries],
+            top_k
+        )
+    except Exception as e:
+        logger.error(f"Error searching endpoints: {e}")
+        return json.dumps({"error": str(e), "results": []})
+    return json.dumps({"results": [{"query": q.query, "results": r} for q, r in zip(queries, results)]})
 
 
 @agent.tool
-def get_soul(ctx: RunContext[AgentDeps]) -> str:
+async def get_soul(ctx: RunContext[AgentDeps]) -> str:
     """Get the user's soul/memory information.
 
     Use this when the user asks what you know about them.
     """
     from backend.models import User
 
-    user = ctx.deps.db_session.get(User, ctx.deps.user_id)
+    user = await run_in_session(ctx.deps.db_session, lambda session: session.get(User, ctx.deps.user_id))
     logger.info(f"Getting soul for user_id={ctx.deps.user_id}")
     if not user:
         return "User not found"
@@ -168,7 +201,7 @@ async def update_soul(ctx: RunContext[AgentDeps], new_information: str) -> str:
     from openai import AsyncOpenAI
     from backend.models import User
 
-    user = ctx.deps.db_session.get(User, ctx.deps.user_id)
+    user = await run_in_session(ctx.deps.db_session, lambda session: session.get(User, ctx.deps.user_id))
     logger.info(f"Updating soul for user_id={ctx.deps.user_id} with new information: {new_information}")
     if not user:
         return "User not found"
@@ -222,8 +255,10 @@ Respond only with valid JSON."""
         }
         logger.info(f"Updated soul for user {ctx.deps.user_id}: {user.soul_data}")
 
-        ctx.deps.db_session.add(user)
-        ctx.deps.db_session.commit()
+        await run_in_session(ctx.deps.db_session, save_record, user)
+
+        from backend.api.dependencies import forget_user
+        forget_user(user.username)
 
         ctx.deps.user_soul.style = user.soul_data.get("style", "concise")
         ctx.deps.user_soul.preferences = user.soul_data.get("preferences", {})
@@ -246,23 +281,16 @@ async def add_skills(ctx: RunContext) -> str | None:
 
 
 def build_system_prompt(ctx: AgentDeps, toolsets: List = None) -> str:
-    """Build the complete system prompt including skills."""
+    """Build the per-user part of the instructions, which goes after the static prompt and skills."""
     soul = ctx.user_soul
     memory = soul.preferences.get("memory", "") if soul.preferences else ""
     memory_str = f"\nMemory about user: {memory}" if memory else ""
-    userinfo = f"User Preferences: {soul.preferences}. Communication Style: {soul.style}.{memory_str}"
-
-    return f"{userinfo}\n\n" + sys_prompt(userinfo, memory_str)
+    return f"### User\nUser Preferences: {soul.preferences}. Communication Style: {soul.style}.{memory_str}"
 
 
 async def build_system_prompt_async(ctx: AgentDeps, toolsets: List = None) -> str:
-    """Build the complete system prompt including skills (async version)."""
-    soul = ctx.user_soul
-    memory = soul.preferences.get("memory", "") if soul.preferences else ""
-    memory_str = f"\nMemory about user: {memory}" if memory else ""
-    userinfo = f"User Preferences: {soul.preferences}. Communication Style: {soul.style}.{memory_str}"
-
-    return f"{userinfo}\n\n" + sys_prompt(userinfo, memory_str)
+    """Build the per-user part of the instructions (async version)."""
+    return build_system_prompt(ctx, toolsets)
 
 
 def get_result(exec_globals: Dict[str, Any], allowed_globals: set) -> Any:
@@ -281,18 +309,10 @@ async def run_agent(query: str, deps: AgentDeps) -> Dict[str, Any]:
     toolset = get_skills_toolsets()
     toolsets = [toolset] if toolset else []
 
-    statement = select(ChatHistory).where(ChatHistory.user_id == deps.user_id).order_by(ChatHistory.timestamp.desc()).limit(10)
-
-    history_records = deps.db_session.exec(statement).all()
-    history_records = list(history_records)[::-1]
-
-    message_history: List[ModelMessage] = []
-
-    for record in history_records:
-        if record.role == "user":
-            message_history.append(ModelRequest(parts=[UserPromptPart(content=record.content)]))
-        elif record.role == "model":
-            message_history.append(ModelResponse(parts=[TextPart(content=record.content)]))
+    context = await run_in_session(deps.db_session, load_chat_context, deps.user_id)
+    message_history: List[ModelMessage] = build_message_history(context.summary, context.messages)
+    if context.pending >= HISTORY_COMPACT_THRESHOLD:
+        compact_history_in_background(deps.user_id)
 
     message_history = [
         m for m in message_history
@@ -325,11 +345,15 @@ async def run_agent(query: str, deps: AgentDeps) -> Dict[str, Any]:
             usage_obj = result.usage()
             logger.info(f"Usage object: {usage_obj}, type: {type(usage_obj)}")
             if usage_obj:
+                cache_read_tokens = getattr(usage_obj, 'cache_read_tokens', 0) or 0
                 usage = {
                     "input_tokens": usage_obj.input_tokens,
                     "output_tokens": usage_obj.output_tokens,
                     "total_tokens": usage_obj.total_tokens if hasattr(usage_obj, 'total_tokens') else (usage_obj.input_tokens + usage_obj.output_tokens),
-                    "requests": usage_obj.requests
+                    "requests": usage_obj.requests,
+                    "cache_read_tokens": cache_read_tokens,
+                    "cache_write_tokens": getattr(usage_obj, 'cache_write_tokens', 0) or 0,
+                    "cache_hit_ratio": round(cache_read_tokens / usage_obj.input_tokens, 4) if usage_obj.input_tokens else 0.0
                 }
                 logger.info(f"Parsed usage: {usage}")
 
@@ -424,8 +448,7 @@ async def run_agent(query: str, deps: AgentDeps) -> Dict[str, Any]:
         output_metadata={"model": model_name_str}
     )
 
-    deps.db_session.add(step)
-    deps.db_session.commit()
+    await run_in_session(deps.db_session, save_record, step)
 
     return {
         "response": {
@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Sequence
+
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlmodel import Session, select
+
+from backend.models import ChatHistory, ChatSummary
+
+logger = logging.getLogger(__name__)
+
+# Latest messages replayed to the agent, as far as they fit in the token budget
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "10"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+# Long (model) messages are cut to this many tokens when replayed
+HISTORY_MESSAGE_MAX_TOKENS = int(os.environ.get("HISTORY_MESSAGE_MAX_TOKENS", "800"))
+# Summarize once this many messages before the replayed ones are not in the summary yet
+HISTORY_COMPACT_THRESHOLD = int(os.environ.get("HISTORY_COMPACT_THRESHOLD", "10"))
+HISTORY_SUMMARY_MODEL = os.environ.get("HISTORY_SUMMARY_MODEL", "o3-mini")
+HISTORY_SUMMARY_MAX_TOKENS = 2000
+HISTORY_SUMMARY_BATCH_SIZE = 100
+
+_compacting: set = set()
+_compacting_lock = threading.Lock()
+
+
+class ChatContext(NamedTuple):
+    summary: Optional[str]
+    messages: List[ChatHistory]  # oldest first
+    pending: int  # messages before `messages` that are not summarized yet
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4] + " [...]"
+
+
+def get_summary(session: Session, user_id: int) -> Optional[ChatSummary]:
+    """The user's summary as currently stored, also when the session already loaded it."""
+    statement = select(ChatSummary).where(ChatSummary.user_id == user_id).execution_options(populate_existing=True)
+    return session.exec(statement).first()
+
+
+def load_chat_context(session: Session, user_id: int) -> ChatContext:
+    """The summary and latest messages of a user; use with run_in_session."""
+    summary = get_summary(session, user_id)
+    summarized_until_id = summary.summarized_until_id if summary else 0
+
+    # A few messages more than are replayed, to tell whether compaction is due
+    statement = (
+        select(ChatHistory)
+        .where(ChatHistory.user_id == user_id)
+        .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+        .limit(HISTORY_MAX_MESSAGES + HISTORY_COMPACT_THRESHOLD)
+    )
+    records = list(session.exec(statement).all())
+
+    pending = sum(1 for record in records[HISTORY_MAX_MESSAGES:] if record.id > summarized_until_id)
+    return ChatContext(summary.summary if summary else None, records[:HISTORY_MAX_MESSAGES][::-1], pending)
+
+
+def build_message_history(
+        summary: Optional[str],
+        records: Sequence[ChatHistory],
+        token_budget: int = HISTORY_TOKEN_BUDGET) -> List[ModelMessage]:
+    """
+    The summary followed by the latest messages that fit in `token_budget` together with it.
+    The latest message is always kept.
+    """
+    message_history: List[ModelMessage] = []
+    used = estimate_tokens(summary) if summary else 0
+
+    for record in reversed(records):
+        if record.role not in ("user", "model"):
+            continue
+
+        content = truncate_to_tokens(record.content, HISTORY_MESSAGE_MAX_TOKENS)
+        tokens = estimate_tokens(content)
+        if message_history and used + tokens > token_budget:
+            break
+        used += tokens
+
+        if record.role == "user":
+            message_history.append(ModelRequest(parts=[UserPromptPart(content=content)]))
+        else:
+            message_history.append(ModelResponse(parts=[TextPart(content=content)]))
+
+    message_history.reverse()
+    if summary:
+        message_history.insert(0, ModelRequest(parts=[UserPromptPart(content=f"Summary of our earlier conversation:\n{summary}")]))
+    return message_history
+
+
+def summarize_messages(previous_summary: Optional[str], records: Sequence[ChatHistory]) -> str:
+    """Fold `records` into the previous summary with the LLM."""
+    from openai import OpenAI
+
+    conversation = "\n".join(
+        f"{record.role}: {truncate_to_tokens(record.content, HISTORY_MESSAGE_MAX_TOKENS)}" for record in records
+    )
+    prompt = f"""Current summary of the conversation:
+{previous_summary or "(none)"}
+
+New messages:
+{conversation}
+
+Update the summary with the new messages. Keep the facts, places, datasets, decisions and open questions
+that matter for the rest of the conversation, drop small talk and details of the answers.
+Use at most 300 words, in the language of the conversation."""
+
+    response = OpenAI().chat.completions.create(
+        model=HISTORY_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You summarize conversations between a user and a data assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        max_completion_tokens=HISTORY_SUMMARY_MAX_TOKENS
+    )
+    return response.choices[0].message.content.strip()
+
+
+def get_pending_statement(user_id: int, summarized_until_id: int):
+    """The oldest batch of messages before the replayed ones that is not summarized yet."""
+    replayed_ids = (
+        select(ChatHistory.id)
+        .where(ChatHistory.user_id == user_id)
+        .order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc())
+        .limit(HISTORY_MAX_MESSAGES)
+    )
+    return (
+        select(ChatHistory)
+        .where(
+            ChatHistory.user_id == user_id,
+            ChatHistory.id > summarized_until_id,
+            ChatHistory.id.not_in(replayed_ids)
+        )
+        .order_by(ChatHistory.timestamp, ChatHistory.id)
+        .limit(HISTORY_SUMMARY_BATCH_SIZE)
+    )
+
+
+def compact_history(user_id: int) -> None:
+    """
+    Add the messages before the replayed ones to the user's summary, a batch at a time
+    until none are left, so a long backlog is caught up in one run.
+    """
+    from backend.database import engine
+
+    compacted = 0
+    # Loaded messages stay readable after the read transaction is ended for the LLM call
+    with Session(engine, expire_on_commit=False) as session:
+        while True:
+            summary = get_summary(session, user_id)
+            summarized_until_id = summary.summarized_until_id if summary else 0
+            records = session.exec(get_pending_statement(user_id, summarized_until_id)).all()
+            # Do not keep a transaction open while the LLM summarizes
+            session.commit()
+            if not records:
+                break
+
+            text = summarize_messages(summary.summary if summary else None, records)
+            if not text:
+                logger.warning(f"Empty history summary for user {user_id}, keeping the previous one")
+                break
+
+            # delete_history may have removed the messages meanwhile. Locking the last one makes a
+            # delete wait until the summary is written, so it removes the summary as well.
+            last_id = max(record.id for record in records)
+            if session.exec(
+                select(ChatHistory.id).where(ChatHistory.id == last_id, ChatHistory.user_id == user_id).with_for_update()
+            ).first() is None:
+                logger.info(f"History of user {user_id} was deleted while compacting, dropping the summary")
+                session.rollback()
+                return
+
+            summary = get_summary(session, user_id)
+            if (summary.summarized_until_id if summary else 0) != summarized_until_id:
+                logger.info(f"History summary of user {user_id} was updated by another process, stopping")
+                session.rollback()
+                break
+
+            if summary is None:
+                summary = ChatSummary(user_id=user_id, summary=text, summarized_until_id=0)
+            summary.summary = text
+            summary.summarized_until_id = last_id
+            summary.updated_at = datetime.now(timezone.utc)
+            session.add(summary)
+            session.commit()
+            compacted += len(records)
+
+    if compacted:
+        logger.info(f"Compacted {compacted} messages into the history summary of user {user_id}")
+
+
+def _compact_history_once(user_id: int) -> None:
+    try:
+        compact_history(user_id)
+    except Exception as e:
+        logger.warning(f"Error compacting the history of user {user_id}: {e}")
+    finally:
+        with _compacting_lock:
+            _compacting.discard(user_id)
+
+
+def compact_history_in_background(user_id: int) -> None:
+    """Compact the user's history in a thread, unless that is already running."""
+    with _compacting_lock:
+        if user_id in _compacting:
+            return
+        _compacting.add(user_id)
+
+    threading.Thread(target=_compact_history_once, args=(user_id,), name="history-compaction", daemon=True).start()
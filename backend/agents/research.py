@@ -2,7 +2,8 @@ from typing import Dict, Any
 from pydantic import BaseModel
 from openai import AsyncOpenAI
 
-from backend.agents.base import AgentDeps
+from backend.agents.base import AgentDeps, save_record
+from backend.database import run_in_session
 from backend.models import ResearchStep
 
 SYSTEM_PROMPT = """
@@ -49,8 +50,7 @@ async def run_research_agent(query: str, format: str, deps: AgentDeps) -> Dict[s
         output_metadata={"model": model_name_str}
     )
 
-    deps.db_session.add(step)
-    deps.db_session.commit()
+    await run_in_session(deps.db_session, save_record, step)
 
     return {
         "response": f"Deep Research completed.\n\nSummary: {data.summary}\n\nReport saved at: {data.report_path}",
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, Depends, Form, File, Header, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, Form, File, Header, HTTPException, Query, UploadFile
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, Tuple, List
 import json
 import logging
+import os
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
+from sqlmodel import select
 
 from backend.agent import run_agent, AgentDeps
 from backend.research_agent import run_research_agent
 from backend.models import User, Soul, ChatHistory
-from backend.api.dependencies import get_session, get_current_user
+from backend.api.dependencies import get_session, get_async_session, get_current_user, get_user
 
 logger = logging.getLogger(__name__)
 
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = 1000
+
 router = APIRouter(prefix="", tags=["chat"])
 
 
@@ -27,7 +35,7 @@ class ResearchResponse(BaseModel):
 async def deep_research_endpoint(
     request: ResearchRequest,
     user_data: Tuple[User, Soul] = Depends(get_current_user),
-    session=Depends(get_session)
+    session=Depends(get_async_session)
 ) -> ResearchResponse:
     try:
         user, soul = user_data
@@ -55,7 +63,7 @@ async def chat_endpoint(
     mcp_type: Optional[str] = Form(None),
     skill_files: Optional[List[UploadFile]] = File(None),
     user_data: Tuple[User, Soul] = Depends(get_current_user),
-    session=Depends(get_session)
+    session=Depends(get_async_session)
 ) -> Dict[str, Any]:
     try:
         user, soul = user_data
@@ -83,8 +91,8 @@ async def chat_endpoint(
 
         user_msg = ChatHistory(user_id=user.id, role="user", content=message)
         session.add(user_msg)
-        session.commit()
-        session.refresh(user_msg)
+        await session.commit()
+        await session.refresh(user_msg)
 
         agent_out = await run_agent(final_message, deps)
 
@@ -105,7 +113,7 @@ async def chat_endpoint(
 
         model_msg = ChatHistory(user_id=user.id, role="model", content=response_text)
         session.add(model_msg)
-        session.commit()
+        await session.commit()
 
         return {"response": response_text, "exec_result": exec_result, "related": related, "code": code, "disclaimer": disclaimer, "error": error, "reasoning": reasoning, "usage": usage}
     except HTTPException:
@@ -115,24 +123,41 @@ async def chat_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def get_history_statement(user_id: int, before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE):
+    """
+    The `limit` latest messages of a user, oldest first. With `before` (a message id), the messages
+    before that one: a keyset page that uses the (user_id, timestamp) index, however deep it is.
+    """
+    statement = select(ChatHistory).where(ChatHistory.user_id == user_id)
+    if before is not None:
+        cursor = select(ChatHistory.timestamp).where(
+            ChatHistory.id == before, ChatHistory.user_id == user_id
+        ).scalar_subquery()
+        statement = statement.where(or_(
+            ChatHistory.timestamp < cursor,
+            and_(ChatHistory.timestamp == cursor, ChatHistory.id < before)
+        ))
+
+    page = statement.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit).subquery()
+    page_history = aliased(ChatHistory, page)
+    return select(page_history).order_by(page.c.timestamp, page.c.id)
+
+
 @router.get("/history")
 def get_history(
+    before: Optional[int] = Query(None, description="Id of the oldest message already loaded"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
     x_forwarded_user: str = Header("unknown_user", alias="x-forwarded-user"),
     session=Depends(get_session)
 ):
+    """A page of the chat history, oldest message first. Pass the id of its first message as `before` for the previous page."""
     try:
-        from sqlmodel import select
-        from backend.models import User, ChatHistory
-
-        statement = select(User).where(User.username == x_forwarded_user)
-        user = session.exec(statement).first()
-
+        user = get_user(x_forwarded_user, session)
         if not user:
             return []
 
-        statement = select(ChatHistory).where(ChatHistory.user_id == user.id).order_by(ChatHistory.timestamp)
-        history = session.exec(statement).all()
-        return history
+        # Fetched before responding, so a database error is a 500 rather than a truncated body
+        return session.exec(get_history_statement(user.id, before, limit)).all()
     except HTTPException:
         raise
     except Exception as e:
@@ -148,10 +173,10 @@ def delete_history(
     try:
         user, _ = user_data
         from sqlalchemy import delete
-        from backend.models import ChatHistory
+        from backend.models import ChatHistory, ChatSummary
 
-        statement = delete(ChatHistory).where(ChatHistory.user_id == user.id)
-        session.exec(statement)
+        session.exec(delete(ChatHistory).where(ChatHistory.user_id == user.id))
+        session.exec(delete(ChatSummary).where(ChatSummary.user_id == user.id))
         session.commit()
         return {"status": "History deleted"}
     except Exception as e:
@@ -168,7 +193,7 @@ class ExplainRequest(BaseModel):
 async def explain_code(
     request: ExplainRequest,
     user_data: Tuple[User, Soul] = Depends(get_current_user),
-    session=Depends(get_session)
+    session=Depends(get_async_session)
 ) -> Dict[str, Any]:
     """Explain code using LLM."""
     try:
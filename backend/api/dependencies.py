@@ -1,37 +1,74 @@
 from fastapi import Depends, Header
 from sqlmodel import Session, select
-from typing import Tuple
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional, Tuple
 import logging
+import os
 
-from backend.database import engine
+from backend.cache import get_cache
+from backend.database import engine, get_async_session
 from backend.models import User, Soul
 
 logger = logging.getLogger(__name__)
 
+# Users and souls per x-forwarded-user header, per worker. update_soul invalidates the entry
+# in its own worker; the TTL bounds how long other workers can serve an outdated soul.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "300"))
+
+_user_cache = get_cache("current_user", ttl=USER_CACHE_TTL, local=True)
+
 
 def get_session():
     with Session(engine) as session:
         yield session
 
 
-def get_current_user(
-    x_forwarded_user: str = Header("unknown_user", alias="x-forwarded-user"),
-    session: Session = Depends(get_session)
-) -> Tuple[User, Soul]:
-    statement = select(User).where(User.username == x_forwarded_user)
-    results = session.exec(statement)
-    user = results.first()
-
-    if not user:
-        user = User(username=x_forwarded_user, soul_data={"style": "concise", "preferences": {}})
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-
+def _cache_user(user: User) -> Tuple[User, Soul]:
     soul = Soul(
         user_id=str(user.id),
         username=user.username,
         preferences=user.soul_data.get("preferences", {}),
         style=user.soul_data.get("style", "concise")
     )
+    _user_cache.set(user.username, (user, soul))
     return user, soul
+
+
+def forget_user(username: str) -> None:
+    """Drop the cached user and soul, e.g. after its soul_data has been updated."""
+    _user_cache.delete(username)
+
+
+def get_user(username: str, session: Session) -> Optional[User]:
+    """Get an existing user from the cache or the database, without creating it."""
+    cached = _user_cache.get(username)
+    if cached is not None:
+        return cached[0]
+
+    user = session.exec(select(User).where(User.username == username)).first()
+    if user:
+        _cache_user(user)
+    return user
+
+
+async def get_current_user(
+    x_forwarded_user: str = Header("unknown_user", alias="x-forwarded-user"),
+    session: AsyncSession = Depends(get_async_session)
+) -> Tuple[User, Soul]:
+    cached = _user_cache.get(x_forwarded_user)
+    if cached is None:
+        statement = select(User).where(User.username == x_forwarded_user)
+        results = await session.exec(statement)
+        user = results.first()
+
+        if not user:
+            user = User(username=x_forwarded_user, soul_data={"style": "concise", "preferences": {}})
+            session.add(user)
+            await session.commit()
+            await session.refresh(user)
+
+        cached = _cache_user(user)
+
+    # The agent updates the soul of its request in place
+    user, soul = cached
+    return user, soul.model_copy(deep=True)
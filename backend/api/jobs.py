@@ -4,7 +4,7 @@ from typing import Optional, Dict, Any
 import logging
 
 from backend.scheduler import add_job
-from backend.api.dependencies import get_session, get_current_user
+from backend.api.dependencies import get_session, get_current_user, get_user
 from backend.models import User, Soul
 
 logger = logging.getLogger(__name__)
@@ -24,11 +24,7 @@ def schedule_job(
     session=Depends(get_session)
 ) -> Dict[str, str]:
     try:
-        from sqlmodel import select
-
-        statement = select(User).where(User.username == x_forwarded_user)
-        user = session.exec(statement).first()
-
+        user = get_user(x_forwarded_user, session)
         if not user:
             raise HTTPException(status_code=404, detail="User not found (interact with chat first)")
 
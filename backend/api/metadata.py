@@ -9,12 +9,15 @@ from backend.jobs.scheduler import (
     delete_job as metadata_delete_job,
     run_job as metadata_run_job
 )
-from backend.tools.metadata_lookup import search_metadata
+from backend.tools.metadata_lookup import search_metadata_async, search_metadata_batch_async
+from backend.vector_index import SEARCH_MODES
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/metadata", tags=["metadata"])
 
+METADATA_BATCH_SEARCH_MAX_QUERIES = 50
+
 
 @router.get("/skills")
 def list_skills() -> Dict[str, Any]:
@@ -63,12 +66,29 @@ class MetadataJobRequest(BaseModel):
     interval_seconds: Optional[int] = 86400
     cron_expression: Optional[str] = None
     enabled: bool = True
+    full_sync: bool = False
+    purge_stale: bool = False
+
+
+class MetadataSearchQuery(BaseModel):
+    q: str
+    source: Optional[str] = None
+    filter_geojson: bool = False
+
+
+class MetadataBatchSearchRequest(BaseModel):
+    queries: List[MetadataSearchQuery]
+    limit: int = 5
 
 
 @router.post("/jobs")
 def create_metadata_job(job_req: MetadataJobRequest) -> Dict[str, Any]:
     try:
         config = {"source": job_req.source}
+        if job_req.full_sync:
+            config["full_sync"] = True
+        if job_req.purge_stale:
+            config["purge_stale"] = True
 
         job = metadata_create_job(
             name=job_req.name,
@@ -142,19 +162,73 @@ def run_metadata_job(job_id: int) -> Dict[str, str]:
 
 
 @router.get("/search")
-def search_metadata_endpoint(
+async def search_metadata_endpoint(
     q: str,
     source: Optional[str] = None,
-    limit: int = 10
+    limit: int = 10,
+    mode: Optional[str] = None
 ) -> Dict[str, Any]:
+    if mode and mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid search mode, expected one of {', '.join(SEARCH_MODES)}")
     try:
-        results = search_metadata(q, source, limit)
+        results = await search_metadata_async(q, source, limit, mode)
         return {"results": results}
     except Exception as e:
         logger.error(f"Error searching metadata: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/search/batch")
+async def search_metadata_batch_endpoint(request: MetadataBatchSearchRequest) -> Dict[str, Any]:
+    """Vector search for several queries at once, with one embedding request and one database query."""
+    if len(request.queries) > METADATA_BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {METADATA_BATCH_SEARCH_MAX_QUERIES} queries per batch")
+    if not request.queries:
+        return {"results": []}
+    try:
+        results = await search_metadata_batch_async(
+            [{"query": q.q, "source_type": q.source, "filter_geojson": q.filter_geojson} for q in request.queries],
+            request.limit
+        )
+        return {"results": [{"q": q.q, "results": r} for q, r in zip(request.queries, results)]}
+    except Exception as e:
+        logger.error(f"Error searching metadata: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/embedding-cache")
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters of the persistent embedding cache for this worker."""
+    from backend.jobs.embedding_cache import get_embedding_cache_stats as cache_stats
+
+    return cache_stats()
+
+
+@router.get("/cache")
+def get_cache_stats() -> Dict[str, Any]:
+    """Get size and hit/miss/eviction counters of the lookup caches for this worker."""
+    from backend.cache import get_cache_stats as cache_stats
+
+    return cache_stats()
+
+
+@router.get("/pool")
+def get_pool_stats() -> Dict[str, Any]:
+    """Get connection pool usage of the metadata database engines for this worker."""
+    from backend.database_metadata import get_metadata_pool_stats
+
+    return get_metadata_pool_stats()
+
+
+@router.get("/memory-index")
+def get_memory_index_stats() -> Dict[str, Any]:
+    """Get the size of the in-memory vector index of this worker, if enabled."""
+    from backend.memory_index import METADATA_MEMORY_INDEX, get_memory_index
+
+    index = get_memory_index()
+    return {"enabled": METADATA_MEMORY_INDEX, "loaded": index is not None, **(index.stats() if index else {})}
+
+
 @router.get("/sources")
 def list_metadata_sources() -> List[Dict[str, Any]]:
     from backend.database_metadata import get_metadata_session
@@ -199,7 +273,10 @@ def get_metadata_counts() -> Dict[str, Any]:
                 MetadataSource.source_type,
                 func.count(MetadataEndpoint.id).label("endpoint_count")
             )
-            .outerjoin(MetadataEndpoint, MetadataSource.id == MetadataEndpoint.source_id)
+            .outerjoin(
+                MetadataEndpoint,
+                (MetadataSource.id == MetadataEndpoint.source_id) & MetadataEndpoint.deleted_at.is_(None)
+            )
             .group_by(MetadataSource.id)
         )
 
@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_SIZE = int(os.environ.get("CACHE_MAX_SIZE", "1024"))
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "300"))
+# Share the caches between uvicorn workers, e.g. "redis://localhost:6379/0"; needs the redis package
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "")
+
+# Fired when a metadata sync has written endpoints
+METADATA_SYNC = "metadata_sync"
+
+_caches: Dict[str, "CacheBase"] = {}
+_invalidate_on: Dict[str, List[str]] = {}
+_invalidation_hooks: Dict[str, List[Callable[[], None]]] = {}
+_redis_client = None
+
+
+class CacheBase(ABC):
+    """Counters and statistics shared by all caches, and clear() for invalidation."""
+
+    backend = ""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class Cache(CacheBase):
+    """Key-value interface of the cache backends."""
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class LRUCache(Cache):
+    """
+    In-process cache of at most `maxsize` entries that each expire `ttl` seconds after being set.
+    The least recently used entry is evicted when the cache is full.
+    """
+
+    backend = "memory"
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(name, maxsize, ttl)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(Cache):
+    """
+    Cache shared by all workers, stored in Redis as JSON under "cache:<name>:<key>" with the TTL as expiry.
+    Redis itself bounds the memory used (configure maxmemory with an LRU maxmemory-policy);
+    the counters are per worker. Redis errors are logged and treated as misses.
+    """
+
+    backend = "redis"
+
+    def __init__(self, name: str, maxsize: int, ttl: float, client):
+        super().__init__(name, maxsize, ttl)
+        self.client = client
+        self.prefix = f"cache:{name}:"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error reading cache {self.name}: {e}")
+            raw = None
+
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error writing cache {self.name}: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error writing cache {self.name}: {e}")
+
+    def clear(self) -> None:
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.prefix}*", count=1000))
+            for start in range(0, len(keys), 1000):
+                self.client.delete(*keys[start:start + 1000])
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error clearing cache {self.name}: {e}")
+
+    def __len__(self) -> int:
+        try:
+            return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*", count=1000))
+        except Exception:
+            return 0
+
+
+class SemanticCache(CacheBase):
+    """
+    In-process cache keyed by embedding: lookup() returns the value stored for the most similar
+    embedding in the same namespace, if its cosine similarity is at least `threshold`.
+    It has no key-value interface; get_cache() refuses to return it.
+    Entries are evicted least recently used and expire `ttl` seconds after being stored.
+    """
+
+    backend = "memory"
+
+    def __init__(self, name: str, maxsize: int, ttl: float, threshold: float):
+        super().__init__(name, maxsize, ttl)
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, float, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, embedding: Sequence[float], default: Any = None) -> Any:
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            for entry_id in [i for i, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[entry_id]
+                self.expirations += 1
+
+            candidates = [(i, entry) for i, entry in self._entries.items() if entry[0] == namespace]
+            if candidates:
+                similarities = np.stack([entry[1] for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[3]
+
+            self.misses += 1
+            return default
+
+    def store(self, namespace: str, embedding: Sequence[float], value: Any) -> None:
+        with self._lock:
+            self._entries[self._next_id] = (namespace, self._normalize(embedding), time.monotonic() + self.ttl, value)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "threshold": self.threshold}
+
+
+def get_redis_client():
+    """Redis client for CACHE_REDIS_URL, or None to use in-process caches."""
+    global _redis_client
+
+    if not CACHE_REDIS_URL:
+        return None
+    if redis is None:
+        logger.warning("CACHE_REDIS_URL is set but the redis package is not installed, using in-process caches")
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _redis_client
+
+
+def get_cache(
+        name: str,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        invalidate_on: Tuple[str, ...] = (),
+        local: bool = False) -> Cache:
+    """
+    Get or create the named cache, in Redis when CACHE_REDIS_URL is set and in-process otherwise.
+    A `local` cache is always in-process, for values that cannot be stored as JSON.
+    The cache is cleared whenever one of the `invalidate_on` events is fired with invalidate().
+    """
+    if name not in _caches:
+        maxsize = maxsize or CACHE_MAX_SIZE
+        ttl = ttl or CACHE_TTL
+        client = None if local else get_redis_client()
+        cache = RedisCache(name, maxsize, ttl, client) if client is not None else LRUCache(name, maxsize, ttl)
+        _register_cache(cache, invalidate_on)
+
+    return _check_cache_type(_caches[name], Cache, "get_semantic_cache")
+
+
+def get_semantic_cache(
+        name: str,
+        threshold: float,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        invalidate_on: Tuple[str, ...] = ()) -> SemanticCache:
+    """
+    Get or create the named semantic cache. Similarity lookups need the embeddings in process,
+    so semantic caches are never shared through Redis.
+    """
+    if name not in _caches:
+        _register_cache(SemanticCache(name, maxsize or CACHE_MAX_SIZE, ttl or CACHE_TTL, threshold), invalidate_on)
+    return _check_cache_type(_caches[name], SemanticCache, "get_cache")
+
+
+def _check_cache_type(cache: CacheBase, cache_type: type, other_getter: str):
+    if not isinstance(cache, cache_type):
+        raise TypeError(f"Cache {cache.name} is a {type(cache).__name__}, get it with {other_getter}()")
+    return cache
+
+
+def _register_cache(cache: CacheBase, invalidate_on: Tuple[str, ...]) -> None:
+    _caches[cache.name] = cache
+    for event in invalidate_on:
+        _invalidate_on.setdefault(event, []).append(cache.name)
+
+
+def register_invalidation_hook(event: str, callback: Callable[[], None]) -> None:
+    """Call `callback` whenever `event` is fired with invalidate()."""
+    _invalidation_hooks.setdefault(event, []).append(callback)
+
+
+def invalidate(event: str) -> None:
+    """Clear the caches that are invalidated on `event` and run its hooks."""
+    for name in _invalidate_on.get(event, []):
+        logger.info(f"Clearing cache {name} after {event}")
+        _caches[name].clear()
+
+    for callback in _invalidation_hooks.get(event, []):
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Error running {event} invalidation hook: {e}")
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Size and hit/miss/eviction counters of each cache, for this worker."""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -1,8 +1,10 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Union
 import os
 import time
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
 
 # Handle postgres via standard env variables or fallback to sqlite
 PG_USER = os.environ.get("POSTGRES_USER")
@@ -21,9 +23,40 @@ else:
 if "postgresql+asyncpg" in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("+asyncpg", "")
 
+# Same database through an async driver, for the request path
+if DATABASE_URL.startswith("postgresql://"):
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+elif DATABASE_URL.startswith("sqlite:///"):
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+else:
+    ASYNC_DATABASE_URL = DATABASE_URL
+
 SQL_ECHO = os.environ.get("SQL_ECHO", "False").lower() in ("true", "1", "t")
 
-engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
+# Connection pool per engine and worker (Postgres only)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "t")
+
+
+def get_pool_options(url: str) -> Dict[str, Any]:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING
+    }
+
+
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO, **get_pool_options(DATABASE_URL))
+
+# Used by the async endpoints, so database calls do not block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=SQL_ECHO, **get_pool_options(ASYNC_DATABASE_URL))
 
 
 def init_db() -> None:
@@ -31,6 +64,7 @@ def init_db() -> None:
     while retries > 0:
         try:
             SQLModel.metadata.create_all(engine)
+            create_missing_indexes()
             print("Database initialized.")
             return
         except OperationalError:
@@ -40,6 +74,31 @@ def init_db() -> None:
     print("Failed to initialize database.")
 
 
+def create_missing_indexes() -> None:
+    """create_all() only creates the indexes of new tables; add indexes defined later to existing ones."""
+    try:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+    except Exception as e:
+        print(f"Failed to create indexes: {e}")
+
+
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def run_in_session(session: Union[Session, AsyncSession], fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Call fn(session, *args, **kwargs) with a sync session. An AsyncSession runs it through run_sync,
+    so the same code serves the async endpoints and the sync callers (scheduler, tests).
+    """
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(fn, *args, **kwargs)
+    return fn(session, *args, **kwargs)
@@ -1,8 +1,11 @@
 import os
 import logging
+from typing import Any, Dict
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.pool import NullPool
-from sqlalchemy import text
+from sqlalchemy import event, text
 
 logger = logging.getLogger(__name__)
 
@@ -15,29 +18,140 @@ LOKI_METADATA_PASSWORD = os.environ.get("LOKI_METADATA_PASSWORD", "postgres")
 METADATA_DATABASE_URL = f"postgresql+asyncpg://{LOKI_METADATA_USER}:{LOKI_METADATA_PASSWORD}@{LOKI_METADATA_HOST}:{LOKI_METADATA_PORT}/{LOKI_METADATA_DB}"
 METADATA_DATABASE_URL_SYNC = f"postgresql://{LOKI_METADATA_USER}:{LOKI_METADATA_PASSWORD}@{LOKI_METADATA_HOST}:{LOKI_METADATA_PORT}/{LOKI_METADATA_DB}"
 
+# Connection pool per engine and worker; a pool size of 0 opens a new connection per session
+# (e.g. behind PgBouncer)
+METADATA_DB_POOL_SIZE = int(os.environ.get("METADATA_DB_POOL_SIZE", "5"))
+METADATA_DB_MAX_OVERFLOW = int(os.environ.get("METADATA_DB_MAX_OVERFLOW", "10"))
+METADATA_DB_POOL_TIMEOUT = float(os.environ.get("METADATA_DB_POOL_TIMEOUT", "30"))
+METADATA_DB_POOL_RECYCLE = int(os.environ.get("METADATA_DB_POOL_RECYCLE", "1800"))
+METADATA_DB_POOL_PRE_PING = os.environ.get("METADATA_DB_POOL_PRE_PING", "True").lower() in ("true", "1", "t")
+
+_connections_opened = {"sync": 0, "async": 0}
+
+
+def get_pool_options() -> Dict[str, Any]:
+    if METADATA_DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": METADATA_DB_POOL_SIZE,
+        "max_overflow": METADATA_DB_MAX_OVERFLOW,
+        "pool_timeout": METADATA_DB_POOL_TIMEOUT,
+        "pool_recycle": METADATA_DB_POOL_RECYCLE,
+        "pool_pre_ping": METADATA_DB_POOL_PRE_PING
+    }
+
 
 metadata_engine = create_engine(
     METADATA_DATABASE_URL_SYNC,
-    poolclass=NullPool,
-    echo=False
+    echo=False,
+    **get_pool_options()
 )
 
+# Used by lookups on the request path, so they do not block the event loop
+async_metadata_engine = create_async_engine(
+    METADATA_DATABASE_URL,
+    echo=False,
+    **get_pool_options()
+)
+
+
+@event.listens_for(metadata_engine, "connect")
+def _count_sync_connection(dbapi_connection, connection_record):
+    _connections_opened["sync"] += 1
+
+
+@event.listens_for(async_metadata_engine.sync_engine, "connect")
+def _count_async_connection(dbapi_connection, connection_record):
+    _connections_opened["async"] += 1
+
+
+# Columns added after the initial schema; create_all() does not alter existing tables.
+METADATA_MIGRATIONS = [
+    "ALTER TABLE metadata_endpoint ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE job_run ADD COLUMN IF NOT EXISTS checkpoint VARCHAR",
+    "ALTER TABLE metadata_endpoint ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP",
+    "ALTER TABLE metadata_endpoint ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP",
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'metadata_endpoint' AND column_name = 'is_ogc'
+        ) THEN
+            ALTER TABLE metadata_endpoint ADD COLUMN is_ogc BOOLEAN NOT NULL DEFAULT FALSE;
+            UPDATE metadata_endpoint SET is_ogc = TRUE WHERE endpoint_url LIKE '%/ogc/%';
+        END IF;
+    END $$
+    """,
+    # Weighted Dutch full-text vector for lexical and hybrid searches: title and identifier,
+    # then keywords, then description. Keep the configuration in sync with TEXT_SEARCH_CONFIG.
+    """
+    ALTER TABLE metadata_endpoint ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('dutch'::regconfig,
+            coalesce(title, '') || ' ' || coalesce(extra_metadata::json->>'identifier', '')), 'A') ||
+        setweight(to_tsvector('dutch'::regconfig, coalesce(extra_metadata::json->>'keywords', '')), 'B') ||
+        setweight(to_tsvector('dutch'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_metadata_endpoint_search_tsv ON metadata_endpoint USING gin (search_tsv)",
+    # Bulk upserts need (source_id, endpoint_url) to be unique; drop older duplicates first
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('uq_metadata_endpoint_source_url') IS NULL THEN
+            DELETE FROM metadata_endpoint a
+            USING metadata_endpoint b
+            WHERE a.source_id = b.source_id
+              AND a.endpoint_url = b.endpoint_url
+              AND a.id < b.id;
+            CREATE UNIQUE INDEX uq_metadata_endpoint_source_url
+                ON metadata_endpoint (source_id, endpoint_url);
+        END IF;
+    END $$
+    """,
+]
+
 
 def get_metadata_session() -> Session:
     return Session(metadata_engine)
 
 
+def get_async_metadata_session() -> AsyncSession:
+    return AsyncSession(async_metadata_engine)
+
+
+def get_metadata_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Connection pool usage of the sync and async metadata engines, for this worker."""
+    stats = {}
+    for name, pool in (("sync", metadata_engine.pool), ("async", async_metadata_engine.pool)):
+        stats[name] = {
+            "pool": type(pool).__name__,
+            "connections_opened": _connections_opened[name]
+        }
+        if hasattr(pool, "checkedout"):
+            stats[name].update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": METADATA_DB_MAX_OVERFLOW
+            })
+    return stats
+
+
 async def init_metadata_db():
     create_metadata_tables()
 
 
 def create_metadata_tables():
-    from backend.models_metadata import MetadataSource, MetadataEndpoint, Job, JobRun
+    from backend.models_metadata import MetadataSource, MetadataEndpoint, EmbeddingCache, Job, JobRun
 
     try:
         with metadata_engine.begin() as conn:
             conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
             SQLModel.metadata.create_all(bind=conn)
+            for migration in METADATA_MIGRATIONS:
+                conn.execute(text(migration))
 
         logger.info("Metadata tables created successfully.")
     except Exception as e:
@@ -0,0 +1,81 @@
+import hashlib
+import logging
+from typing import List, Dict
+from sqlmodel import select
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database_metadata import get_metadata_session
+from backend.models_metadata import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CHUNK_SIZE = 1000
+
+_stats = {"hits": 0, "misses": 0, "stored": 0, "errors": 0}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_cached_embeddings(texts: List[str], model: str) -> Dict[str, List[float]]:
+    """
+    Look up stored embeddings for the texts.
+    Returns a dict of text to embedding for the texts that were found.
+    """
+    hashes = {text_hash(t): t for t in texts}
+    found: Dict[str, List[float]] = {}
+
+    session = get_metadata_session()
+    try:
+        hash_list = list(hashes)
+        for start in range(0, len(hash_list), LOOKUP_CHUNK_SIZE):
+            rows = session.exec(
+                select(EmbeddingCache.text_hash, EmbeddingCache.embedding).where(
+                    EmbeddingCache.model == model,
+                    EmbeddingCache.text_hash.in_(hash_list[start:start + LOOKUP_CHUNK_SIZE])
+                )
+            ).all()
+            for row_hash, embedding in rows:
+                found[hashes[row_hash]] = [float(x) for x in embedding]
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Error reading embedding cache: {e}")
+    finally:
+        session.close()
+
+    _stats["hits"] += len(found)
+    _stats["misses"] += len(hashes) - len(found)
+    return found
+
+
+def store_embeddings(embeddings: Dict[str, List[float]], model: str) -> None:
+    """Store embeddings per text; texts that are already cached are left untouched."""
+    if not embeddings:
+        return
+
+    session = get_metadata_session()
+    try:
+        items = list(embeddings.items())
+        for start in range(0, len(items), LOOKUP_CHUNK_SIZE):
+            stmt = insert(EmbeddingCache.__table__).values([
+                {"text_hash": text_hash(t), "model": model, "embedding": e}
+                for t, e in items[start:start + LOOKUP_CHUNK_SIZE]
+            ]).on_conflict_do_nothing(index_elements=["text_hash", "model"])
+            session.execute(stmt)
+        session.commit()
+        _stats["stored"] += len(items)
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Error writing embedding cache: {e}")
+    finally:
+        session.close()
+
+
+def get_embedding_cache_stats() -> Dict[str, float]:
+    """Return hit/miss counters of the embedding cache for this worker."""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0
+    }
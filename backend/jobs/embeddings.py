@@ -1,10 +1,21 @@
+import asyncio
 import os
+import hashlib
 import logging
 from typing import List
 from openai import AsyncOpenAI
 
+from backend.jobs.embedding_cache import get_cached_embeddings, store_embeddings
+
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+# OpenAI accepts at most 2048 inputs and 300k tokens per embeddings request, and 8191 tokens per input
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "2048"))
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "250000"))
+EMBEDDING_MAX_INPUT_TOKENS = 8000
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+
 _openai_client: AsyncOpenAI = None
 
 
@@ -19,42 +30,90 @@ def get_openai_client() -> AsyncOpenAI:
     return _openai_client
 
 
-async def generate_embedding(text: str) -> List[float]:
+async def generate_embedding(text: str, use_cache: bool = True) -> List[float]:
     """
-    Generate an embedding for the given text using OpenAI's text-embedding-3-small model.
+    Generate an embedding for the given text using OpenAI's embedding model (text-embedding-3-small by default).
+    Embeddings are looked up in and stored to the persistent embedding cache.
     Returns a list of floats (1536 dimensions).
     """
     try:
-        client = get_openai_client()
-
-        response = await client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-
-        embedding = response.data[0].embedding
-        return embedding
+        embeddings = await generate_embeddings_batch([text], use_cache=use_cache)
+        return embeddings[0]
 
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         raise
 
 
-async def generate_embeddings_batch(texts: List[str]) -> List[List[float]]:
+async def generate_embeddings_batch(texts: List[str], use_cache: bool = True) -> List[List[float]]:
     """
     Generate embeddings for a batch of texts.
+    Only texts missing from the persistent embedding cache are sent to the API.
+    The cache is read and written in a worker thread, so the event loop is not blocked.
     """
     try:
-        client = get_openai_client()
+        use_cache = use_cache and EMBEDDING_CACHE_ENABLED
+        embeddings = await asyncio.to_thread(get_cached_embeddings, texts, EMBEDDING_MODEL) if use_cache else {}
+
+        missing = [t for t in dict.fromkeys(texts) if t not in embeddings]
+        if missing:
+            client = get_openai_client()
 
-        response = await client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
-        )
+            response = await client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=missing
+            )
 
-        embeddings = [item.embedding for item in sorted(response.data, key=lambda x: x.index)]
-        return embeddings
+            generated = {
+                t: item.embedding
+                for t, item in zip(missing, sorted(response.data, key=lambda x: x.index))
+            }
+            if use_cache:
+                await asyncio.to_thread(store_embeddings, generated, EMBEDDING_MODEL)
+            embeddings.update(generated)
+
+        return [embeddings[t] for t in texts]
 
     except Exception as e:
         logger.error(f"Error generating embeddings batch: {e}")
         raise
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, conservative token estimate (~3 characters per token for Dutch text)."""
+    return len(text) // 3 + 1
+
+
+def truncate_for_embedding(text: str) -> str:
+    """Trim a text so that it stays below the per-input token limit of the embeddings API."""
+    max_chars = EMBEDDING_MAX_INPUT_TOKENS * 3
+    return text[:max_chars] if len(text) > max_chars else text
+
+
+def make_embedding_batches(
+        texts: List[str],
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_batch_tokens: int = EMBEDDING_BATCH_TOKENS) -> List[List[str]]:
+    """Group texts into batches that respect both the input count and the token budget per request."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_batch_size or current_tokens + tokens > max_batch_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def embedding_content_hash(text: str, model: str = EMBEDDING_MODEL) -> str:
+    """Hash of the exact text sent to the embeddings API and the model used, to detect unchanged endpoints."""
+    return hashlib.sha256(f"{model}\n{truncate_for_embedding(text)}".encode("utf-8")).hexdigest()
@@ -1,22 +1,38 @@
+import asyncio
 import logging
-import requests
-from typing import List, Dict, Any, Optional
+import os
+import httpx
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Callable
 from backend.database_metadata import get_metadata_session
-from backend.models_metadata import MetadataSource, MetadataEndpoint
-from backend.jobs.embeddings import generate_embedding
+from backend.models_metadata import MetadataSource
+from backend.jobs.http_client import SyncHttpClient
+from backend.jobs.pipeline import (
+    EndpointRecord,
+    build_embedding_text,
+    embed_records,
+    write_records,
+    load_content_hashes,
+    touch_endpoints,
+    sweep_endpoints
+)
+from backend.vector_index import rebuild_vector_index_after_sync
 
 logger = logging.getLogger(__name__)
 
 CBS_DATASETS_URL = "https://datasets.cbs.nl/odata/v1/Datasets"
+CBS_CATALOG_PAGE_SIZE = int(os.environ.get("CBS_CATALOG_PAGE_SIZE", "500"))
 
 
-def fetch_endpoint_metadata(identifier: str) -> Optional[Dict[str, Any]]:
+def get_dataset_url(identifier: str) -> str:
+    return f"https://opendata.cbs.nl/ODataApi/odata/{identifier}"
+
+
+async def fetch_endpoint_metadata(client: SyncHttpClient, identifier: str) -> Optional[Dict[str, Any]]:
     """Fetch metadata for a specific CBS endpoint."""
     try:
-        url = f"https://opendata.cbs.nl/ODataApi/odata/{identifier}"
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        data = response.json()
+        url = get_dataset_url(identifier)
+        data = await client.get_json(url)
 
         metadata = {"url": url}
 
@@ -51,95 +67,235 @@ def get_or_create_cbs_source(session) -> MetadataSource:
     return source
 
 
-async def fetch_cbs_metadata() -> str:
+def get_dataset_version(dataset: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """Return the modification stamps of a CBS catalog entry, as stored in the endpoint's extra metadata."""
+    return {
+        field: str(dataset[key]) if dataset.get(key) is not None else None
+        for field, key in (
+            ("modified", "Modified"),
+            ("observations_modified", "ObservationsModified"),
+            ("version", "Version")
+        )
+    }
+
+
+def load_dataset_versions(session, source_id: int) -> Dict[str, Dict[str, Optional[str]]]:
+    """Return the stored modification stamps per endpoint URL for the CBS source."""
+    from sqlalchemy import text
+
+    rows = session.execute(text("""
+        SELECT endpoint_url,
+               extra_metadata::json->>'modified' AS modified,
+               extra_metadata::json->>'observations_modified' AS observations_modified,
+               extra_metadata::json->>'version' AS version
+        FROM metadata_endpoint
+        WHERE source_id = :source_id
+          AND extra_metadata IS NOT NULL
+    """), {"source_id": source_id}).fetchall()
+
+    return {
+        row.endpoint_url: {
+            "modified": row.modified,
+            "observations_modified": row.observations_modified,
+            "version": row.version
+        }
+        for row in rows
+    }
+
+
+def get_catalog_page_url(skip: int = 0, page_size: Optional[int] = None) -> str:
+    return f"{CBS_DATASETS_URL}?$top={page_size or CBS_CATALOG_PAGE_SIZE}&$skip={skip}"
+
+
+async def fetch_catalog(client: SyncHttpClient) -> httpx.Response:
     """
-    Fetch metadata from CBS OData API and store in database.
-    Returns a summary of the operation.
+    Fetch the first page of the CBS dataset catalog.
+    The catalog is always read in full: a 304 on the first page says nothing about the later pages,
+    so unchanged datasets are skipped by their modification stamps instead.
     """
-    session = get_metadata_session()
-    from sqlmodel import select
+    response = await client.get(get_catalog_page_url(), timeout=30)
+    response.raise_for_status()
+    return response
 
-    try:
-        logger.info(f"Fetching CBS metadata from {CBS_DATASETS_URL}")
 
-        response = requests.get(CBS_DATASETS_URL, timeout=30)
+async def iter_catalog_pages(
+        client: SyncHttpClient,
+        response: httpx.Response,
+        skip: int = 0) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Yield the catalog page by page, starting from an already fetched page.
+    Follows @odata.nextLink when the server returns one, and $top/$skip paging otherwise.
+    Each item is a tuple of (datasets, URL of the next page or None).
+    """
+    while True:
+        data = response.json()
+        datasets = data.get("value", [])
+        skip += len(datasets)
+
+        next_url = data.get("@odata.nextLink")
+        if not next_url and len(datasets) >= CBS_CATALOG_PAGE_SIZE:
+            next_url = get_catalog_page_url(skip)
+
+        yield datasets, next_url
+
+        if not next_url or not datasets:
+            return
+
+        response = await client.get(next_url, timeout=30)
         response.raise_for_status()
 
-        data = response.json()
 
-        source = get_or_create_cbs_source(session)
+async def build_cbs_record(client: SyncHttpClient, dataset: Dict[str, Any]) -> EndpointRecord:
+    """Turn a CBS catalog entry into an endpoint record, including its OData endpoint metadata."""
+    identifier = dataset.get("Identifier", "")
+    title = dataset.get("Title", "")
+    description = dataset.get("Description", "")
+    keywords = dataset.get("Keywords", "")
+    endpoint_metadata = await fetch_endpoint_metadata(client, identifier)
+    # Without its endpoint metadata the dataset is stored unstamped, so the next sync fetches it again
+    version = get_dataset_version(dataset) if endpoint_metadata is not None else {}
+
+    return EndpointRecord(
+        endpoint_url=get_dataset_url(identifier),
+        title=title,
+        description=description,
+        api_type="CBS OData",
+        embedding_text=build_embedding_text(title, description, keywords),
+        extra_metadata={
+            "frequency": dataset.get("Frequency", ""),
+            "identifier": identifier,
+            "keywords": keywords,
+            **version,
+            "endpoint_metadata": endpoint_metadata
+        }
+    )
+
+
+async def process_catalog_page(
+        session,
+        client: SyncHttpClient,
+        source_id: int,
+        datasets: List[Dict[str, Any]],
+        known_versions: Dict[str, Dict[str, Optional[str]]],
+        known_hashes: Dict[str, str],
+        seen_at: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Embed and write the new or modified datasets of one catalog page. Returns the page's counts;
+    "failed" counts the changed datasets that could not be built or embedded and were not written.
+    The endpoint metadata of the page's datasets is fetched concurrently, bounded by the client's limits.
+    Stored endpoints of the page's other datasets are marked as seen at `seen_at`.
+    """
+    counts = {"added": 0, "updated": 0, "embedded": 0, "unchanged": 0, "failed": 0}
+
+    changed = []
+    for dataset in datasets:
+        version = get_dataset_version(dataset)
+        if version["modified"] and known_versions.get(get_dataset_url(dataset.get("Identifier", ""))) == version:
+            counts["unchanged"] += 1
+        else:
+            changed.append(dataset)
+
+    results = await asyncio.gather(
+        *(build_cbs_record(client, dataset) for dataset in changed),
+        return_exceptions=True
+    )
+
+    records = []
+    for dataset, result in zip(changed, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Error processing dataset {dataset.get('Identifier', '')}: {result}")
+            continue
+        records.append(result)
+
+    records = await embed_records(records, known_hashes)
+    counts["failed"] = len(changed) - len(records)
+    counts["embedded"] = sum(1 for r in records if r.embedding is not None)
+    counts["added"], counts["updated"] = write_records(session, source_id, records, seen_at)
+
+    written = {r.endpoint_url for r in records}
+    touch_endpoints(
+        session,
+        source_id,
+        [url for url in (get_dataset_url(d.get("Identifier", "")) for d in datasets) if url not in written],
+        seen_at=seen_at
+    )
+
+    return counts
+
+
+async def fetch_cbs_metadata(
+        concurrency: Optional[int] = None,
+        full_sync: bool = False,
+        purge_stale: bool = False,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+    """
+    Fetch metadata from CBS OData API and store in database.
+    The catalog is read page by page; each page is embedded in batches and written in bulk
+    before the next page is requested, so memory use does not grow with the catalog size.
+
+    Unless `full_sync` is set, the sync is incremental: datasets whose modification stamps are
+    unchanged are skipped, and only datasets whose embedding text changed are re-embedded.
+    `concurrency` caps the number of in-flight requests to CBS (defaults to METADATA_SYNC_CONCURRENCY).
+
+    Endpoints of datasets that are no longer in the catalog are soft-deleted at the end of the sync,
+    or deleted outright with `purge_stale`.
+
+    After each page `on_checkpoint` is called with the URL of the next page and the running totals.
+    Passing that dict back as `checkpoint` resumes the sync at that page.
+    Returns a summary of the operation.
+    """
+    session = get_metadata_session()
+    client = SyncHttpClient(concurrency=concurrency)
+    checkpoint = checkpoint or {}
+    started_at = datetime.fromisoformat(checkpoint["started_at"]) if checkpoint.get("started_at") else datetime.utcnow()
 
-        endpoints_added = 0
-        endpoints_updated = 0
-        total_datasets = 0
-
-        value = data.get("value", [])
-        total_datasets = len(value)
-        logger.info(f"Found {total_datasets} CBS datasets to process")
-
-        for dataset in value:
-            try:
-                identifier = dataset.get("Identifier", "")
-                title = dataset.get("Title", "")
-                description = dataset.get("Description", "")
-                frequency = dataset.get("Frequency", "")
-                keywords = dataset.get("Keywords", "")
-
-                odata_url = f"https://opendata.cbs.nl/ODataApi/odata/{identifier}"
-
-                existing = session.exec(
-                    select(MetadataEndpoint).where(
-                        MetadataEndpoint.source_id == source.id,
-                        MetadataEndpoint.endpoint_url == odata_url
-                    )
-                ).first()
-
-                embedding_text = f"{title}: {description}"
-                if keywords:
-                    embedding_text += f" Keywords: {keywords}"
-
-                embedding = await generate_embedding(embedding_text)
-
-                endpoint_metadata = fetch_endpoint_metadata(identifier)
-
-                extra_data = {
-                    "frequency": frequency,
-                    "identifier": identifier,
-                    "keywords": keywords,
-                    "endpoint_metadata": endpoint_metadata
-                }
-
-                if existing:
-                    existing.title = title
-                    existing.description = description
-                    existing.embedding = embedding
-                    existing.api_type = "CBS OData"
-                    existing.set_extra_metadata(extra_data)
-                    endpoints_updated += 1
-                else:
-                    endpoint = MetadataEndpoint(
-                        source_id=source.id,
-                        endpoint_url=odata_url,
-                        title=title,
-                        description=description,
-                        api_type="CBS OData",
-                        embedding=embedding
-                    )
-                    endpoint.set_extra_metadata(extra_data)
-                    session.add(endpoint)
-                    endpoints_added += 1
-
-                processed = endpoints_added + endpoints_updated
-                if processed % 10 == 0:
-                    logger.info(f"Processed {processed}/{total_datasets} CBS datasets")
-
-            except Exception as e:
-                logger.warning(f"Error processing dataset {identifier}: {e}")
-                continue
+    try:
+        source = get_or_create_cbs_source(session)
 
+        if checkpoint.get("next_url"):
+            logger.info(f"Resuming CBS metadata sync at {checkpoint['next_url']}")
+            response = await client.get(checkpoint["next_url"], timeout=30)
+            response.raise_for_status()
+        else:
+            logger.info(f"Fetching CBS metadata from {CBS_DATASETS_URL}")
+            response = await fetch_catalog(client)
+
+        known_versions = {} if full_sync else load_dataset_versions(session, source.id)
+        known_hashes = {} if full_sync else load_content_hashes(session, source.id)
+
+        totals = {"added": 0, "updated": 0, "embedded": 0, "unchanged": 0, "failed": 0, **checkpoint.get("totals", {})}
+        total_datasets = checkpoint.get("skip", 0)
+
+        async for datasets, next_url in iter_catalog_pages(client, response, skip=total_datasets):
+            page_counts = await process_catalog_page(
+                session, client, source.id, datasets, known_versions, known_hashes, seen_at=started_at
+            )
+            for key, count in page_counts.items():
+                totals[key] += count
+
+            total_datasets += len(datasets)
+            logger.info(f"Processed {total_datasets} CBS datasets ({totals['unchanged']} unchanged)")
+
+            if on_checkpoint and next_url:
+                on_checkpoint({
+                    "started_at": started_at.isoformat(),
+                    "next_url": next_url,
+                    "skip": total_datasets,
+                    "totals": dict(totals)
+                })
+
+        removed = sweep_endpoints(session, source.id, started_at, purge=purge_stale)
+        # The sync's session must not hold locks while indexes are built concurrently
         session.commit()
+        # Building an index can take minutes; keep the event loop free meanwhile
+        await asyncio.to_thread(rebuild_vector_index_after_sync, source.id, totals["embedded"] + removed)
 
-        result = f"CBS metadata sync completed: {endpoints_added} added, {endpoints_updated} updated"
+        result = (
+            f"CBS metadata sync completed: {totals['added']} added, {totals['updated']} updated, "
+            f"{totals['embedded']} embedded, {totals['unchanged']} unchanged, {totals['failed']} failed, "
+            f"{removed} removed"
+        )
         logger.info(result)
         return result
 
@@ -147,4 +303,5 @@ async def fetch_cbs_metadata() -> str:
         logger.error(f"Error fetching CBS metadata: {e}")
         raise
     finally:
+        await client.aclose()
         session.close()
@@ -1,23 +1,37 @@
+import asyncio
 import logging
-import requests
-from typing import List, Dict, Any, Optional
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable
 from backend.database_metadata import get_metadata_session
-from backend.models_metadata import MetadataSource, MetadataEndpoint
-from backend.jobs.embeddings import generate_embedding
+from backend.models_metadata import MetadataSource
+from backend.jobs.http_client import SyncHttpClient
+from backend.jobs.pipeline import (
+    EndpointRecord,
+    build_embedding_text,
+    embed_records,
+    write_records,
+    load_content_hashes,
+    touch_endpoints,
+    sweep_endpoints
+)
+from backend.vector_index import rebuild_vector_index_after_sync
 
 logger = logging.getLogger(__name__)
 
 PDOK_INDEX_URL = "https://api.pdok.nl/index.json"
+PDOK_API_BATCH_SIZE = int(os.environ.get("PDOK_API_BATCH_SIZE", "50"))  # APIs fetched, embedded and written per checkpoint
 
 
-def fetch_ogc_api_info(api_url: str) -> Dict[str, Any]:
-    """Fetch OGC API info to find tileserver and collections URLs."""
+async def fetch_ogc_api_info(client: SyncHttpClient, api_url: str) -> Dict[str, Any]:
+    """
+    Fetch OGC API info to find tileserver and collections URLs.
+    If the landing page cannot be fetched, the result has an "error" key.
+    """
     result = {"tiles_url": None, "collections_url": None}
 
     try:
-        response = requests.get(f"{api_url}?f=json", timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = await client.get_json(f"{api_url}?f=json", timeout=10)
 
         for link in data.get("links", []):
             href = link.get("href", "")
@@ -31,37 +45,28 @@ def fetch_ogc_api_info(api_url: str) -> Dict[str, Any]:
 
     except Exception as e:
         logger.warning(f"Error fetching OGC API info from {api_url}: {e}")
+        result["error"] = str(e)
 
     return result
 
 
-def fetch_collections_metadata(collections_url: str) -> List[Dict[str, Any]]:
-    """Fetch metadata for all collections in an OGC API endpoint."""
+async def fetch_collections_metadata(client: SyncHttpClient, collections_url: str) -> Optional[List[Dict[str, Any]]]:
+    """Fetch metadata for all collections in an OGC API endpoint. Returns None if they cannot be fetched."""
     collections = []
 
     try:
-        response = requests.get(f"{collections_url}?f=json", timeout=15)
-        response.raise_for_status()
-        data = response.json()
+        data = await client.get_json(f"{collections_url}?f=json", timeout=15)
 
         for coll in data.get("collections", []):
             coll_id = coll.get("id", "")
             coll_title = coll.get("title", "")
             coll_desc = coll.get("description", "")
-            coll_keywords = coll.get("keywords", [])
-
-            processed_keywords = []
-            for kw in coll_keywords:
-                if isinstance(kw, dict):
-                    processed_keywords.append(kw.get("keyword", ""))
-                elif isinstance(kw, str):
-                    processed_keywords.append(kw)
 
             collection_item = {
                 "id": coll_id,
                 "title": coll_title or coll_id,
                 "description": coll_desc,
-                "keywords": processed_keywords
+                "keywords": process_keywords(coll.get("keywords", []))
             }
 
             for link in coll.get("links", []):
@@ -76,10 +81,102 @@ def fetch_collections_metadata(collections_url: str) -> List[Dict[str, Any]]:
 
     except Exception as e:
         logger.warning(f"Error fetching collections from {collections_url}: {e}")
+        return None
 
     return collections
 
 
+def process_keywords(keywords: List[Any]) -> List[str]:
+    """Normalize PDOK keywords, which are either plain strings or {"keyword": ...} objects."""
+    processed_keywords = []
+    for kw in keywords:
+        if isinstance(kw, dict):
+            processed_keywords.append(kw.get("keyword", ""))
+        elif isinstance(kw, str):
+            processed_keywords.append(kw)
+    return processed_keywords
+
+
+def get_api_root_url(api: Dict[str, Any]) -> Optional[str]:
+    """Return the root (landing page) URL of a PDOK index entry."""
+    for link in api.get("links", []):
+        if link.get("rel") == "root":
+            return link.get("href")
+    return None
+
+
+async def fetch_pdok_api(client: SyncHttpClient, api: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Fetch the landing page and collections of a single PDOK API.
+    "complete" is False when the landing page or collections could not be fetched,
+    in which case the collections listed may be missing some or all of the API's collections.
+    """
+    api_url = get_api_root_url(api)
+    if not api_url:
+        return None
+
+    logger.info(f"Processing PDOK API: {api.get('title', '')}")
+
+    api_info = await fetch_ogc_api_info(client, api_url)
+    collections_url = api_info.get("collections_url")
+
+    collections = []
+    complete = "error" not in api_info
+    if collections_url:
+        collections = await fetch_collections_metadata(client, collections_url)
+        if collections is None:
+            collections = []
+            complete = False
+        logger.info(f"Found {len(collections)} collections for {api.get('title', '')}")
+
+    return {
+        "api": api,
+        "api_url": api_url,
+        "api_info": api_info,
+        "collections": collections,
+        "complete": complete
+    }
+
+
+async def fetch_pdok_index(client: SyncHttpClient, index_url: str = PDOK_INDEX_URL) -> List[Dict[str, Any]]:
+    """Fetch the list of APIs in the PDOK index."""
+    logger.info(f"Fetching PDOK metadata from {index_url}")
+    data = await client.get_json(index_url, timeout=30)
+    return data.get("apis", [])
+
+
+async def fetch_pdok_apis(client: SyncHttpClient, apis: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fetch the landing page and collections of the given APIs.
+    APIs are fetched concurrently, bounded by the client's concurrency and per-host rate limits.
+    """
+    async def fetch_one(api: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            return await fetch_pdok_api(client, api)
+        except Exception as e:
+            logger.warning(f"Error fetching API {api.get('title', '')}: {e}")
+            return None
+
+    results = await asyncio.gather(*(fetch_one(api) for api in apis))
+    return [r for r in results if r]
+
+
+async def collect_pdok_apis(
+        index_url: str = PDOK_INDEX_URL,
+        client: Optional[SyncHttpClient] = None,
+        concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Fetch the PDOK index and the landing page and collections of every API in it."""
+    owns_client = client is None
+    client = client or SyncHttpClient(concurrency=concurrency)
+
+    try:
+        apis = await fetch_pdok_index(client, index_url)
+        return await fetch_pdok_apis(client, apis)
+    finally:
+        if owns_client:
+            await client.aclose()
+
+
 def get_or_create_pdok_source(session) -> MetadataSource:
     """Get or create the PDOK metadata source."""
     from sqlmodel import select
@@ -102,164 +199,151 @@ def get_or_create_pdok_source(session) -> MetadataSource:
     return source
 
 
-async def fetch_pdok_metadata() -> str:
+def build_pdok_records(fetched: Dict[str, Any]) -> List[EndpointRecord]:
+    """Turn a fetched PDOK API into endpoint records for the API itself and each of its collections."""
+    api = fetched["api"]
+    api_url = fetched["api_url"]
+    api_info = fetched["api_info"]
+
+    title = api.get("title", "")
+    description = api.get("description", "")
+    processed_keywords = process_keywords(api.get("keywords", []))
+    keywords_str = ", ".join(processed_keywords) if processed_keywords else ""
+
+    records = [EndpointRecord(
+        endpoint_url=api_url,
+        title=title,
+        description=description,
+        api_type="OGC API",
+        embedding_text=build_embedding_text(title, description, keywords_str),
+        extra_metadata={
+            "tiles_url": api_info.get("tiles_url"),
+            "collections_url": api_info.get("collections_url"),
+            "keywords": processed_keywords,
+            "collections": []
+        }
+    )]
+
+    parent_title = title.replace(" (OGC API)", "").replace("OGC API", "").strip()
+
+    for coll in fetched["collections"]:
+        coll_url = coll.get("features_url", "")
+        if not coll_url:
+            continue
+
+        coll_title = coll.get("title", "")
+        coll_desc = coll.get("description", "")
+        coll_keywords = coll.get("keywords", [])
+        coll_keywords_str = ", ".join(coll_keywords) if coll_keywords else ""
+
+        records.append(EndpointRecord(
+            endpoint_url=coll_url,
+            title=f"{parent_title} - {coll_title}",
+            description=coll_desc,
+            api_type="OGC API Collection",
+            embedding_text=build_embedding_text(coll_title, coll_desc, coll_keywords_str),
+            extra_metadata={
+                "parent_endpoint": api_url,
+                "collection_id": coll.get("id", ""),
+                "tiles_url": api_info.get("tiles_url"),
+                "keywords": coll_keywords
+            }
+        ))
+
+    return records
+
+
+async def fetch_pdok_metadata(
+        index_url: str = PDOK_INDEX_URL,
+        concurrency: Optional[int] = None,
+        full_sync: bool = False,
+        purge_stale: bool = False,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
     """
     Fetch metadata from PDOK index and store in database.
+    The APIs in the index are processed in batches of PDOK_API_BATCH_SIZE: each batch is
+    fetched, embedded and written before the next one is started.
+    Unless `full_sync` is set, only endpoints whose embedding text changed are re-embedded.
+
+    Endpoints that are no longer listed are soft-deleted at the end of the sync, or deleted outright
+    with `purge_stale`. The endpoints of APIs that could not be fetched completely are kept.
+
+    After each batch `on_checkpoint` is called with the index position reached and the running totals.
+    Passing that dict back as `checkpoint` resumes the sync after the last completed batch.
     Returns a summary of the operation.
     """
     session = get_metadata_session()
-    from sqlmodel import select
+    client = SyncHttpClient(concurrency=concurrency)
+    checkpoint = checkpoint or {}
+    started_at = datetime.fromisoformat(checkpoint["started_at"]) if checkpoint.get("started_at") else datetime.utcnow()
 
     try:
-        logger.info(f"Fetching PDOK metadata from {PDOK_INDEX_URL}")
-
-        response = requests.get(PDOK_INDEX_URL, timeout=30)
-        response.raise_for_status()
-
-        data = response.json()
+        apis = await fetch_pdok_index(client, index_url)
 
         source = get_or_create_pdok_source(session)
-
-        endpoints_added = 0
-        endpoints_updated = 0
-
-        collections = data.get("apis", [])
-
-        for api in collections:
-            title = ""
-            try:
-                title = api.get("title", "")
-                description = api.get("description", "")
-
-                api_url = None
-                if "links" in api:
-                    for link in api["links"]:
-                        if link.get("rel") == "root":
-                            api_url = link.get("href")
-                            break
-
-                if not api_url:
-                    continue
-
-                logger.info(f"Processing PDOK API: {title}")
-
-                api_info = fetch_ogc_api_info(api_url)
-                collections_url = api_info.get("collections_url")
-
-                existing = session.exec(
-                    select(MetadataEndpoint).where(
-                        MetadataEndpoint.source_id == source.id,
-                        MetadataEndpoint.endpoint_url == api_url
-                    )
-                ).first()
-
-                keywords = api.get("keywords", [])
-                processed_keywords = []
-                for kw in keywords:
-                    if isinstance(kw, dict):
-                        processed_keywords.append(kw.get("keyword", ""))
-                    elif isinstance(kw, str):
-                        processed_keywords.append(kw)
-
-                keywords_str = ", ".join(processed_keywords) if processed_keywords else ""
-                embedding_text = f"{title}: {description}"
-                if keywords_str:
-                    embedding_text += f" Keywords: {keywords_str}"
-
-                embedding = await generate_embedding(embedding_text)
-
-                extra_data = {
-                    "tiles_url": api_info.get("tiles_url"),
-                    "collections_url": collections_url,
-                    "keywords": processed_keywords,
-                    "collections": []
-                }
-
-                if existing:
-                    existing.title = title
-                    existing.description = description
-                    existing.embedding = embedding
-                    existing.api_type = "OGC API"
-                    existing.set_extra_metadata(extra_data)
-                    endpoints_updated += 1
-                else:
-                    endpoint = MetadataEndpoint(
-                        source_id=source.id,
-                        endpoint_url=api_url,
-                        title=title,
-                        description=description,
-                        api_type="OGC API",
-                        embedding=embedding
-                    )
-                    endpoint.set_extra_metadata(extra_data)
-                    session.add(endpoint)
-                    endpoints_added += 1
-
-                session.commit()
-
-                if collections_url:
-                    collections_data = fetch_collections_metadata(collections_url)
-                    logger.info(f"Found {len(collections_data)} collections for {title}")
-
-                    for coll in collections_data:
-                        coll_url = coll.get("features_url", "")
-                        if not coll_url:
-                            continue
-
-                        coll_id = coll.get("id", "")
-                        coll_title = coll.get("title", "")
-                        coll_desc = coll.get("description", "")
-
-                        coll_existing = session.exec(
-                            select(MetadataEndpoint).where(
-                                MetadataEndpoint.source_id == source.id,
-                                MetadataEndpoint.endpoint_url == coll_url
-                            )
-                        ).first()
-
-                        coll_keywords = coll.get("keywords", [])
-                        coll_keywords_str = ", ".join(coll_keywords) if coll_keywords else ""
-                        coll_embedding_text = f"{coll_title}: {coll_desc}"
-                        if coll_keywords_str:
-                            coll_embedding_text += f" Keywords: {coll_keywords_str}"
-
-                        coll_embedding = await generate_embedding(coll_embedding_text)
-
-                        parent_title = title.replace(" (OGC API)", "").replace("OGC API", "").strip()
-                        full_title = f"{parent_title} - {coll_title}"
-
-                        coll_extra = {
-                            "parent_endpoint": api_url,
-                            "collection_id": coll_id,
-                            "tiles_url": api_info.get("tiles_url"),
-                            "keywords": coll_keywords
-                        }
-
-                        if coll_existing:
-                            coll_existing.title = full_title
-                            coll_existing.description = coll_desc
-                            coll_existing.embedding = coll_embedding
-                            coll_existing.api_type = "OGC API Collection"
-                            coll_existing.set_extra_metadata(coll_extra)
-                        else:
-                            coll_endpoint = MetadataEndpoint(
-                                source_id=source.id,
-                                endpoint_url=coll_url,
-                                title=full_title,
-                                description=coll_desc,
-                                api_type="OGC API Collection",
-                                embedding=coll_embedding
-                            )
-                            coll_endpoint.set_extra_metadata(coll_extra)
-                            session.add(coll_endpoint)
-
-            except Exception as e:
-                logger.warning(f"Error processing API {title}: {e}")
-                continue
-
+        known_hashes = {} if full_sync else load_content_hashes(session, source.id)
+
+        totals = {"added": 0, "updated": 0, "embedded": 0, **checkpoint.get("totals", {})}
+        start_index = checkpoint.get("api_index", 0) if checkpoint.get("api_count") == len(apis) else 0
+        if start_index:
+            logger.info(f"Resuming PDOK metadata sync at API {start_index}/{len(apis)}")
+
+        for batch_start in range(start_index, len(apis), PDOK_API_BATCH_SIZE):
+            batch_end = min(batch_start + PDOK_API_BATCH_SIZE, len(apis))
+            batch_apis = apis[batch_start:batch_end]
+            fetched_apis = await fetch_pdok_apis(client, batch_apis)
+
+            # The stored endpoints of APIs that failed are kept, rather than swept as gone
+            fetched_urls = {f["api_url"] for f in fetched_apis if f["complete"]}
+            failed_urls = [url for url in map(get_api_root_url, batch_apis) if url and url not in fetched_urls]
+
+            records = []
+            for fetched in fetched_apis:
+                try:
+                    records.extend(build_pdok_records(fetched))
+                except Exception as e:
+                    logger.warning(f"Error processing API {fetched['api'].get('title', '')}: {e}")
+                    failed_urls.append(fetched["api_url"])
+
+            logger.info(f"Collected {len(records)} PDOK endpoints from APIs {batch_start + 1}-{batch_end}/{len(apis)}")
+
+            listed_urls = [r.endpoint_url for r in records]
+            records = await embed_records(records, known_hashes)
+            totals["embedded"] += sum(1 for r in records if r.embedding is not None)
+
+            added, updated = write_records(session, source.id, records, started_at)
+            totals["added"] += added
+            totals["updated"] += updated
+
+            # Endpoints that were listed but not written, e.g. because their embedding batch failed
+            written = {r.endpoint_url for r in records}
+            touch_endpoints(
+                session,
+                source.id,
+                [url for url in listed_urls if url not in written],
+                url_prefixes=failed_urls,
+                seen_at=started_at
+            )
+
+            if on_checkpoint and batch_end < len(apis):
+                on_checkpoint({
+                    "started_at": started_at.isoformat(),
+                    "api_index": batch_end,
+                    "api_count": len(apis),
+                    "totals": dict(totals)
+                })
+
+        removed = sweep_endpoints(session, source.id, started_at, purge=purge_stale)
+        # The sync's session must not hold locks while indexes are built concurrently
         session.commit()
+        # Building an index can take minutes; keep the event loop free meanwhile
+        await asyncio.to_thread(rebuild_vector_index_after_sync, source.id, totals["embedded"] + removed)
 
-        result = f"PDOK metadata sync completed: {endpoints_added} added, {endpoints_updated} updated"
+        result = (
+            f"PDOK metadata sync completed: {totals['added']} added, {totals['updated']} updated, "
+            f"{totals['embedded']} embedded, {removed} removed"
+        )
         logger.info(result)
         return result
 
@@ -267,4 +351,5 @@ async def fetch_pdok_metadata() -> str:
         logger.error(f"Error fetching PDOK metadata: {e}")
         raise
     finally:
+        await client.aclose()
         session.close()
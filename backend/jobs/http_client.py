@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+SYNC_HTTP_CONCURRENCY = int(os.environ.get("METADATA_SYNC_CONCURRENCY", "16"))
+SYNC_HTTP_HOST_CONCURRENCY = int(os.environ.get("METADATA_SYNC_HOST_CONCURRENCY", "8"))
+SYNC_HTTP_RATE_LIMIT = float(os.environ.get("METADATA_SYNC_RATE_LIMIT", "20"))  # requests per second per host, 0 = unlimited
+SYNC_HTTP_TIMEOUT = float(os.environ.get("METADATA_SYNC_TIMEOUT", "15"))
+SYNC_HTTP_RETRIES = int(os.environ.get("METADATA_SYNC_RETRIES", "3"))
+SYNC_HTTP_BACKOFF = float(os.environ.get("METADATA_SYNC_BACKOFF", "0.5"))  # seconds, doubled per retry
+SYNC_HTTP_BREAKER_THRESHOLD = int(os.environ.get("METADATA_SYNC_BREAKER_THRESHOLD", "10"))
+SYNC_HTTP_BREAKER_COOLDOWN = float(os.environ.get("METADATA_SYNC_BREAKER_COOLDOWN", "30"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when requests to a host are short-circuited after too many consecutive failures."""
+
+
+class HostRateLimiter:
+    """Spaces out requests to a single host to at most `rate` requests per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects requests for `cooldown` seconds.
+    After the cooldown a single failure opens it again; a success closes it.
+    """
+
+    def __init__(self, host: str, threshold: int, cooldown: float):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def check(self) -> None:
+        if self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown:
+            raise CircuitOpenError(f"Circuit open for {self.host} after {self.failures} consecutive failures")
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.threshold and self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(f"Opening circuit for {self.host} for {self.cooldown}s after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+class HostState:
+    """Rate limiter, concurrency cap and circuit breaker of a single host."""
+
+    def __init__(self, host: str, rate_limit: float, concurrency: int, breaker_threshold: int, breaker_cooldown: float):
+        self.limiter = HostRateLimiter(rate_limit)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker(host, breaker_threshold, breaker_cooldown)
+
+
+class SyncHttpClient:
+    """
+    Pooled async HTTP client used by the metadata sync jobs.
+    Caps the number of in-flight requests overall and per host, rate limits each host,
+    retries transient failures with exponential backoff and stops calling hosts that keep failing.
+    """
+
+    def __init__(
+            self,
+            concurrency: Optional[int] = None,
+            rate_limit: Optional[float] = None,
+            timeout: Optional[float] = None,
+            host_concurrency: Optional[int] = None,
+            max_retries: Optional[int] = None,
+            backoff: Optional[float] = None,
+            breaker_threshold: Optional[int] = None,
+            breaker_cooldown: Optional[float] = None,
+            transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.concurrency = concurrency or SYNC_HTTP_CONCURRENCY
+        self.host_concurrency = min(host_concurrency or SYNC_HTTP_HOST_CONCURRENCY, self.concurrency)
+        self.rate_limit = SYNC_HTTP_RATE_LIMIT if rate_limit is None else rate_limit
+        self.max_retries = SYNC_HTTP_RETRIES if max_retries is None else max_retries
+        self.backoff = SYNC_HTTP_BACKOFF if backoff is None else backoff
+        self.breaker_threshold = SYNC_HTTP_BREAKER_THRESHOLD if breaker_threshold is None else breaker_threshold
+        self.breaker_cooldown = SYNC_HTTP_BREAKER_COOLDOWN if breaker_cooldown is None else breaker_cooldown
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._hosts: Dict[str, HostState] = {}
+        self._client = httpx.AsyncClient(
+            timeout=timeout or SYNC_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency
+            ),
+            follow_redirects=True,
+            transport=transport
+        )
+
+    async def __aenter__(self) -> "SyncHttpClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _get_host(self, url: str) -> HostState:
+        host = urlsplit(url).netloc
+        state = self._hosts.get(host)
+        if state is None:
+            state = HostState(host, self.rate_limit, self.host_concurrency, self.breaker_threshold, self.breaker_cooldown)
+            self._hosts[host] = state
+        return state
+
+    def _get_retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        delay = self.backoff * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    async def get(self, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        GET a URL, retrying connection errors, timeouts and 429/5xx responses.
+        The last error is raised, or the last retryable response returned, once the retries are used up.
+        """
+        host = self._get_host(url)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        for attempt in range(self.max_retries + 1):
+            host.breaker.check()
+            response = None
+
+            try:
+                async with self._semaphore, host.semaphore:
+                    await host.limiter.acquire()
+                    response = await self._client.get(url, **kwargs)
+            except httpx.TransportError as e:
+                host.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                logger.info(f"Request to {url} failed ({e!r}), retrying")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    host.breaker.record_success()
+                    return response
+                host.breaker.record_failure()
+                if attempt == self.max_retries:
+                    return response
+                logger.info(f"Request to {url} returned {response.status_code}, retrying")
+
+            await asyncio.sleep(self._get_retry_delay(attempt, response))
+
+    async def get_json(self, url: str, timeout: Optional[float] = None, **kwargs) -> Any:
+        response = await self.get(url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import func, literal_column, text, bindparam
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.models_metadata import MetadataEndpoint
+from backend.jobs.embeddings import (
+    generate_embeddings_batch,
+    make_embedding_batches,
+    truncate_for_embedding,
+    embedding_content_hash
+)
+
+logger = logging.getLogger(__name__)
+
+WRITE_CHUNK_SIZE = 500
+
+# A sweep that would remove more than this fraction of a source's endpoints is skipped,
+# as it more likely means the source returned an incomplete listing than that the endpoints are gone
+SWEEP_MAX_FRACTION = float(os.environ.get("METADATA_SWEEP_MAX_FRACTION", "0.5"))
+
+
+@dataclass
+class EndpointRecord:
+    """An endpoint collected by a metadata fetcher, ready to be embedded and written."""
+    endpoint_url: str
+    title: str
+    description: Optional[str]
+    api_type: str
+    embedding_text: str
+    extra_metadata: Dict[str, Any] = field(default_factory=dict)
+    embedding: Optional[List[float]] = None
+    content_hash: Optional[str] = None
+
+
+def build_embedding_text(title: str, description: Optional[str], keywords: str = "") -> str:
+    """Build the text that is embedded for an endpoint."""
+    embedding_text = f"{title}: {description}"
+    if keywords:
+        embedding_text += f" Keywords: {keywords}"
+    return embedding_text
+
+
+def is_ogc_endpoint(endpoint_url: str) -> bool:
+    """Whether an endpoint is an OGC API endpoint, which can serve GeoJSON."""
+    return "/ogc/" in endpoint_url
+
+
+def load_content_hashes(session: Session, source_id: int) -> Dict[str, str]:
+    """Return the stored content hash per endpoint URL for a source."""
+    rows = session.exec(
+        select(MetadataEndpoint.endpoint_url, MetadataEndpoint.content_hash).where(
+            MetadataEndpoint.source_id == source_id,
+            MetadataEndpoint.content_hash.is_not(None)
+        )
+    ).all()
+    return {url: content_hash for url, content_hash in rows}
+
+
+async def embed_records(
+        records: List[EndpointRecord],
+        known_hashes: Optional[Dict[str, str]] = None) -> List[EndpointRecord]:
+    """
+    Generate embeddings for the records in as few API calls as possible.
+
+    Records whose content hash matches `known_hashes` keep their stored embedding and are
+    returned without one. Records in a batch that fails are logged and left out of the result.
+    """
+    known_hashes = known_hashes or {}
+    result = []
+    to_embed = []
+
+    for record in records:
+        record.content_hash = embedding_content_hash(record.embedding_text)
+        if known_hashes.get(record.endpoint_url) == record.content_hash:
+            result.append(record)
+        else:
+            to_embed.append(record)
+
+    if result:
+        logger.info(f"Skipping embeddings for {len(result)} unchanged endpoints")
+
+    texts = [truncate_for_embedding(r.embedding_text) for r in to_embed]
+    offset = 0
+
+    batches = make_embedding_batches(texts)
+    for i, batch in enumerate(batches, start=1):
+        batch_records = to_embed[offset:offset + len(batch)]
+        offset += len(batch)
+
+        try:
+            logger.info(f"Generating embeddings batch {i}/{len(batches)} ({len(batch)} texts)")
+            embeddings = await generate_embeddings_batch(batch)
+        except Exception as e:
+            logger.warning(f"Error generating embeddings for batch {i}/{len(batches)}, skipping {len(batch)} endpoints: {e}")
+            continue
+
+        for record, embedding in zip(batch_records, embeddings):
+            record.embedding = embedding
+            result.append(record)
+
+    return result
+
+
+def write_records(
+        session: Session,
+        source_id: int,
+        records: List[EndpointRecord],
+        seen_at: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Insert or update the records for a source with chunked INSERT ... ON CONFLICT DO UPDATE statements.
+    Each chunk is committed on its own, so a failure only loses the chunk being written.
+    Records without an embedding are unchanged and keep the stored embedding.
+    Written endpoints are marked as seen at `seen_at` (default now) and restored if they were soft-deleted.
+    Returns a tuple of (added, updated) counts.
+    """
+    added = 0
+    updated = 0
+    now = datetime.utcnow()
+    seen_at = seen_at or now
+    table = MetadataEndpoint.__table__
+
+    # A single statement cannot update the same row twice, so the last record per URL wins
+    unique_records = list({r.endpoint_url: r for r in records}.values())
+
+    for start in range(0, len(unique_records), WRITE_CHUNK_SIZE):
+        chunk = unique_records[start:start + WRITE_CHUNK_SIZE]
+
+        stmt = insert(table).values([
+            {
+                "source_id": source_id,
+                "endpoint_url": r.endpoint_url,
+                "title": r.title,
+                "description": r.description,
+                "api_type": r.api_type,
+                "is_ogc": is_ogc_endpoint(r.endpoint_url),
+                "extra_metadata": json.dumps(r.extra_metadata),
+                "embedding": r.embedding,
+                "content_hash": r.content_hash,
+                "created_at": now,
+                "updated_at": now,
+                "last_seen_at": seen_at,
+                "deleted_at": None
+            }
+            for r in chunk
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.source_id, table.c.endpoint_url],
+            set_={
+                "title": stmt.excluded.title,
+                "description": stmt.excluded.description,
+                "api_type": stmt.excluded.api_type,
+                "is_ogc": stmt.excluded.is_ogc,
+                "extra_metadata": stmt.excluded.extra_metadata,
+                "embedding": func.coalesce(stmt.excluded.embedding, table.c.embedding),
+                "content_hash": stmt.excluded.content_hash,
+                "updated_at": stmt.excluded.updated_at,
+                "last_seen_at": stmt.excluded.last_seen_at,
+                "deleted_at": None
+            }
+        ).returning(literal_column("(xmax = 0)").label("inserted"))
+
+        rows = session.execute(stmt).all()
+        chunk_added = sum(1 for row in rows if row.inserted)
+        added += chunk_added
+        updated += len(rows) - chunk_added
+        session.commit()
+
+    return added, updated
+
+
+def touch_endpoints(
+        session: Session,
+        source_id: int,
+        urls: List[str] = (),
+        url_prefixes: List[str] = (),
+        seen_at: Optional[datetime] = None) -> int:
+    """
+    Mark stored endpoints as seen without rewriting them, for endpoints that were listed by the
+    source but skipped as unchanged, and for the endpoints under `url_prefixes` of APIs that
+    could not be fetched. Soft-deleted endpoints among them are restored.
+    Returns the number of endpoints touched.
+    """
+    seen_at = seen_at or datetime.utcnow()
+    touched = 0
+
+    urls = list(urls)
+    for start in range(0, len(urls), WRITE_CHUNK_SIZE):
+        result = session.execute(
+            text("""
+                UPDATE metadata_endpoint
+                SET last_seen_at = :seen_at, deleted_at = NULL
+                WHERE source_id = :source_id
+                  AND endpoint_url IN :urls
+            """).bindparams(bindparam("urls", expanding=True)),
+            {"seen_at": seen_at, "source_id": source_id, "urls": urls[start:start + WRITE_CHUNK_SIZE]}
+        )
+        touched += result.rowcount
+
+    for prefix in url_prefixes:
+        result = session.execute(
+            text("""
+                UPDATE metadata_endpoint
+                SET last_seen_at = :seen_at, deleted_at = NULL
+                WHERE source_id = :source_id
+                  AND (rtrim(endpoint_url, '/') = :root OR starts_with(endpoint_url, :root || '/'))
+            """),
+            {"seen_at": seen_at, "source_id": source_id, "root": prefix.rstrip("/")}
+        )
+        touched += result.rowcount
+
+    session.commit()
+    return touched
+
+
+def sweep_endpoints(session: Session, source_id: int, seen_since: datetime, purge: bool = False) -> int:
+    """
+    Remove the endpoints of a source that were not seen since `seen_since`, the start of the sync.
+    Endpoints are soft-deleted by setting deleted_at, or deleted outright with `purge`.
+    Returns the number of endpoints removed.
+    """
+    stale_filter = "source_id = :source_id AND (last_seen_at IS NULL OR last_seen_at < :seen_since)"
+    params = {"source_id": source_id, "seen_since": seen_since}
+
+    total, stale = session.execute(text(f"""
+        SELECT count(*) AS total,
+               count(*) FILTER (WHERE {stale_filter} AND deleted_at IS NULL) AS stale
+        FROM metadata_endpoint
+        WHERE source_id = :source_id AND deleted_at IS NULL
+    """), params).one()
+
+    if total and stale / total > SWEEP_MAX_FRACTION:
+        logger.warning(
+            f"Not removing {stale} of {total} endpoints of source {source_id}: "
+            f"more than {SWEEP_MAX_FRACTION:.0%} were not seen in this sync"
+        )
+        return 0
+
+    if purge:
+        result = session.execute(text(f"DELETE FROM metadata_endpoint WHERE {stale_filter}"), params)
+    else:
+        result = session.execute(text(f"""
+            UPDATE metadata_endpoint
+            SET deleted_at = :deleted_at
+            WHERE {stale_filter} AND deleted_at IS NULL
+        """), {**params, "deleted_at": datetime.utcnow()})
+
+    session.commit()
+
+    if result.rowcount:
+        logger.info(f"{'Purged' if purge else 'Soft-deleted'} {result.rowcount} stale endpoints of source {source_id}")
+    return result.rowcount
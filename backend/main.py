@@ -83,6 +83,9 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Could not initialize metadata DB: {e}")
 
+    from backend.memory_index import init_memory_index
+    init_memory_index()
+
     try:
         start_metadata_scheduler()
 
@@ -93,6 +96,13 @@ async def lifespan(app: FastAPI):
     yield
     scheduler.shutdown()
 
+    from backend.database import async_engine
+    from backend.database_metadata import metadata_engine, async_metadata_engine
+    engine.dispose()
+    await async_engine.dispose()
+    metadata_engine.dispose()
+    await async_metadata_engine.dispose()
+
 
 app = FastAPI(lifespan=lifespan)
 
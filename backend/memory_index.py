@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from backend.database_metadata import metadata_engine
+from backend.vector_index import EMBEDDING_DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Answer vector searches from a snapshot of all embeddings in memory instead of Postgres
+METADATA_MEMORY_INDEX = os.environ.get("METADATA_MEMORY_INDEX", "False").lower() in ("true", "1", "t")
+# "float16" halves the memory used, at the cost of slower (non-BLAS) matrix products
+METADATA_MEMORY_INDEX_DTYPE = os.environ.get("METADATA_MEMORY_INDEX_DTYPE", "float32")
+MEMORY_INDEX_LOAD_CHUNK_SIZE = 2000
+
+_index: Optional["MemoryVectorIndex"] = None
+_reload_lock = threading.Lock()
+
+
+class MemorySearchRow(NamedTuple):
+    """A search result, with the same attributes as the rows of the SQL searches."""
+    id: int
+    source_id: int
+    endpoint_url: str
+    title: str
+    description: Optional[str]
+    api_type: Optional[str]
+    extra_metadata: Optional[str]
+    source_name: str
+    source_type: str
+    distance: float
+
+
+class MemoryVectorIndex:
+    """
+    Snapshot of the embeddings of all live endpoints as one contiguous matrix of unit vectors.
+    A search is a single matrix-vector product; the source and OGC filters are precomputed masks.
+    """
+
+    def __init__(
+            self,
+            matrix: np.ndarray,
+            rows: List[Tuple],
+            source_ids: np.ndarray,
+            is_ogc: np.ndarray,
+            sources: Dict[int, Tuple[str, str]]):
+        self.matrix = matrix
+        self.rows = rows  # (id, source_id, endpoint_url, title, description, api_type, extra_metadata)
+        self.sources = sources  # source id -> (name, source_type)
+        self.source_ids_by_type = {source_type: source_id for source_id, (_, source_type) in sources.items()}
+        self.loaded_at = time.time()
+
+        self.masks: Dict[Tuple[Optional[int], bool], np.ndarray] = {(None, True): is_ogc}
+        for source_id in sources:
+            source_mask = source_ids == source_id
+            self.masks[(source_id, False)] = source_mask
+            self.masks[(source_id, True)] = source_mask & is_ogc
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def search(
+            self,
+            embedding: Sequence[float],
+            limit: int,
+            source_id: Optional[int] = None,
+            ogc_only: bool = False) -> List[MemorySearchRow]:
+        """Top-`limit` endpoints by cosine distance, optionally of a single source and/or OGC only."""
+        return self.search_batch([embedding], limit, [(source_id, ogc_only)])[0]
+
+    def search_batch(
+            self,
+            embeddings: Sequence[Sequence[float]],
+            limit: int,
+            filters: Optional[Sequence[Tuple[Optional[int], bool]]] = None) -> List[List[MemorySearchRow]]:
+        """
+        Top-`limit` endpoints for each embedding with a single matrix product.
+        `filters` holds a (source_id, ogc_only) pair per embedding.
+        """
+        if not len(embeddings):
+            return []
+        if not len(self.rows):
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+
+        # One column of similarities per query
+        similarities = (self.matrix @ queries.T.astype(self.matrix.dtype)).astype(np.float32)
+        limit = min(limit, len(self.rows))
+
+        results = []
+        for j, (source_id, ogc_only) in enumerate(filters or [(None, False)] * len(queries)):
+            column = similarities[:, j]
+            if source_id is not None or ogc_only:
+                column = np.where(self.masks.get((source_id, ogc_only), False), column, -np.inf)
+
+            top = np.argpartition(-column, limit - 1)[:limit]
+            top = top[np.argsort(-column[top])]
+
+            rows = []
+            for i in top:
+                if column[i] == -np.inf:
+                    break
+                name, source_type = self.sources.get(self.rows[i][1], (None, None))
+                rows.append(MemorySearchRow(*self.rows[i], name, source_type, float(1 - column[i])))
+            results.append(rows)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoints": len(self.rows),
+            "dtype": str(self.matrix.dtype),
+            "memory_bytes": int(self.matrix.nbytes),
+            "loaded_at": self.loaded_at
+        }
+
+
+def load_memory_index() -> MemoryVectorIndex:
+    """Load the embeddings of all endpoints that are not deleted from the metadata database."""
+    started = time.monotonic()
+    dtype = np.dtype(METADATA_MEMORY_INDEX_DTYPE)
+
+    with metadata_engine.connect() as conn:
+        sources = {
+            source_id: (name, source_type)
+            for source_id, name, source_type in conn.execute(
+                text("SELECT id, name, source_type FROM metadata_source")
+            ).fetchall()
+        }
+        count = conn.execute(text(
+            "SELECT count(*) FROM metadata_endpoint WHERE embedding IS NOT NULL AND deleted_at IS NULL"
+        )).scalar()
+
+        matrix = np.zeros((count, EMBEDDING_DIMENSIONS), dtype=dtype)
+        rows: List[Tuple] = []
+        source_ids = np.zeros(count, dtype=np.int64)
+        is_ogc = np.zeros(count, dtype=bool)
+
+        result = conn.execution_options(stream_results=True, yield_per=MEMORY_INDEX_LOAD_CHUNK_SIZE).execute(text("""
+            SELECT id, source_id, endpoint_url, title, description, api_type, extra_metadata, is_ogc,
+                   embedding::real[] AS embedding
+            FROM metadata_endpoint
+            WHERE embedding IS NOT NULL AND deleted_at IS NULL
+            ORDER BY id
+        """))
+
+        for chunk in result.partitions():
+            vectors = np.asarray([row.embedding for row in chunk], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+
+            # Rows added since the count are left for the next load
+            start = len(rows)
+            chunk = chunk[:count - start]
+            matrix[start:start + len(chunk)] = vectors[:len(chunk)]
+            for offset, row in enumerate(chunk):
+                rows.append(tuple(row[:7]))
+                source_ids[start + offset] = row.source_id
+                is_ogc[start + offset] = row.is_ogc
+
+    size = len(rows)
+    index = MemoryVectorIndex(matrix[:size], rows, source_ids[:size], is_ogc[:size], sources)
+    logger.info(
+        f"Loaded {size} embeddings into the memory index ({index.matrix.nbytes / 2 ** 20:.1f} MiB) "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return index
+
+
+def reload_memory_index() -> None:
+    """Load a new snapshot and swap it in; searches keep using the old one until then."""
+    global _index
+
+    with _reload_lock:
+        try:
+            _index = load_memory_index()
+        except Exception as e:
+            logger.warning(f"Error loading the memory index: {e}")
+
+
+def reload_memory_index_in_background() -> None:
+    threading.Thread(target=reload_memory_index, name="memory-index-reload", daemon=True).start()
+
+
+def init_memory_index() -> None:
+    """Load the memory index, if enabled, in the background and reload it after every metadata sync."""
+    if not METADATA_MEMORY_INDEX:
+        return
+
+    from backend.cache import register_invalidation_hook, METADATA_SYNC
+    register_invalidation_hook(METADATA_SYNC, reload_memory_index_in_background)
+    reload_memory_index_in_background()
+
+
+def get_memory_index() -> Optional[MemoryVectorIndex]:
+    """The loaded memory index, or None if it is disabled or not loaded yet."""
+    return _index if METADATA_MEMORY_INDEX else None
@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, JSON
 from pydantic import BaseModel
 
@@ -41,8 +42,22 @@ class ResearchStep(SQLModel, table=True):
 
 
 class ChatHistory(SQLModel, table=True):
+    # Serves the latest messages of a user (agent context) and the /history pages
+    __table_args__ = (
+        Index("ix_chathistory_user_id_timestamp", "user_id", text("timestamp DESC")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     role: str  # "user" or "model"
     content: str
+
+
+class ChatSummary(SQLModel, table=True):
+    """Rolling summary of a user's chat history, up to and including message `summarized_until_id`."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True, unique=True)
+    summary: str
+    summarized_until_id: int
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -1,6 +1,7 @@
 from typing import Optional, List
 from datetime import datetime
 from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import UniqueConstraint
 from pgvector.sqlalchemy import Vector
 import json
 
@@ -19,6 +20,9 @@ class MetadataSource(SQLModel, table=True):
 
 class MetadataEndpoint(SQLModel, table=True):
     __tablename__ = "metadata_endpoint"
+    __table_args__ = (
+        UniqueConstraint("source_id", "endpoint_url", name="uq_metadata_endpoint_source_url"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     source_id: int = Field(foreign_key="metadata_source.id")
@@ -26,10 +30,14 @@ class MetadataEndpoint(SQLModel, table=True):
     title: str = Field(max_length=500)
     description: Optional[str] = None
     api_type: str = Field(max_length=100)  # "OGC API Features", "CBS OData", etc.
+    is_ogc: bool = Field(default=False)  # OGC API endpoint that can serve GeoJSON
     extra_metadata: Optional[str] = Field(default=None)  # JSON string
     embedding: Optional[List[float]] = Field(default=None, sa_column=Column(Vector(1536)))
+    content_hash: Optional[str] = Field(default=None, max_length=64)  # sha256 of embedding model + text
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    last_seen_at: Optional[datetime] = None  # last sync in which the endpoint was still listed by its source
+    deleted_at: Optional[datetime] = None  # set when a sync no longer finds the endpoint
 
     def get_extra_metadata(self) -> dict:
         if self.extra_metadata:
@@ -40,6 +48,15 @@ class MetadataEndpoint(SQLModel, table=True):
         self.extra_metadata = json.dumps(data)
 
 
+class EmbeddingCache(SQLModel, table=True):
+    __tablename__ = "embedding_cache"
+
+    text_hash: str = Field(primary_key=True, max_length=64)  # sha256 of the embedded text
+    model: str = Field(primary_key=True, max_length=100)
+    embedding: Optional[List[float]] = Field(default=None, sa_column=Column(Vector(1536)))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Job(SQLModel, table=True):
     __tablename__ = "job"
 
@@ -74,3 +91,12 @@ class JobRun(SQLModel, table=True):
     completed_at: Optional[datetime] = None
     error_message: Optional[str] = None
     result_summary: Optional[str] = None
+    checkpoint: Optional[str] = Field(default=None)  # JSON string, progress to resume from after a failure
+
+    def get_checkpoint(self) -> dict:
+        if self.checkpoint:
+            return json.loads(self.checkpoint)
+        return {}
+
+    def set_checkpoint(self, data: Optional[dict]):
+        self.checkpoint = json.dumps(data) if data else None
@@ -1,7 +1,8 @@
 import asyncio
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
@@ -16,6 +17,9 @@ logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
+# Failed runs older than this are not resumed; the next run starts from scratch
+METADATA_SYNC_RESUME_WINDOW = int(os.environ.get("METADATA_SYNC_RESUME_WINDOW", "86400"))
+
 
 async def scheduled_research_task(user_id: int, query: str):
     """
@@ -62,10 +66,20 @@ def start_scheduler() -> None:
 
 
 class JobExecutor:
-    """Base class for job executors."""
+    """
+    Base class for job executors.
+    `checkpoint` is the progress saved by a failed previous run, and `on_checkpoint`
+    is called with the current progress so a later run can resume from it.
+    """
 
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(
+            self,
+            config: Dict[str, Any],
+            checkpoint: Optional[Dict[str, Any]] = None,
+            on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None):
         self.config = config
+        self.checkpoint = checkpoint or {}
+        self.on_checkpoint = on_checkpoint
 
     async def execute(self) -> str:
         raise NotImplementedError("Subclasses must implement execute()")
@@ -76,21 +90,54 @@ class MetadataSyncExecutor(JobExecutor):
 
     async def execute(self) -> str:
         source = self.config.get("source", "")
+        full_sync = self.config.get("full_sync", False)
+        purge_stale = self.config.get("purge_stale", False)
 
         if source == "pdok":
             from backend.jobs.fetchers.pdok import fetch_pdok_metadata
-            result = await fetch_pdok_metadata()
+            result = await fetch_pdok_metadata(
+                concurrency=self.config.get("concurrency"),
+                full_sync=full_sync,
+                purge_stale=purge_stale,
+                checkpoint=self.checkpoint,
+                on_checkpoint=self.on_checkpoint
+            )
         elif source == "cbs":
             from backend.jobs.fetchers.cbs import fetch_cbs_metadata
-            result = await fetch_cbs_metadata()
+            result = await fetch_cbs_metadata(
+                concurrency=self.config.get("concurrency"),
+                full_sync=full_sync,
+                purge_stale=purge_stale,
+                checkpoint=self.checkpoint,
+                on_checkpoint=self.on_checkpoint
+            )
         else:
             result = f"Unknown source: {source}"
 
         return result
 
 
+def get_resume_checkpoint(session, job_id: int) -> Dict[str, Any]:
+    """Return the checkpoint of the job's last run if that run failed recently, else an empty dict."""
+    from backend.models_metadata import JobRun
+
+    last_run = session.exec(
+        select(JobRun).where(JobRun.job_id == job_id).order_by(JobRun.started_at.desc())
+    ).first()
+
+    if not last_run or last_run.status != "failed":
+        return {}
+    if datetime.utcnow() - last_run.started_at > timedelta(seconds=METADATA_SYNC_RESUME_WINDOW):
+        return {}
+
+    return last_run.get_checkpoint()
+
+
 async def run_metadata_job(job_id: int):
-    """Execute a metadata job and record the result."""
+    """
+    Execute a metadata job and record the result.
+    If the previous run failed after saving a checkpoint, the job resumes from that checkpoint.
+    """
     from backend.database_metadata import get_metadata_session
     from backend.models_metadata import Job, JobRun
 
@@ -102,23 +149,36 @@ async def run_metadata_job(job_id: int):
             logger.error(f"Job {job_id} not found")
             return
 
+        checkpoint = get_resume_checkpoint(session, job_id)
+
         job_run = JobRun(
             job_id=job_id,
             status="running"
         )
+        # Carry the checkpoint over, so a run that fails before saving its own can still be resumed
+        job_run.set_checkpoint(checkpoint)
         session.add(job_run)
         session.commit()
         session.refresh(job_run)
 
-        logger.info(f"Starting job {job.name} (ID: {job_id})")
+        if checkpoint:
+            logger.info(f"Resuming job {job.name} (ID: {job_id}) from checkpoint {checkpoint}")
+        else:
+            logger.info(f"Starting job {job.name} (ID: {job_id})")
+
+        def save_checkpoint(state: Dict[str, Any]) -> None:
+            job_run.set_checkpoint(state)
+            session.add(job_run)
+            session.commit()
 
         try:
-            executor = get_metadata_executor(job)
+            executor = get_metadata_executor(job, checkpoint, save_checkpoint)
             result = await executor.execute()
 
             job_run.status = "completed"
             job_run.completed_at = datetime.utcnow()
             job_run.result_summary = result
+            job_run.set_checkpoint(None)
 
             job.last_run = datetime.utcnow()
 
@@ -130,16 +190,23 @@ async def run_metadata_job(job_id: int):
 
         session.commit()
 
+        # Failed syncs may have written part of the endpoints as well
+        from backend.cache import invalidate, METADATA_SYNC
+        invalidate(METADATA_SYNC)
+
     finally:
         session.close()
 
 
-def get_metadata_executor(job) -> JobExecutor:
+def get_metadata_executor(
+        job,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None) -> JobExecutor:
     """Get the appropriate executor for a metadata job."""
     config = job.get_config()
 
     if job.job_type == "METADATA_SYNC":
-        return MetadataSyncExecutor(config)
+        return MetadataSyncExecutor(config, checkpoint, on_checkpoint)
 
     raise ValueError(f"Unknown job type: {job.job_type}")
 
@@ -187,8 +254,18 @@ add_job_to_scheduler = add_metadata_job_to_scheduler
 remove_job_from_scheduler = remove_metadata_job_from_scheduler
 
 
+async def maintain_vector_index():
+    """Create or update the vector indexes in the background; searches still work without them, only slower."""
+    from backend.vector_index import ensure_vector_index
+
+    try:
+        await asyncio.to_thread(ensure_vector_index)
+    except Exception as e:
+        logger.warning(f"Error creating vector index: {e}")
+
+
 def start_metadata_scheduler():
-    """Start the metadata scheduler and load jobs from DB."""
+    """Start the metadata scheduler, load jobs from DB and maintain the vector indexes once."""
     from backend.database_metadata import get_metadata_session
     from backend.models_metadata import Job
 
@@ -206,6 +283,9 @@ def start_metadata_scheduler():
     finally:
         session.close()
 
+    # Runs once, right away; of several workers only the one that takes the advisory lock builds
+    scheduler.add_job(maintain_vector_index, id="vector_index_maintenance", replace_existing=True)
+
 
 def create_metadata_job(
     name: str,
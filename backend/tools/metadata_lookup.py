@@ -1,84 +1,155 @@
+import json
 import logging
 import hashlib
-import time
+import os
+import re
+import unicodedata
 from typing import Optional, List, Dict, Any
-from backend.database_metadata import get_metadata_session
+from backend.cache import get_cache, get_semantic_cache, METADATA_SYNC
+from backend.database_metadata import get_async_metadata_session
 from backend.models_metadata import MetadataEndpoint, MetadataSource
-from backend.jobs.embeddings import generate_embedding
+from backend.jobs.embeddings import generate_embedding, generate_embeddings_batch
+from backend.vector_index import search_endpoints, vector_search_batch, get_search_mode, get_source_filter
+from backend.memory_index import get_memory_index
 from sqlmodel import select
 
 logger = logging.getLogger(__name__)
 
-_embedding_cache: Dict[str, tuple] = {}
-_metadata_cache: Dict[str, tuple] = {}
 CACHE_TTL = 300
+EMBEDDING_CACHE_TTL = 3600
+# Reuse the results of an earlier query whose embedding is at least this similar, 0 to disable
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("METADATA_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_SIZE = int(os.environ.get("METADATA_SEMANTIC_CACHE_SIZE", "256"))
+
+# Words that do not change what a Dutch (or English) dataset query is about
+QUERY_STOPWORDS = {
+    "de", "het", "een", "van", "in", "op", "voor", "met", "en", "of", "per", "naar", "over", "bij",
+    "uit", "aan", "te", "tot", "door", "om", "als", "die", "dat", "is", "zijn", "alle", "welke",
+    "the", "a", "an", "and", "for", "on", "by", "with",
+}
+
+# Lookup results go stale when a sync changes the endpoints; query embeddings do not
+_metadata_cache = get_cache("metadata_lookup", ttl=CACHE_TTL, invalidate_on=(METADATA_SYNC,))
+_embedding_cache = get_cache("query_embedding", ttl=EMBEDDING_CACHE_TTL)
+_semantic_cache = get_semantic_cache(
+    "metadata_lookup_semantic", SEMANTIC_CACHE_THRESHOLD, maxsize=SEMANTIC_CACHE_SIZE,
+    ttl=CACHE_TTL, invalidate_on=(METADATA_SYNC,)
+)
 
 
 def _get_cache_key(*args) -> str:
     return hashlib.md5(str(args).encode()).hexdigest()
 
 
-def find_endpoint(
-        query: str,
-        source_type: str = "pdok",
-        top_k: int = 1,
-        filter_geojson: bool = False) -> str:
+def canonicalize_query(query: str) -> str:
     """
-    Find the best matching endpoint using vector similarity search.
+    Normalize a search query for cache keys: case-folded, diacritics and punctuation
+    removed, stopwords dropped (unless nothing else is left) and single-spaced.
+    "Bevolking  van Apeldoorn " and "bevolking apeldoorn" both become "bevolking apeldoorn".
+    """
+    text = unicodedata.normalize("NFKD", query.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = re.findall(r"\w+", text)
+    return " ".join([w for w in words if w not in QUERY_STOPWORDS] or words)
 
-    Args:
-        query: The user's query to match against endpoint metadata
-        source_type: "pdok" or "cbs"
-        top_k: Number of results to return
-        filter_geojson: If True, only return GeoJSON-capable endpoints (OGC API Features with /collections)
 
-    Returns:
-        JSON string with endpoint information
-    """
-    import asyncio
+async def get_query_embedding(query: str) -> List[float]:
+    """Embedding of a search query, cached per query text."""
+    cache_key = _get_cache_key(query)
+    query_embedding = _embedding_cache.get(cache_key)
+    if query_embedding is not None:
+        logger.info(f"Embedding cache hit for: {query}")
+        return query_embedding
 
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    query_embedding = await generate_embedding(query)
+    _embedding_cache.set(cache_key, query_embedding)
+    return query_embedding
+
+
+async def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """Embeddings of several search queries; the ones not cached are requested in a single API call."""
+    embeddings = {query: _embedding_cache.get(_get_cache_key(query)) for query in queries}
+
+    missing = [query for query, embedding in embeddings.items() if embedding is None]
+    if missing:
+        for query, embedding in zip(missing, await generate_embeddings_batch(missing)):
+            _embedding_cache.set(_get_cache_key(query), embedding)
+            embeddings[query] = embedding
+
+    return [embeddings[query] for query in queries]
 
-    result = loop.run_until_complete(
-        find_endpoint_async(
-            query,
-            source_type,
-            top_k,
-            filter_geojson))
-    logger.info(result)
-    return result
+
+def _format_endpoint(row, source_type: Optional[str]) -> Dict[str, Any]:
+    """Lookup result for an endpoint row, with the preferred URL to load data from."""
+    extra_metadata = None
+    tiles_url = None
+    collections_url = None
+
+    if row.extra_metadata:
+        extra_metadata = json.loads(row.extra_metadata)
+        tiles_url = extra_metadata.get("tiles_url")
+        collections_url = extra_metadata.get("collections_url")
+
+    preferred_url = tiles_url or collections_url or row.endpoint_url
+
+    return {
+        "url": row.endpoint_url,
+        "title": row.title,
+        "description": row.description,
+        "api_type": row.api_type,
+        "source": source_type,
+        "extra_metadata": extra_metadata,
+        "tiles_url": tiles_url,
+        "collections_url": collections_url,
+        "preferred_url": preferred_url,
+        "distance": row.distance
+    }
 
 
 async def find_endpoint_async(
         query: str,
         source_type: str = "pdok",
         top_k: int = 1,
-        filter_geojson: bool = False) -> str:
-    """
-    Async version of find_endpoint with caching.
+        filter_geojson: bool = False,
+        search_mode: Optional[str] = None) -> str:
     """
-    import json
+    Find the best matching endpoint using vector similarity and/or full-text search.
 
-    cache_key = _get_cache_key(query, source_type, top_k, filter_geojson)
-    current_time = time.time()
+    Args:
+        query: The user's query to match against endpoint metadata
+        source_type: "pdok" or "cbs"
+        top_k: Number of results to return
+        filter_geojson: If True, only return GeoJSON-capable endpoints (OGC API Features with /collections)
+        search_mode: "vector", "hybrid" or "lexical", defaults to METADATA_SEARCH_MODE
 
-    if cache_key in _metadata_cache:
-        cached_result, cached_time = _metadata_cache[cache_key]
-        if current_time - cached_time < CACHE_TTL:
-            logger.info(f"Cache hit for: {query}")
-            return cached_result
+    Returns:
+        JSON string with endpoint information
 
-    session = get_metadata_session()
+    Results are cached. Database queries use the async metadata engine, so concurrent lookups
+    do not block the event loop. Vector searches are answered from the memory index instead,
+    when it is enabled and loaded.
+    """
+    search_mode = get_search_mode(search_mode)
+    canonical_query = canonicalize_query(query) or query
+    cache_key = _get_cache_key(canonical_query, source_type, top_k, filter_geojson, search_mode)
+    cached_result = _metadata_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info(f"Cache hit for: {query}")
+        return cached_result
+
+    # The session only connects once it is used
+    session = get_async_metadata_session()
+    memory_index = get_memory_index() if search_mode == "vector" else None
 
     try:
-        source = session.exec(select(MetadataSource).where(
-            MetadataSource.source_type == source_type)).first()
+        if memory_index is not None:
+            source_id = memory_index.source_ids_by_type.get(source_type)
+        else:
+            source = (await session.exec(select(MetadataSource).where(
+                MetadataSource.source_type == source_type))).first()
+            source_id = source.id if source else None
 
-        if not source:
+        if source_id is None:
             result = json.dumps({
                 "error": f"No metadata source found for {source_type}",
                 "url": None,
@@ -86,49 +157,47 @@ async def find_endpoint_async(
                 "description": None,
                 "api_type": None
             })
-            _metadata_cache[cache_key] = (result, current_time)
+            _metadata_cache.set(cache_key, result)
             return result
 
-        emb_cache_key = f"emb_{query}_{source_type}"
-        if emb_cache_key in _embedding_cache:
-            query_embedding, emb_time = _embedding_cache[emb_cache_key]
-            if current_time - emb_time < CACHE_TTL:
-                logger.info(f"Embedding cache hit for: {query}")
-        else:
-            query_embedding = await generate_embedding(query)
-            _embedding_cache[emb_cache_key] = (query_embedding, current_time)
-
-        from sqlalchemy import text
-
-        embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-
-        if filter_geojson and source_type == "pdok":
-            sql = text("""
-                SELECT id, source_id, endpoint_url, title, description, api_type, extra_metadata,
-                       embedding <=> cast(:embedding_str as vector) as distance
-                FROM metadata_endpoint
-                WHERE source_id = :source_id
-                  AND endpoint_url LIKE '%/ogc/%'
-                ORDER BY embedding <=> cast(:embedding_str as vector)
-                LIMIT :top_k
-            """)
+        embedding_str = None
+        query_embedding = None
+        semantic_key = _get_cache_key(source_type, top_k, filter_geojson, search_mode)
+        # Hybrid and lexical results depend on the exact keywords ("CBS 2021" vs "CBS 2023"),
+        # so only vector results are shared between queries with similar embeddings
+        use_semantic_cache = search_mode == "vector" and SEMANTIC_CACHE_THRESHOLD > 0
+        if search_mode != "lexical":
+            # Embed the query as typed; the canonical form only keys the cache
+            query_embedding = await get_query_embedding(query)
+            embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
+
+            if use_semantic_cache:
+                cached_result = _semantic_cache.lookup(semantic_key, query_embedding)
+                if cached_result is not None:
+                    logger.info(f"Semantic cache hit for: {query}")
+                    _metadata_cache.set(cache_key, cached_result)
+                    return cached_result
+
+        ogc_only = filter_geojson and source_type == "pdok"
+        if memory_index is not None:
+            rows = memory_index.search(query_embedding, top_k, source_id, ogc_only)
         else:
-            sql = text("""
-                SELECT id, source_id, endpoint_url, title, description, api_type, extra_metadata,
-                       embedding <=> cast(:embedding_str as vector) as distance
-                FROM metadata_endpoint
-                WHERE source_id = :source_id
-                ORDER BY embedding <=> cast(:embedding_str as vector)
-                LIMIT :top_k
-            """)
-
-        result = session.execute(sql, {
-            "embedding_str": embedding_str,
-            "source_id": source.id,
-            "top_k": top_k
-        })
-
-        rows = result.fetchall()
+            # The filters match the predicates of the partial vector indexes of the source and of OGC endpoints
+            where = f"{get_source_filter(source_id, 'e.source_id')} AND e.deleted_at IS NULL"
+            if ogc_only:
+                where += " AND e.is_ogc"
+
+            # run_sync() runs the shared search code on the session's asyncpg connection without blocking.
+            # The full-text side gets the query as typed, the text search configuration normalizes it itself.
+            rows = await session.run_sync(
+                search_endpoints,
+                "e.id, e.source_id, e.endpoint_url, e.title, e.description, e.api_type, e.extra_metadata",
+                where,
+                query,
+                embedding_str,
+                top_k,
+                search_mode
+            )
 
         if not rows:
             return json.dumps({
@@ -139,38 +208,16 @@ async def find_endpoint_async(
                 "api_type": None
             })
 
-        results = []
-        for row in rows:
-            extra_metadata = None
-            tiles_url = None
-            collections_url = None
-
-            if row.extra_metadata:
-                extra_metadata = json.loads(row.extra_metadata)
-                tiles_url = extra_metadata.get("tiles_url")
-                collections_url = extra_metadata.get("collections_url")
-
-            preferred_url = tiles_url or collections_url or row.endpoint_url
-
-            results.append({
-                "url": row.endpoint_url,
-                "title": row.title,
-                "description": row.description,
-                "api_type": row.api_type,
-                "source": source_type,
-                "extra_metadata": extra_metadata,
-                "tiles_url": tiles_url,
-                "collections_url": collections_url,
-                "preferred_url": preferred_url,
-                "distance": row.distance
-            })
+        results = [_format_endpoint(row, source_type) for row in rows]
 
         if top_k == 1:
             result = json.dumps(results[0])
         else:
             result = json.dumps({"results": results, "count": len(results)})
 
-        _metadata_cache[cache_key] = (result, current_time)
+        _metadata_cache.set(cache_key, result)
+        if use_semantic_cache:
+            _semantic_cache.store(semantic_key, query_embedding, result)
         return result
 
     except Exception as e:
@@ -184,74 +231,51 @@ async def find_endpoint_async(
             "results": [] if top_k > 1 else None
         })
     finally:
-        session.close()
-
-
-def search_metadata(
-        query: str,
-        source_type: Optional[str] = None,
-        limit: int = 10) -> List[dict]:
-    """
-    Search metadata endpoints (synchronous version for API endpoints).
-    """
-    import asyncio
-
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-    return loop.run_until_complete(
-        search_metadata_async(
-            query, source_type, limit))
+        await session.close()
 
 
 async def search_metadata_async(
         query: str,
         source_type: Optional[str] = None,
-        limit: int = 10) -> List[dict]:
+        limit: int = 10,
+        search_mode: Optional[str] = None) -> List[dict]:
     """
-    Search metadata endpoints.
+    Search metadata endpoints in the given search mode ("vector", "hybrid" or "lexical").
     """
-    session = get_metadata_session()
+    search_mode = get_search_mode(search_mode)
+    session = get_async_metadata_session()
+    memory_index = get_memory_index() if search_mode == "vector" else None
 
     try:
-        query_embedding = await generate_embedding(query)
-
-        from sqlalchemy import text
-
-        embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-
-        if source_type:
-            sql = text("""
-                SELECT e.id, e.endpoint_url, e.title, e.description, e.api_type,
-                       s.name as source_name, s.source_type,
-                       e.embedding <=> cast(:embedding_str as vector) as distance
-                FROM metadata_endpoint e
-                JOIN metadata_source s ON e.source_id = s.id
-                WHERE s.source_type = :source_type
-                ORDER BY e.embedding <=> cast(:embedding_str as vector)
-                LIMIT :limit
-            """)
-            result = session.execute(sql,
-                                     {"embedding_str": embedding_str,
-                                      "source_type": source_type,
-                                      "limit": limit})
+        embedding_str = None
+        if search_mode != "lexical":
+            query_embedding = await get_query_embedding(query)
+            embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
+
+        if memory_index is not None:
+            source_id = memory_index.source_ids_by_type.get(source_type) if source_type else None
+            if source_type and source_id is None:
+                return []
+            rows = memory_index.search(query_embedding, limit, source_id)
         else:
-            sql = text("""
-                SELECT e.id, e.endpoint_url, e.title, e.description, e.api_type,
-                       s.name as source_name, s.source_type,
-                       e.embedding <=> cast(:embedding_str as vector) as distance
-                FROM metadata_endpoint e
-                JOIN metadata_source s ON e.source_id = s.id
-                ORDER BY e.embedding <=> cast(:embedding_str as vector)
-                LIMIT :limit
-            """)
-            result = session.execute(
-                sql, {"embedding_str": embedding_str, "limit": limit})
-
-        rows = result.fetchall()
+            where = "e.deleted_at IS NULL"
+            if source_type:
+                source = (await session.exec(select(MetadataSource).where(
+                    MetadataSource.source_type == source_type))).first()
+                if not source:
+                    return []
+                where += f" AND {get_source_filter(source.id, 'e.source_id')}"
+
+            rows = await session.run_sync(
+                search_endpoints,
+                "e.id, e.endpoint_url, e.title, e.description, e.api_type, s.name as source_name, s.source_type",
+                where,
+                query,
+                embedding_str,
+                limit,
+                search_mode,
+                joins="JOIN metadata_source s ON e.source_id = s.id"
+            )
 
         results = []
         for row in rows:
@@ -272,4 +296,71 @@ async def search_metadata_async(
         logger.error(f"Error searching metadata: {e}")
         return []
     finally:
-        session.close()
+        await session.close()
+
+
+async def search_metadata_batch_async(
+        queries: List[Dict[str, Any]],
+        limit: int = 5) -> List[List[dict]]:
+    """
+    Vector search for several queries at once, each a dict with "query" and optionally
+    "source_type" and "filter_geojson". The queries are embedded in one API call and searched
+    in one SQL statement, or one matrix product on the memory index.
+    Returns the results of each query, in order.
+    """
+    session = get_async_metadata_session()
+    memory_index = get_memory_index()
+
+    try:
+        embeddings = await get_query_embeddings([q["query"] for q in queries])
+
+        source_types = {q["source_type"] for q in queries if q.get("source_type")}
+        if memory_index is not None:
+            source_ids = {t: memory_index.source_ids_by_type.get(t) for t in source_types}
+        else:
+            sources = (await session.exec(select(MetadataSource).where(
+                MetadataSource.source_type.in_(source_types)))).all() if source_types else []
+            source_ids = {source.source_type: source.id for source in sources}
+
+        # (query index, source id, OGC only) of the queries whose source exists
+        searches = []
+        for i, q in enumerate(queries):
+            source_type = q.get("source_type")
+            if source_type and source_ids.get(source_type) is None:
+                continue
+            searches.append((i, source_ids.get(source_type), bool(q.get("filter_geojson")) and source_type == "pdok"))
+
+        if memory_index is not None:
+            rows = memory_index.search_batch(
+                [embeddings[i] for i, _, _ in searches], limit,
+                [(source_id, ogc_only) for _, source_id, ogc_only in searches]
+            )
+        else:
+            filters = []
+            for i, source_id, ogc_only in searches:
+                where = "e.deleted_at IS NULL"
+                if source_id is not None:
+                    where = f"{get_source_filter(source_id, 'e.source_id')} AND {where}"
+                if ogc_only:
+                    where += " AND e.is_ogc"
+                filters.append((where, "[" + ",".join(str(x) for x in embeddings[i]) + "]"))
+
+            rows = await session.run_sync(
+                vector_search_batch,
+                "e.id, e.source_id, e.endpoint_url, e.title, e.description, e.api_type, e.extra_metadata, "
+                "s.name as source_name, s.source_type",
+                filters,
+                limit,
+                joins="JOIN metadata_source s ON e.source_id = s.id"
+            )
+
+        results: List[List[dict]] = [[] for _ in queries]
+        for (i, _, _), query_rows in zip(searches, rows):
+            results[i] = [
+                {"id": row.id, "source_name": row.source_name, **_format_endpoint(row, row.source_type)}
+                for row in query_rows
+            ]
+        return results
+
+    finally:
+        await session.close()
@@ -0,0 +1,506 @@
+import logging
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import text
+
+from backend.database_metadata import metadata_engine
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = "ix_metadata_endpoint_embedding"
+EMBEDDING_DIMENSIONS = 1536
+
+METADATA_VECTOR_INDEX = os.environ.get("METADATA_VECTOR_INDEX", "hnsw").lower()  # "hnsw", "ivfflat" or "none"
+METADATA_HNSW_M = int(os.environ.get("METADATA_HNSW_M", "16"))
+METADATA_HNSW_EF_CONSTRUCTION = int(os.environ.get("METADATA_HNSW_EF_CONSTRUCTION", "64"))
+METADATA_HNSW_EF_SEARCH = int(os.environ.get("METADATA_HNSW_EF_SEARCH", "100"))
+METADATA_IVFFLAT_PROBES = int(os.environ.get("METADATA_IVFFLAT_PROBES", "10"))
+# Let filtered index scans continue until enough rows pass the filter (pgvector 0.8+), "off" to disable
+METADATA_ITERATIVE_SCAN = os.environ.get("METADATA_ITERATIVE_SCAN", "strict_order")
+# Index a compact copy of the embeddings ("halfvec" or "binary", pgvector 0.7+) and re-rank
+# the first METADATA_RERANK_FACTOR * limit candidates of an index scan on the full vectors
+METADATA_VECTOR_QUANTIZATION = os.environ.get("METADATA_VECTOR_QUANTIZATION", "none").lower()
+METADATA_RERANK_FACTOR = int(os.environ.get("METADATA_RERANK_FACTOR", "4"))
+# Rebuild the index after a sync that re-embedded or removed at least this fraction of the endpoints
+METADATA_REINDEX_THRESHOLD = float(os.environ.get("METADATA_REINDEX_THRESHOLD", "0.2"))
+# Advisory lock key held while the vector indexes are maintained, so workers and syncs
+# do not build and rename the same indexes at the same time
+VECTOR_INDEX_LOCK_KEY = 0x6C6F6B69
+# Endpoint searches rank by embedding similarity ("vector"), full-text match ("lexical"),
+# or both fused with reciprocal rank fusion ("hybrid"). Only vector searches are answered from
+# the memory index and the semantic lookup cache, so hybrid is opt-in.
+METADATA_SEARCH_MODE = os.environ.get("METADATA_SEARCH_MODE", "vector").lower()
+METADATA_RRF_K = int(os.environ.get("METADATA_RRF_K", "60"))
+METADATA_HYBRID_CANDIDATES = int(os.environ.get("METADATA_HYBRID_CANDIDATES", "50"))
+
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+# Must match the text search configuration of the search_tsv column
+TEXT_SEARCH_CONFIG = "dutch"
+# Any word of the query may match, rather than all of them as with plainto_tsquery()
+LEXICAL_QUERY = f"replace(plainto_tsquery('{TEXT_SEARCH_CONFIG}', :query)::text, ' & ', ' | ')::tsquery"
+
+# Indexed expression, operator class and distance operator per quantization
+QUANTIZATIONS = {
+    "none": ("embedding", "vector_cosine_ops", "<=>", "cast({query} as vector)"),
+    "halfvec": (
+        f"(embedding::halfvec({EMBEDDING_DIMENSIONS}))", "halfvec_cosine_ops", "<=>",
+        f"cast({{query}} as halfvec({EMBEDDING_DIMENSIONS}))"
+    ),
+    "binary": (
+        f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS}))", "bit_hamming_ops", "<~>",
+        "binary_quantize(cast({query} as vector))"
+    ),
+}
+
+_pgvector_version: Optional[Tuple[int, ...]] = None
+_quantization: Optional[str] = None
+
+
+@dataclass
+class VectorIndexSpec:
+    """A vector index on metadata_endpoint.embedding, optionally partial."""
+    name: str
+    predicate: Optional[str] = None
+    source_id: Optional[int] = None  # set for the partial index of a single source
+
+
+def get_vector_index_specs(conn) -> List[VectorIndexSpec]:
+    """
+    The vector indexes to maintain: a global one, a partial one per source, and a partial one
+    for the OGC endpoints of sources that have them. Searches filter on these predicates with
+    literal values, so the planner can use the partial index instead of post-filtering the global one.
+    """
+    specs = [VectorIndexSpec(VECTOR_INDEX_NAME)]
+
+    sources = conn.execute(text("""
+        SELECT s.id, s.source_type,
+               EXISTS (SELECT 1 FROM metadata_endpoint e WHERE e.source_id = s.id AND e.is_ogc) AS has_ogc
+        FROM metadata_source s
+        ORDER BY s.id
+    """)).fetchall()
+
+    for source_id, source_type, has_ogc in sources:
+        name = f"{VECTOR_INDEX_NAME}_{re.sub(r'[^a-z0-9]+', '_', source_type.lower())}_{source_id}"
+        source_filter = get_source_filter(source_id)
+
+        specs.append(VectorIndexSpec(name, f"{source_filter} AND deleted_at IS NULL", source_id))
+        if has_ogc:
+            specs.append(VectorIndexSpec(f"{name}_ogc", f"{source_filter} AND is_ogc AND deleted_at IS NULL", source_id))
+
+    return specs
+
+
+def get_source_filter(source_id: int, column: str = "source_id") -> str:
+    """
+    SQL filter on a source with the id inlined as a literal; a bound parameter would not
+    match the predicate of the source's partial index.
+    """
+    return f"{column} = {int(source_id)}"
+
+
+def get_ivfflat_lists(row_count: int) -> int:
+    """Number of IVFFlat lists recommended by pgvector: rows / 1000, at least 10."""
+    return max(10, row_count // 1000)
+
+
+def get_vector_index_options(method: str, row_count: int = 0) -> Dict[str, int]:
+    if method == "hnsw":
+        return {"m": METADATA_HNSW_M, "ef_construction": METADATA_HNSW_EF_CONSTRUCTION}
+    if method == "ivfflat":
+        return {"lists": get_ivfflat_lists(row_count)}
+    raise ValueError(f"Unknown vector index method: {method}")
+
+
+def get_vector_index_sql(
+        name: str,
+        method: str,
+        row_count: int = 0,
+        predicate: Optional[str] = None,
+        quantization: str = "none") -> str:
+    """CREATE INDEX statement for a cosine distance index on metadata_endpoint.embedding."""
+    expression, opclass, _, _ = QUANTIZATIONS[quantization]
+    options = ", ".join(f"{key} = {value}" for key, value in get_vector_index_options(method, row_count).items())
+    sql = (
+        f"CREATE INDEX CONCURRENTLY {name} ON metadata_endpoint "
+        f"USING {method} ({expression} {opclass}) WITH ({options})"
+    )
+    if predicate:
+        sql += f" WHERE {predicate}"
+    return sql
+
+
+def get_index_definitions(conn) -> Dict[str, str]:
+    """Definitions of the existing vector indexes, by name."""
+    rows = conn.execute(
+        text("SELECT indexname, indexdef FROM pg_indexes WHERE indexname LIKE :prefix"),
+        {"prefix": f"{VECTOR_INDEX_NAME}%"}
+    ).fetchall()
+    return {name: indexdef for name, indexdef in rows}
+
+
+def index_matches(indexdef: Optional[str], method: str, row_count: int = 0, quantization: str = "none") -> bool:
+    """Whether an existing index definition uses the configured method, quantization and build options."""
+    if not indexdef or f"USING {method} " not in indexdef or f" {QUANTIZATIONS[quantization][1]})" not in indexdef:
+        return False
+    if method == "ivfflat":
+        # The list count follows the table size; only rebuild_vector_index() recomputes it
+        return True
+    return all(f"{key}='{value}'" in indexdef for key, value in get_vector_index_options(method, row_count).items())
+
+
+def build_vector_index(conn, method: str, spec: VectorIndexSpec, quantization: str = "none") -> None:
+    """
+    (Re)build a vector index without blocking searches or syncs: a new index is built
+    concurrently next to the old one, which is then dropped and replaced.
+    """
+    new_name = f"{spec.name}_new"
+    row_count = conn.execute(text(
+        f"SELECT count(*) FROM metadata_endpoint WHERE embedding IS NOT NULL"
+        f"{' AND ' + spec.predicate if spec.predicate else ''}"
+    )).scalar()
+
+    logger.info(f"Building {method} index {spec.name} ({quantization} quantization) over {row_count} embeddings")
+
+    # A failed concurrent build leaves an invalid index behind
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))
+    conn.execute(text(get_vector_index_sql(new_name, method, row_count, spec.predicate, quantization)))
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {spec.name}"))
+    conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {spec.name}"))
+
+
+@contextmanager
+def vector_index_lock(conn, wait: bool = True):
+    """
+    Hold the advisory lock for vector index maintenance on `conn` (an autocommit connection).
+    Yields whether the lock was taken; without `wait`, it is not taken while another process holds it.
+    """
+    function = "pg_advisory_lock" if wait else "pg_try_advisory_lock"
+    result = conn.execute(text(f"SELECT {function}(:key)"), {"key": VECTOR_INDEX_LOCK_KEY}).scalar()
+    locked = True if wait else bool(result)
+    try:
+        yield locked
+    finally:
+        if locked:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": VECTOR_INDEX_LOCK_KEY})
+
+
+def ensure_vector_index() -> None:
+    """
+    Create the vector indexes on metadata_endpoint.embedding that are missing or were built
+    with other settings than the configured METADATA_VECTOR_INDEX method and options,
+    and drop the partial indexes of sources that no longer exist.
+    Skipped when another process is already maintaining the indexes.
+    """
+    method = METADATA_VECTOR_INDEX
+
+    with metadata_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn, \
+            vector_index_lock(conn, wait=False) as locked:
+        if not locked:
+            logger.info("Vector indexes are being maintained by another process, skipping")
+            return
+
+        quantization = get_quantization(conn)
+        existing = get_index_definitions(conn)
+        specs = [] if method == "none" else get_vector_index_specs(conn)
+        wanted = {spec.name for spec in specs}
+
+        for name in existing:
+            if name not in wanted:
+                logger.info(f"Dropping vector index {name}")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+        for spec in specs:
+            if not index_matches(existing.get(spec.name), method, quantization=quantization):
+                build_vector_index(conn, method, spec, quantization)
+
+
+def rebuild_vector_index(source_id: Optional[int] = None) -> None:
+    """
+    Rebuild the vector indexes, e.g. to recompute IVFFlat lists or drop HNSW entries of deleted rows.
+    With `source_id`, the partial index of other sources is left alone.
+    Waits for other processes that are maintaining the indexes.
+    """
+    if METADATA_VECTOR_INDEX == "none":
+        return
+
+    with metadata_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn, \
+            vector_index_lock(conn):
+        quantization = get_quantization(conn)
+        for spec in get_vector_index_specs(conn):
+            if source_id is not None and spec.source_id not in (None, source_id):
+                continue
+            build_vector_index(conn, METADATA_VECTOR_INDEX, spec, quantization)
+
+
+def rebuild_vector_index_after_sync(source_id: int, changed: int) -> bool:
+    """
+    Make sure the source has its partial index, and rebuild the indexes when a sync re-embedded
+    or removed at least METADATA_REINDEX_THRESHOLD of the source's endpoints.
+    Uses its own connections, so it can run in a thread; the sync must have committed its changes.
+    Returns whether the indexes were rebuilt.
+    """
+    if METADATA_VECTOR_INDEX == "none":
+        return False
+
+    try:
+        with metadata_engine.connect() as conn:
+            total = conn.execute(text(
+                f"SELECT count(*) FROM metadata_endpoint WHERE {get_source_filter(source_id)}"
+            )).scalar()
+
+        if changed and total and changed / total >= METADATA_REINDEX_THRESHOLD:
+            rebuild_vector_index(source_id)
+            return True
+        ensure_vector_index()
+    except Exception as e:
+        logger.warning(f"Error rebuilding vector indexes: {e}")
+    return False
+
+
+def get_pgvector_version(session) -> Tuple[int, ...]:
+    """Installed pgvector version, looked up once per process. Accepts a session or a connection."""
+    global _pgvector_version
+
+    if _pgvector_version is None:
+        version = session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        _pgvector_version = tuple(int(part) for part in re.findall(r"\d+", version or "0"))
+    return _pgvector_version
+
+
+def get_quantization(session) -> str:
+    """
+    The configured METADATA_VECTOR_QUANTIZATION, or "none" if the installed pgvector
+    does not support halfvec and binary_quantize (before 0.7). Looked up once per process.
+    """
+    global _quantization
+
+    if _quantization is None:
+        quantization = METADATA_VECTOR_QUANTIZATION
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+
+        version = get_pgvector_version(session)
+        if quantization != "none" and version < (0, 7):
+            logger.warning(f"pgvector {'.'.join(map(str, version))} does not support {quantization} quantization, using full vectors")
+            quantization = "none"
+        _quantization = quantization
+
+    return _quantization
+
+
+def get_search_settings(limit: int = 1, pgvector_version: Tuple[int, ...] = ()) -> Dict[str, Any]:
+    """Per-query planner settings for the vector index, so an index scan can return `limit` results."""
+    iterative_scan = METADATA_ITERATIVE_SCAN != "off" and pgvector_version >= (0, 8)
+
+    if METADATA_VECTOR_INDEX == "hnsw":
+        settings = {"hnsw.ef_search": max(METADATA_HNSW_EF_SEARCH, limit)}
+        if iterative_scan:
+            settings["hnsw.iterative_scan"] = METADATA_ITERATIVE_SCAN
+        return settings
+    if METADATA_VECTOR_INDEX == "ivfflat":
+        settings = {"ivfflat.probes": METADATA_IVFFLAT_PROBES}
+        if iterative_scan:
+            # IVFFlat only supports relaxed ordering
+            settings["ivfflat.iterative_scan"] = "relaxed_order"
+        return settings
+    return {}
+
+
+def apply_search_settings(session, limit: int = 1) -> None:
+    """Set the vector index search settings for the session's current transaction only."""
+    for name, value in get_search_settings(limit, get_pgvector_version(session)).items():
+        session.execute(text("SELECT set_config(:name, :value, true)"), {"name": name, "value": str(value)})
+
+
+def get_vector_search_sql(
+        columns: str,
+        where: str,
+        quantization: str = "none",
+        joins: str = "",
+        limit_param: str = "limit",
+        candidates_param: str = "candidates",
+        query_embedding: str = ":embedding_str") -> str:
+    """
+    Top-k cosine distance query over metadata_endpoint `e` (plus `joins`), returning `columns`
+    plus the exact `distance` to `query_embedding` (a vector literal). With quantization, the index
+    is scanned on the quantized expression for :candidates rows, which are then re-ranked on the
+    full vectors to return :limit rows.
+    """
+    distance = f"e.embedding <=> cast({query_embedding} as vector)"
+    from_clause = f"metadata_endpoint e {joins}".rstrip()
+
+    if quantization == "none":
+        return (
+            f"SELECT {columns}, {distance} AS distance FROM {from_clause} "
+            f"WHERE {where} ORDER BY {distance} LIMIT :{limit_param}"
+        )
+
+    expression, _, operator, query = QUANTIZATIONS[quantization]
+    first_pass = (
+        f"{expression.replace('embedding', 'e.embedding')} {operator} "
+        f"{query.format(query=query_embedding)}"
+    )
+    return (
+        f"SELECT * FROM ("
+        f"SELECT {columns}, {distance} AS distance FROM {from_clause} "
+        f"WHERE {where} ORDER BY {first_pass} LIMIT :{candidates_param}"
+        f") candidates ORDER BY distance LIMIT :{limit_param}"
+    )
+
+
+def get_batch_vector_search_sql(
+        columns: str,
+        groups: List[Tuple[str, List[int]]],
+        quantization: str = "none",
+        joins: str = "") -> str:
+    """
+    A single statement for several top-k vector searches. Per group of queries sharing a `where`
+    filter, the search is LATERAL joined to a VALUES list of the query embeddings (:embedding_<i>),
+    so each filter can still use its partial index. Rows have the `query_index` plus `columns`
+    and the `distance`.
+    """
+    parts = []
+    for where, indexes in groups:
+        values = ", ".join(f"({i}, :embedding_{i})" for i in indexes)
+        search = get_vector_search_sql(columns, where, quantization, joins, query_embedding="q.embedding")
+        parts.append(
+            f"SELECT q.query_index, r.* FROM (VALUES {values}) AS q(query_index, embedding) "
+            f"CROSS JOIN LATERAL ({search}) r"
+        )
+    return " UNION ALL ".join(parts) + " ORDER BY query_index, distance"
+
+
+def get_lexical_search_sql(columns: str, where: str, joins: str = "", limit_param: str = "limit") -> str:
+    """
+    Full-text query over metadata_endpoint `e` (plus `joins`) on the weighted search_tsv column,
+    returning `columns` plus the `text_rank`. Any of the query's words may match; endpoints
+    matching more of them, or matching them in the title, rank higher.
+    """
+    return (
+        f"SELECT {columns}, ts_rank_cd(e.search_tsv, q.query) AS text_rank "
+        f"FROM metadata_endpoint e {joins} CROSS JOIN (SELECT {LEXICAL_QUERY} AS query) q "
+        f"WHERE {where} AND e.search_tsv @@ q.query ORDER BY text_rank DESC LIMIT :{limit_param}"
+    )
+
+
+def get_hybrid_search_sql(columns: str, where: str, quantization: str = "none", joins: str = "") -> str:
+    """
+    Reciprocal rank fusion of the top :candidates of the vector and the full-text search:
+    each endpoint scores 1 / (:rrf_k + rank) per ranking it appears in. Returns `columns`
+    plus the exact `distance` and the fused `score` for the best :limit endpoints.
+    """
+    semantic = get_vector_search_sql("e.id", where, quantization, limit_param="candidates", candidates_param="first_pass")
+    lexical = get_lexical_search_sql("e.id", where, limit_param="candidates")
+    return (
+        f"WITH semantic AS ("
+        f"SELECT id, row_number() OVER (ORDER BY distance) AS rank FROM ({semantic}) v"
+        f"), lexical AS ("
+        f"SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank FROM ({lexical}) l"
+        f"), fused AS ("
+        f"SELECT coalesce(semantic.id, lexical.id) AS id, "
+        f"coalesce(1.0 / (:rrf_k + semantic.rank), 0) + coalesce(1.0 / (:rrf_k + lexical.rank), 0) AS score "
+        f"FROM semantic FULL OUTER JOIN lexical ON semantic.id = lexical.id"
+        f") "
+        f"SELECT {columns}, e.embedding <=> cast(:embedding_str as vector) AS distance, fused.score "
+        f"FROM fused JOIN metadata_endpoint e ON e.id = fused.id {joins} "
+        f"ORDER BY fused.score DESC, distance LIMIT :limit"
+    )
+
+
+def get_search_mode(mode: Optional[str] = None) -> str:
+    """The requested search mode, or the configured METADATA_SEARCH_MODE."""
+    mode = (mode or METADATA_SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    return mode
+
+
+def vector_search(
+        session,
+        columns: str,
+        where: str,
+        embedding_str: str,
+        limit: int,
+        joins: str = "") -> List[Any]:
+    """Run a top-k vector search with the configured index settings and quantization."""
+    quantization = get_quantization(session)
+    candidates = limit * METADATA_RERANK_FACTOR if quantization != "none" else limit
+
+    apply_search_settings(session, candidates)
+    sql = get_vector_search_sql(columns, where, quantization, joins)
+    return session.execute(
+        text(sql),
+        {"embedding_str": embedding_str, "limit": limit, "candidates": candidates}
+    ).fetchall()
+
+
+def vector_search_batch(
+        session,
+        columns: str,
+        searches: List[Tuple[str, str]],
+        limit: int,
+        joins: str = "") -> List[List[Any]]:
+    """
+    Run top-k vector searches for several (where, embedding_str) pairs in one statement.
+    Returns the rows of each search, in the order of `searches`.
+    """
+    if not searches:
+        return []
+
+    quantization = get_quantization(session)
+    candidates = limit * METADATA_RERANK_FACTOR if quantization != "none" else limit
+
+    groups: Dict[str, List[int]] = {}
+    for i, (where, _) in enumerate(searches):
+        groups.setdefault(where, []).append(i)
+
+    apply_search_settings(session, candidates)
+    sql = get_batch_vector_search_sql(columns, list(groups.items()), quantization, joins)
+    params = {f"embedding_{i}": embedding_str for i, (_, embedding_str) in enumerate(searches)}
+    rows = session.execute(text(sql), {**params, "limit": limit, "candidates": candidates}).fetchall()
+
+    results: List[List[Any]] = [[] for _ in searches]
+    for row in rows:
+        results[row.query_index].append(row)
+    return results
+
+
+def search_endpoints(
+        session,
+        columns: str,
+        where: str,
+        query: str,
+        embedding_str: Optional[str],
+        limit: int,
+        mode: Optional[str] = None,
+        joins: str = "") -> List[Any]:
+    """
+    Top-k endpoint search over metadata_endpoint `e` in the given search mode. Rows have `columns`
+    plus `distance` (None for lexical searches). Lexical searches need no `embedding_str`.
+    """
+    mode = get_search_mode(mode)
+
+    if mode == "vector":
+        return vector_search(session, columns, where, embedding_str, limit, joins)
+
+    if mode == "lexical":
+        sql = get_lexical_search_sql(f"{columns}, NULL AS distance", where, joins)
+        return session.execute(text(sql), {"query": query, "limit": limit}).fetchall()
+
+    quantization = get_quantization(session)
+    candidates = max(METADATA_HYBRID_CANDIDATES, limit)
+    first_pass = candidates * METADATA_RERANK_FACTOR if quantization != "none" else candidates
+
+    apply_search_settings(session, first_pass)
+    sql = get_hybrid_search_sql(columns, where, quantization, joins)
+    return session.execute(text(sql), {
+        "embedding_str": embedding_str,
+        "query": query,
+        "limit": limit,
+        "candidates": candidates,
+        "first_pass": first_pass,
+        "rrf_k": METADATA_RRF_K,
+    }).fetchall()
@@ -132,23 +132,77 @@ window.addEventListener('resize', () => {
     });
 });
 
+// /history returns pages of at most HISTORY_PAGE_SIZE messages; older pages are loaded on request
+const HISTORY_PAGE_SIZE = 50;
+let oldestHistoryId = null;
+
+async function fetchHistoryPage(before = null) {
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+    if (before !== null) {
+        params.set("before", before);
+    }
+    const response = await fetch(`/history?${params}`, {
+        headers: { "x-forwarded-user": username }
+    });
+    return await response.json();
+}
+
+function updateLoadEarlierButton(history) {
+    let button = document.getElementById("load-earlier");
+    if (history.length > 0) {
+        oldestHistoryId = history[0].id;
+    }
+    if (history.length < HISTORY_PAGE_SIZE) {
+        if (button) button.remove();
+        return;
+    }
+    if (!button) {
+        button = document.createElement("button");
+        button.id = "load-earlier";
+        button.className = "related-bubble load-earlier";
+        button.textContent = "Eerdere berichten laden";
+        button.onclick = loadEarlierHistory;
+    }
+    historyDiv.prepend(button);
+}
+
 async function loadHistory() {
     try {
-        const response = await fetch("/history", {
-            headers: { "x-forwarded-user": username }
-        });
-        const history = await response.json();
+        const history = await fetchHistoryPage();
 
         historyDiv.innerHTML = "";
+        oldestHistoryId = null;
         history.forEach(msg => {
             appendMessage(msg.role, msg.content);
         });
+        updateLoadEarlierButton(history);
         scrollToBottom();
     } catch (e) {
         console.error("Failed to load history", e);
     }
 }
 
+async function loadEarlierHistory() {
+    try {
+        const history = await fetchHistoryPage(oldestHistoryId);
+        const button = document.getElementById("load-earlier");
+        const firstMessage = button ? button.nextSibling : historyDiv.firstChild;
+        const previousHeight = historyDiv.scrollHeight;
+
+        // appendMessage adds at the bottom; move each message above the ones already shown
+        history.forEach(msg => {
+            appendMessage(msg.role, msg.content);
+            historyDiv.insertBefore(historyDiv.lastElementChild, firstMessage);
+        });
+        updateLoadEarlierButton(history);
+
+        // Keep the messages the user was looking at in place
+        historyDiv.scrollTop = historyDiv.scrollHeight - previousHeight;
+    } catch (e) {
+        console.error("Failed to load earlier history", e);
+    }
+}
+
 // Helper to initialize drag-and-drop for post-its
 function makeDraggable(element, handle = element) {
     let initialX = 0, initialY = 0;
@@ -871,7 +925,7 @@ function appendMessage(role, content, execResult=null, related=[], extraData={})
             { key: 'reasoning', icon: 'R', title: 'Reasoning', content: extraData.reasoning || 'No reasoning available', color: '#00695C' },
             { key: 'error', icon: 'X', title: 'Error', content: extraData.error || 'No error', color: '#D32F2F', showOnlyWhenSet: true },
             { key: 'explain', icon: 'i', title: 'Explain', content: 'Explain placeholder: This feature provides additional context about the response.', color: '#00529B' },
-            { key: 'usage', icon: 'U', title: 'Usage', content: extraData.usage ? `Input: ${extraData.usage.input_tokens} tokens\nOutput: ${extraData.usage.output_tokens} tokens\nTotal: ${extraData.usage.total_tokens} tokens\nRequests: ${extraData.usage.requests}` : 'No usage data', color: '#00529B' }
+            { key: 'usage', icon: 'U', title: 'Usage', content: extraData.usage ? `Input: ${extraData.usage.input_tokens} tokens\nCached input: ${extraData.usage.cache_read_tokens ?? 0} tokens\nOutput: ${extraData.usage.output_tokens} tokens\nTotal: ${extraData.usage.total_tokens} tokens\nRequests: ${extraData.usage.requests}` : 'No usage data', color: '#00529B' }
         ];
 
         const filteredIcons = icons.filter(icon => !icon.showOnlyWhenSet || (icon.showOnlyWhenSet && extraData[icon.key]));
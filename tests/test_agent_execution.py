@@ -68,3 +68,27 @@ async def test_run_agent_execution(db_session):
         assert res["response"]["answer"] == "Here is the execution result."
         assert "related" in res["response"]
         assert res["response"]["related"] == ["Q1?"]
+
+
+@pytest.mark.asyncio
+async def test_run_agent_keeps_user_info_after_static_instructions(db_session):
+    from pydantic_ai.usage import RunUsage
+    from backend.agents.chat import sys_prompt
+
+    soul = Soul(user_id="1", username="test_user", style="detailed", preferences={"lang": "nl"})
+    deps = AgentDeps(user_soul=soul, db_session=db_session, user_id=1)
+
+    with patch('backend.agents.chat.agent.run') as mock_run:
+        class MockResult:
+            output = AgentResponse(answer="Antwoord.")
+            def all_messages(self):
+                return []
+            def usage(self):
+                return RunUsage(requests=1, input_tokens=2000, output_tokens=100, cache_read_tokens=1500)
+        mock_run.return_value = MockResult()
+        res = await run_agent("Test cached prompt", deps)
+
+    assert "test_user" not in sys_prompt() and "detailed" not in sys_prompt()
+    assert mock_run.call_args.kwargs["instructions"].startswith("### User\nUser Preferences: {'lang': 'nl'}. Communication Style: detailed.")
+    assert res["usage"]["cache_read_tokens"] == 1500
+    assert res["usage"]["cache_hit_ratio"] == 0.75
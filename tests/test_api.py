@@ -77,6 +77,43 @@ def test_job_scheduling():
     assert response.status_code == 200
     assert response.json()["status"] == "Job scheduled"
 
+def test_history_pages():
+    init_db()
+
+    with Session(engine) as session:
+        user = User(username="history_page_user", soul_data={})
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        for i in range(5):
+            session.add(ChatHistory(user_id=user.id, role="user", content=f"message {i}"))
+        session.commit()
+
+    headers = {"x-forwarded-user": "history_page_user"}
+
+    latest = client.get("/history", params={"limit": 2}, headers=headers).json()
+    assert [msg["content"] for msg in latest] == ["message 3", "message 4"]
+
+    previous = client.get("/history", params={"limit": 2, "before": latest[0]["id"]}, headers=headers).json()
+    assert [msg["content"] for msg in previous] == ["message 1", "message 2"]
+
+    first = client.get("/history", params={"limit": 2, "before": previous[0]["id"]}, headers=headers).json()
+    assert [msg["content"] for msg in first] == ["message 0"]
+
+    client.delete("/history", headers=headers)
+
+def test_history_database_error_is_an_error_response():
+    init_db()
+
+    with Session(engine) as session:
+        session.add(User(username="history_error_user", soul_data={}))
+        session.commit()
+
+    with patch("backend.api.chat.get_history_statement", side_effect=RuntimeError("database is down")):
+        response = client.get("/history", headers={"x-forwarded-user": "history_error_user"})
+
+    assert response.status_code == 500
+
 if __name__ == "__main__":
     test_chat_flow()
     test_job_scheduling()
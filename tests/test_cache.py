@@ -0,0 +1,122 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from backend import cache
+from backend.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache("test", maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_cache_expires_entries():
+    lru = LRUCache("test", maxsize=10, ttl=60)
+
+    with patch.object(cache.time, "monotonic", return_value=1000.0):
+        lru.set("a", 1)
+    with patch.object(cache.time, "monotonic", return_value=1059.0):
+        assert lru.get("a") == 1
+    with patch.object(cache.time, "monotonic", return_value=1061.0):
+        assert lru.get("a") is None
+
+    stats = lru.stats()
+    assert stats["size"] == 0
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_invalidate_clears_subscribed_caches_and_runs_hooks():
+    hook = MagicMock()
+
+    with patch.object(cache, "_caches", {}), \
+            patch.object(cache, "_invalidate_on", {}), \
+            patch.object(cache, "_invalidation_hooks", {}), \
+            patch.object(cache, "CACHE_REDIS_URL", ""):
+        lookups = cache.get_cache("lookups", invalidate_on=(cache.METADATA_SYNC,))
+        embeddings = cache.get_cache("embeddings")
+        assert cache.get_cache("lookups") is lookups
+
+        lookups.set("q", "result")
+        embeddings.set("q", [0.1])
+        cache.register_invalidation_hook(cache.METADATA_SYNC, hook)
+
+        cache.invalidate(cache.METADATA_SYNC)
+
+        assert lookups.get("q") is None
+        assert embeddings.get("q") == [0.1]
+        assert set(cache.get_cache_stats()) == {"lookups", "embeddings"}
+
+    hook.assert_called_once_with()
+
+
+def test_local_cache_ignores_redis():
+    with patch.object(cache, "_caches", {}), \
+            patch.object(cache, "CACHE_REDIS_URL", "redis://localhost:6379/0"), \
+            patch.object(cache, "get_redis_client", return_value=MagicMock()):
+        assert isinstance(cache.get_cache("users", local=True), cache.LRUCache)
+        assert isinstance(cache.get_cache("lookups"), cache.RedisCache)
+
+
+def test_redis_cache_treats_errors_as_misses():
+    client = MagicMock()
+    client.get.side_effect = ConnectionError("down")
+    shared = cache.RedisCache("test", 10, 60, client)
+
+    assert shared.get("a", "default") == "default"
+
+    client.get.side_effect = None
+    client.get.return_value = b'{"url": "x"}'
+    assert shared.get("a") == {"url": "x"}
+    assert (shared.hits, shared.misses, shared.errors) == (1, 1, 1)
+
+
+def test_semantic_cache_matches_similar_embeddings_per_namespace():
+    semantic = cache.SemanticCache("test", maxsize=10, ttl=60, threshold=0.95)
+    semantic.store("pdok", [1.0, 0.0], "bag")
+
+    assert semantic.lookup("pdok", [0.99, 0.05]) == "bag"
+    assert semantic.lookup("pdok", [0.0, 1.0]) is None
+    assert semantic.lookup("cbs", [1.0, 0.0]) is None
+    assert (semantic.hits, semantic.misses) == (1, 2)
+
+
+def test_semantic_and_key_value_caches_are_not_mixed_up():
+    with patch.object(cache, "_caches", {}), patch.object(cache, "CACHE_REDIS_URL", ""):
+        semantic = cache.get_semantic_cache("similar", 0.9)
+        assert not hasattr(semantic, "get")
+
+        with pytest.raises(TypeError, match="get_semantic_cache"):
+            cache.get_cache("similar")
+
+        cache.get_cache("lookups")
+        with pytest.raises(TypeError, match="get_cache"):
+            cache.get_semantic_cache("lookups", 0.9)
+
+
+def test_cache_backend_missing_a_method_cannot_be_created():
+    class IncompleteCache(cache.Cache):
+        def get(self, key, default=None):
+            return default
+
+        def set(self, key, value):
+            pass
+
+        def clear(self):
+            pass
+
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        IncompleteCache("incomplete", 10, 60)
@@ -0,0 +1,121 @@
+import httpx
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from backend.jobs.fetchers import cbs
+
+
+class FakeClient:
+    """Stands in for SyncHttpClient, answering GETs from a dict of URL to (status, JSON body)."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    async def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers or {}))
+        status, body = self.pages[url]
+        return httpx.Response(status, json=body, headers={"ETag": '"v2"'}, request=httpx.Request("GET", url))
+
+
+def test_get_dataset_version():
+    dataset = {"Identifier": "85039NED", "Modified": "2024-01-01T00:00:00", "Version": 3}
+    assert cbs.get_dataset_version(dataset) == {
+        "modified": "2024-01-01T00:00:00",
+        "observations_modified": None,
+        "version": "3",
+    }
+
+
+@pytest.mark.asyncio
+async def test_fetch_catalog_is_unconditional():
+    client = FakeClient({cbs.get_catalog_page_url(): (200, {"value": []})})
+
+    response = await cbs.fetch_catalog(client)
+
+    assert response.status_code == 200
+    assert client.requests[0][1] == {}
+
+
+@pytest.mark.asyncio
+async def test_iter_catalog_pages_follows_next_link():
+    client = FakeClient({
+        cbs.get_catalog_page_url(): (200, {"value": [{"Identifier": "a"}], "@odata.nextLink": "https://cbs.test/page2"}),
+        "https://cbs.test/page2": (200, {"value": [{"Identifier": "b"}, {"Identifier": "c"}]}),
+    })
+    first = await cbs.fetch_catalog(client)
+
+    pages = [page async for page in cbs.iter_catalog_pages(client, first)]
+
+    assert [[d["Identifier"] for d in datasets] for datasets, _ in pages] == [["a"], ["b", "c"]]
+    assert [next_url for _, next_url in pages] == ["https://cbs.test/page2", None]
+
+
+@pytest.mark.asyncio
+async def test_iter_catalog_pages_falls_back_to_skip():
+    with patch.object(cbs, "CBS_CATALOG_PAGE_SIZE", 2):
+        client = FakeClient({
+            cbs.get_catalog_page_url(page_size=2): (200, {"value": [{"Identifier": "a"}, {"Identifier": "b"}]}),
+            cbs.get_catalog_page_url(skip=2, page_size=2): (200, {"value": [{"Identifier": "c"}]}),
+        })
+        first = await client.get(cbs.get_catalog_page_url(page_size=2))
+
+        pages = [datasets async for datasets, _ in cbs.iter_catalog_pages(client, first)]
+
+    assert [len(datasets) for datasets in pages] == [2, 1]
+    assert len(client.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_process_catalog_page_fetches_changed_datasets_only():
+    datasets = [
+        {"Identifier": "a", "Title": "A", "Modified": "2024-01-01"},
+        {"Identifier": "b", "Title": "B", "Modified": "2024-02-01"},
+        {"Identifier": "c", "Title": "C", "Modified": "2024-03-01"},
+    ]
+    known_versions = {cbs.get_dataset_url("a"): cbs.get_dataset_version(datasets[0])}
+    client = FakeClient({})
+    client.get_json = AsyncMock(side_effect=lambda url: {"value": [{"name": url}]})
+
+    with patch.object(cbs, "embed_records", AsyncMock(side_effect=lambda records, hashes: records)), \
+            patch.object(cbs, "write_records", MagicMock(return_value=(2, 0))) as mock_write, \
+            patch.object(cbs, "touch_endpoints", MagicMock()) as mock_touch:
+        counts = await cbs.process_catalog_page(MagicMock(), client, 1, datasets, known_versions, {})
+
+    assert counts == {"added": 2, "updated": 0, "embedded": 0, "unchanged": 1, "failed": 0}
+    assert sorted(call.args[0] for call in client.get_json.await_args_list) == [
+        cbs.get_dataset_url("b"), cbs.get_dataset_url("c")
+    ]
+    # The unchanged dataset is not rewritten, but still marked as seen
+    assert mock_touch.call_args.args[2] == [cbs.get_dataset_url("a")]
+
+    records = mock_write.call_args.args[2]
+    assert records[0].extra_metadata["endpoint_metadata"] == {
+        "url": cbs.get_dataset_url("b"),
+        "categories": [{"name": cbs.get_dataset_url("b")}]
+    }
+
+
+@pytest.mark.asyncio
+async def test_process_catalog_page_counts_failed_datasets():
+    datasets = [{"Identifier": "a", "Title": "A"}, {"Identifier": "b", "Title": "B"}]
+    client = FakeClient({})
+    client.get_json = AsyncMock(return_value={})
+
+    with patch.object(cbs, "embed_records", AsyncMock(side_effect=lambda records, hashes: records[:1])), \
+            patch.object(cbs, "write_records", MagicMock(return_value=(1, 0))), \
+            patch.object(cbs, "touch_endpoints", MagicMock()):
+        counts = await cbs.process_catalog_page(MagicMock(), client, 1, datasets, {}, {})
+
+    assert counts["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_build_cbs_record_without_endpoint_metadata_is_unstamped():
+    client = FakeClient({})
+    client.get_json = AsyncMock(side_effect=httpx.ConnectError("down"))
+
+    record = await cbs.build_cbs_record(client, {"Identifier": "a", "Title": "A", "Modified": "2024-01-01"})
+
+    assert record.extra_metadata["endpoint_metadata"] is None
+    assert "modified" not in record.extra_metadata
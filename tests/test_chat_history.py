@@ -0,0 +1,106 @@
+from unittest.mock import patch
+
+import pytest
+from pydantic_ai.messages import ModelRequest, ModelResponse
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from backend.agents import history
+from backend.models import ChatHistory, ChatSummary, User
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, username="alice", soul_data={}))
+        for i in range(25):
+            session.add(ChatHistory(user_id=1, role="user" if i % 2 == 0 else "model", content=f"message {i}"))
+        session.commit()
+    return engine
+
+
+def test_message_history_keeps_latest_messages_within_budget():
+    records = [
+        ChatHistory(id=1, user_id=1, role="user", content="a" * 400),
+        ChatHistory(id=2, user_id=1, role="model", content="b" * 400),
+        ChatHistory(id=3, user_id=1, role="user", content="c" * 400)
+    ]
+
+    messages = history.build_message_history("earlier", records, token_budget=250)
+
+    assert len(messages) == 3
+    assert messages[0].parts[0].content == "Summary of our earlier conversation:\nearlier"
+    assert isinstance(messages[1], ModelResponse) and isinstance(messages[2], ModelRequest)
+    assert messages[2].parts[0].content == "c" * 400
+
+
+def test_long_messages_are_truncated():
+    records = [ChatHistory(id=1, user_id=1, role="model", content="x" * 10000)]
+
+    with patch.object(history, "HISTORY_MESSAGE_MAX_TOKENS", 100):
+        messages = history.build_message_history(None, records)
+
+    assert messages[0].parts[0].content == "x" * 400 + " [...]"
+
+
+def test_compaction_summarizes_messages_before_the_replayed_ones(engine):
+    summarized = []
+
+    def summarize(previous_summary, records):
+        summarized.extend(record.content for record in records)
+        return "samenvatting"
+
+    with patch("backend.database.engine", engine), \
+            patch.object(history, "summarize_messages", side_effect=summarize):
+        with Session(engine) as session:
+            context = history.load_chat_context(session, 1)
+        assert [m.content for m in context.messages] == [f"message {i}" for i in range(15, 25)]
+        assert context.pending == 10
+
+        history.compact_history(1)
+
+    assert summarized == [f"message {i}" for i in range(15)]
+    with Session(engine) as session:
+        assert session.exec(select(ChatSummary)).one().summarized_until_id == 15
+        context = history.load_chat_context(session, 1)
+    assert context.summary == "samenvatting"
+    assert context.pending == 0
+
+
+def test_compaction_catches_up_a_long_backlog_in_one_run(engine):
+    batches = []
+
+    def summarize(previous_summary, records):
+        batches.append([record.content for record in records])
+        return f"samenvatting {len(batches)}"
+
+    with patch("backend.database.engine", engine), \
+            patch.object(history, "HISTORY_SUMMARY_BATCH_SIZE", 4), \
+            patch.object(history, "summarize_messages", side_effect=summarize):
+        history.compact_history(1)
+
+    assert [len(batch) for batch in batches] == [4, 4, 4, 3]
+    assert batches[-1] == ["message 12", "message 13", "message 14"]
+    with Session(engine) as session:
+        summary = session.exec(select(ChatSummary)).one()
+    assert (summary.summary, summary.summarized_until_id) == ("samenvatting 4", 15)
+
+
+def test_compaction_does_not_restore_the_summary_of_deleted_history(engine):
+    from sqlalchemy import delete
+
+    def summarize_while_history_is_deleted(previous_summary, records):
+        with Session(engine) as session:
+            session.exec(delete(ChatHistory).where(ChatHistory.user_id == 1))
+            session.exec(delete(ChatSummary).where(ChatSummary.user_id == 1))
+            session.commit()
+        return "samenvatting"
+
+    with patch("backend.database.engine", engine), \
+            patch.object(history, "summarize_messages", side_effect=summarize_while_history_is_deleted):
+        history.compact_history(1)
+
+    with Session(engine) as session:
+        assert session.exec(select(ChatSummary)).first() is None
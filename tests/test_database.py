@@ -65,3 +65,32 @@ def test_get_session(mock_session):
     # Complete the generator
     with pytest.raises(StopIteration):
         next(generator)
+
+
+@pytest.mark.asyncio
+async def test_run_in_session_supports_sync_and_async_sessions():
+    """Test that run_in_session calls the function with a sync session for both session kinds."""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel import create_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from backend.database import run_in_session
+
+    def select_one(session, offset):
+        return session.exec(text("SELECT 1")).one()[0] + offset
+
+    with Session(create_engine("sqlite://")) as session:
+        assert await run_in_session(session, select_one, 1) == 2
+
+    async_engine = create_async_engine("sqlite+aiosqlite://")
+    async with AsyncSession(async_engine) as session:
+        assert await run_in_session(session, select_one, offset=2) == 3
+    await async_engine.dispose()
+
+
+def test_pool_options_only_for_postgres():
+    """Test that the pool options are only used for Postgres."""
+    from backend.database import get_pool_options
+
+    assert get_pool_options("sqlite+aiosqlite:///./backend/data.db") == {}
+    assert get_pool_options("postgresql+asyncpg://u:p@db/loki")["pool_pre_ping"] is True
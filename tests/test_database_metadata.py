@@ -0,0 +1,27 @@
+from unittest.mock import patch
+
+from sqlalchemy.pool import NullPool
+
+from backend import database_metadata
+
+
+def test_pool_options_follow_settings():
+    with patch.object(database_metadata, "METADATA_DB_POOL_SIZE", 8), \
+            patch.object(database_metadata, "METADATA_DB_MAX_OVERFLOW", 4):
+        options = database_metadata.get_pool_options()
+
+    assert options["pool_size"] == 8
+    assert options["max_overflow"] == 4
+    assert "poolclass" not in options
+
+    with patch.object(database_metadata, "METADATA_DB_POOL_SIZE", 0):
+        assert database_metadata.get_pool_options() == {"poolclass": NullPool}
+
+
+def test_pool_stats_report_both_engines():
+    stats = database_metadata.get_metadata_pool_stats()
+
+    assert set(stats) == {"sync", "async"}
+    assert stats["sync"]["pool"] == "QueuePool"
+    assert stats["sync"]["checked_out"] == 0
+    assert stats["async"]["pool"] == "AsyncAdaptedQueuePool"
@@ -0,0 +1,42 @@
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import pytest
+
+from backend.api import dependencies
+from backend.cache import LRUCache
+from backend.models import User
+
+
+def make_session(user):
+    session = MagicMock()
+    session.exec = AsyncMock(return_value=MagicMock(first=MagicMock(return_value=user)))
+    return session
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_is_cached_until_forgotten():
+    user = User(id=7, username="alice", soul_data={"style": "detailed", "preferences": {"lang": "nl"}})
+    session = make_session(user)
+
+    with patch.object(dependencies, "_user_cache", LRUCache("current_user", 10, 60)):
+        first_user, first_soul = await dependencies.get_current_user("alice", session)
+        first_soul.style = "concise"
+        second_user, second_soul = await dependencies.get_current_user("alice", session)
+
+        assert second_user is first_user
+        assert second_soul.style == "detailed"
+        assert session.exec.await_count == 1
+
+        dependencies.forget_user("alice")
+        await dependencies.get_current_user("alice", session)
+        assert session.exec.await_count == 2
+
+
+def test_get_user_does_not_create_users():
+    session = MagicMock()
+    session.exec.return_value.first.return_value = None
+
+    with patch.object(dependencies, "_user_cache", LRUCache("current_user", 10, 60)):
+        assert dependencies.get_user("bob", session) is None
+
+    session.add.assert_not_called()
@@ -14,7 +14,9 @@ def reset_openai_client():
     """Reset the global _openai_client before each test."""
     backend.jobs.embeddings._openai_client = None
     mock_openai.AsyncOpenAI.reset_mock()
-    yield
+    # The module may already have been imported with the real client by another test module
+    with patch.object(backend.jobs.embeddings, "AsyncOpenAI", mock_openai.AsyncOpenAI):
+        yield
 
 def test_get_openai_client_success():
     """Test that get_openai_client returns a client when OPENAI_API_KEY is set."""
@@ -36,3 +38,54 @@ def test_get_openai_client_singleton():
         client2 = backend.jobs.embeddings.get_openai_client()
         assert client1 is client2
         assert mock_openai.AsyncOpenAI.call_count == 1
+
+def test_make_embedding_batches_respects_batch_size():
+    """Test that batches never exceed the maximum number of inputs."""
+    texts = [f"text {i}" for i in range(5)]
+    batches = backend.jobs.embeddings.make_embedding_batches(texts, max_batch_size=2, max_batch_tokens=10_000)
+    assert batches == [["text 0", "text 1"], ["text 2", "text 3"], ["text 4"]]
+
+def test_make_embedding_batches_respects_token_budget():
+    """Test that batches are split when the estimated token budget is exceeded."""
+    texts = ["a" * 30, "b" * 30, "c" * 30]  # ~11 tokens each
+    batches = backend.jobs.embeddings.make_embedding_batches(texts, max_batch_size=100, max_batch_tokens=25)
+    assert [len(b) for b in batches] == [2, 1]
+
+def test_truncate_for_embedding():
+    """Test that overly long texts are truncated below the per-input limit."""
+    long_text = "x" * (backend.jobs.embeddings.EMBEDDING_MAX_INPUT_TOKENS * 10)
+    truncated = backend.jobs.embeddings.truncate_for_embedding(long_text)
+    assert backend.jobs.embeddings.estimate_tokens(truncated) <= backend.jobs.embeddings.EMBEDDING_MAX_INPUT_TOKENS + 1
+    assert backend.jobs.embeddings.truncate_for_embedding("kort") == "kort"
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_batch_only_requests_cache_misses():
+    """Test that cached texts are not sent to the API and new embeddings are stored."""
+    from unittest.mock import AsyncMock
+
+    client = MagicMock()
+    client.embeddings.create = AsyncMock(return_value=MagicMock(data=[
+        MagicMock(index=1, embedding=[0.2]),
+        MagicMock(index=0, embedding=[0.1]),
+    ]))
+    backend.jobs.embeddings._openai_client = client
+
+    with patch.object(backend.jobs.embeddings, "get_cached_embeddings", return_value={"cached": [0.9]}), \
+         patch.object(backend.jobs.embeddings, "store_embeddings") as mock_store:
+        result = await backend.jobs.embeddings.generate_embeddings_batch(["new a", "cached", "new b", "new a"])
+
+    assert result == [[0.1], [0.9], [0.2], [0.1]]
+    client.embeddings.create.assert_awaited_once()
+    assert client.embeddings.create.await_args.kwargs["input"] == ["new a", "new b"]
+    mock_store.assert_called_once_with({"new a": [0.1], "new b": [0.2]}, backend.jobs.embeddings.EMBEDDING_MODEL)
+
+@pytest.mark.asyncio
+async def test_generate_embedding_cache_hit_skips_api():
+    """Test that a cache hit does not create an OpenAI client at all."""
+    with patch.object(backend.jobs.embeddings, "get_cached_embeddings", return_value={"query": [0.3]}), \
+         patch.object(backend.jobs.embeddings, "store_embeddings") as mock_store, \
+         patch.dict(os.environ, clear=True):
+        assert await backend.jobs.embeddings.generate_embedding("query") == [0.3]
+
+    mock_store.assert_not_called()
+    mock_openai.AsyncOpenAI.assert_not_called()
@@ -0,0 +1,93 @@
+import asyncio
+import httpx
+import pytest
+
+from backend.jobs.http_client import SyncHttpClient, CircuitOpenError
+
+
+def make_client(handler, **kwargs):
+    kwargs.setdefault("rate_limit", 0)
+    kwargs.setdefault("backoff", 0)
+    return SyncHttpClient(transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_get_retries_server_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"ok": True})
+
+    async with make_client(handler, max_retries=3) as client:
+        assert await client.get_json("https://example.org/data") == {"ok": True}
+
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_returns_last_response_when_retries_exhausted():
+    def handler(request):
+        return httpx.Response(500)
+
+    async with make_client(handler, max_retries=2, breaker_threshold=0) as client:
+        response = await client.get("https://example.org/data")
+
+    assert response.status_code == 500
+
+
+@pytest.mark.asyncio
+async def test_get_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(404)
+
+    async with make_client(handler, max_retries=3) as client:
+        response = await client.get("https://example.org/missing")
+
+    assert response.status_code == 404
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_consecutive_failures():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async with make_client(handler, max_retries=0, breaker_threshold=2, breaker_cooldown=60) as client:
+        for _ in range(2):
+            with pytest.raises(httpx.ConnectError):
+                await client.get("https://down.example.org/a")
+
+        with pytest.raises(CircuitOpenError):
+            await client.get("https://down.example.org/b")
+
+        # Other hosts are not affected
+        with pytest.raises(httpx.ConnectError):
+            await client.get("https://other.example.org/a")
+
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_per_host_concurrency_cap():
+    in_flight = {"current": 0, "max": 0}
+
+    async def handler(request):
+        in_flight["current"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+        return httpx.Response(200, json={})
+
+    async with make_client(handler, concurrency=8, host_concurrency=2) as client:
+        await asyncio.gather(*(client.get(f"https://example.org/{i}") for i in range(10)))
+
+    assert in_flight["max"] == 2
@@ -0,0 +1,40 @@
+import numpy as np
+
+from backend.memory_index import MemoryVectorIndex
+
+
+def make_index(dtype=np.float32):
+    vectors = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0], [0.6, 0.8]], dtype=dtype)
+    rows = [
+        (1, 1, "https://api.pdok.nl/a", "A", None, "OGC API", None),
+        (2, 1, "https://api.pdok.nl/ogc/b", "B", None, "OGC API", None),
+        (3, 2, "https://opendata.cbs.nl/c", "C", None, "OData", None),
+        (4, 1, "https://api.pdok.nl/ogc/d", "D", None, "OGC API", None),
+    ]
+    return MemoryVectorIndex(
+        vectors, rows, np.array([1, 1, 2, 1]), np.array([False, True, False, True]),
+        {1: ("PDOK", "pdok"), 2: ("CBS", "cbs")}
+    )
+
+
+def test_search_returns_top_k_by_cosine_distance():
+    results = make_index().search([2.0, 0.0], 2)
+
+    assert [row.title for row in results] == ["A", "B"]
+    assert results[0].distance == 0.0
+    assert round(results[1].distance, 4) == 0.2
+    assert results[0].source_type == "pdok"
+
+
+def test_search_applies_source_and_ogc_masks():
+    index = make_index(np.float16)
+
+    assert [row.title for row in index.search([1.0, 0.0], 5, source_id=2)] == ["C"]
+    assert [row.title for row in index.search([1.0, 0.0], 5, source_id=1, ogc_only=True)] == ["B", "D"]
+    assert index.search([1.0, 0.0], 5, source_id=3) == []
+
+
+def test_search_batch_uses_one_filter_per_query():
+    results = make_index().search_batch([[1.0, 0.0], [0.0, 1.0]], 1, [(1, True), (None, False)])
+
+    assert [[row.title for row in rows] for rows in results] == [["B"], ["C"]]
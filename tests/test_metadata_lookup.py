@@ -0,0 +1,146 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import pytest
+
+from backend.cache import LRUCache, SemanticCache
+from backend.tools import metadata_lookup
+
+
+def make_session(source, rows):
+    session = MagicMock()
+    session.exec = AsyncMock(return_value=MagicMock(first=MagicMock(return_value=source)))
+    session.run_sync = AsyncMock(return_value=rows)
+    session.close = AsyncMock()
+    return session
+
+
+@pytest.mark.asyncio
+async def test_find_endpoint_async_searches_on_async_session():
+    row = SimpleNamespace(
+        endpoint_url="https://api.pdok.nl/ogc/v1", title="BAG", description="Gebouwen",
+        api_type="OGC API", extra_metadata=json.dumps({"collections_url": "https://api.pdok.nl/ogc/v1/collections"}),
+        distance=0.1
+    )
+    session = make_session(SimpleNamespace(id=3), [row])
+
+    with patch.object(metadata_lookup, "get_async_metadata_session", return_value=session), \
+            patch.object(metadata_lookup, "generate_embedding", AsyncMock(return_value=[0.5, 0.25])), \
+            patch.object(metadata_lookup, "_metadata_cache", LRUCache("lookup", 10, 60)), \
+            patch.object(metadata_lookup, "_embedding_cache", LRUCache("embedding", 10, 60)), \
+            patch.object(metadata_lookup, "_semantic_cache", SemanticCache("semantic", 10, 60, 0.97)):
+        result = json.loads(await metadata_lookup.find_endpoint_async("bag", "pdok", 1, True, "hybrid"))
+
+    assert result["preferred_url"] == "https://api.pdok.nl/ogc/v1/collections"
+    args = session.run_sync.await_args.args
+    assert args[0] is metadata_lookup.search_endpoints
+    assert args[2:] == ("e.source_id = 3 AND e.deleted_at IS NULL AND e.is_ogc", "bag", "[0.5,0.25]", 1, "hybrid")
+    session.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_search_metadata_async_lexical_skips_embedding():
+    session = make_session(None, [])
+    mock_embedding = AsyncMock()
+
+    with patch.object(metadata_lookup, "get_async_metadata_session", return_value=session), \
+            patch.object(metadata_lookup, "generate_embedding", mock_embedding):
+        assert await metadata_lookup.search_metadata_async("85039NED", None, 5, "lexical") == []
+
+    mock_embedding.assert_not_awaited()
+    assert session.run_sync.await_args.args[3:6] == ("85039NED", None, 5)
+
+
+@pytest.mark.asyncio
+async def test_query_embedding_is_cached():
+    mock_embedding = AsyncMock(return_value=[0.5])
+
+    with patch.object(metadata_lookup, "generate_embedding", mock_embedding), \
+            patch.object(metadata_lookup, "_embedding_cache", LRUCache("embedding", 10, 60)):
+        assert await metadata_lookup.get_query_embedding("bag") == [0.5]
+        assert await metadata_lookup.get_query_embedding("bag") == [0.5]
+
+    mock_embedding.assert_awaited_once_with("bag")
+
+
+def test_canonicalize_query():
+    assert metadata_lookup.canonicalize_query("Bevolking  van Apeldoorn ") == "bevolking apeldoorn"
+    assert metadata_lookup.canonicalize_query("bevolking apeldoorn") == "bevolking apeldoorn"
+    assert metadata_lookup.canonicalize_query("Fryslân, wegen!") == "fryslan wegen"
+    assert metadata_lookup.canonicalize_query("de") == "de"
+
+
+@pytest.mark.asyncio
+async def test_find_endpoint_async_reuses_results_of_similar_queries():
+    row = SimpleNamespace(
+        endpoint_url="https://opendata.cbs.nl/85039NED", title="Bevolking", description="",
+        api_type="OData", extra_metadata=None, distance=0.1
+    )
+    session = make_session(SimpleNamespace(id=2), [row])
+    embeddings = {"Bevolking Apeldoorn": [1.0, 0.0], "Inwoners Apeldoorn": [0.99, 0.02]}
+
+    async def embed(query):
+        return embeddings[query]
+
+    with patch.object(metadata_lookup, "get_async_metadata_session", return_value=session), \
+            patch.object(metadata_lookup, "generate_embedding", AsyncMock(side_effect=embed)) as mock_embedding, \
+            patch.object(metadata_lookup, "_metadata_cache", LRUCache("lookup", 10, 60)), \
+            patch.object(metadata_lookup, "_embedding_cache", LRUCache("embedding", 10, 60)), \
+            patch.object(metadata_lookup, "_semantic_cache", SemanticCache("semantic", 10, 60, 0.95)), \
+            patch.object(metadata_lookup, "SEMANTIC_CACHE_THRESHOLD", 0.95):
+        first = await metadata_lookup.find_endpoint_async("Bevolking Apeldoorn", "cbs", 1, search_mode="vector")
+        assert await metadata_lookup.find_endpoint_async("bevolking  van apeldoorn", "cbs", 1, search_mode="vector") == first
+        assert await metadata_lookup.find_endpoint_async("Inwoners Apeldoorn", "cbs", 1, search_mode="vector") == first
+
+    # The query is embedded as typed, only the cache key is canonicalized
+    assert [call.args[0] for call in mock_embedding.await_args_list] == ["Bevolking Apeldoorn", "Inwoners Apeldoorn"]
+    session.run_sync.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_find_endpoint_async_hybrid_does_not_reuse_similar_queries():
+    row = SimpleNamespace(
+        endpoint_url="https://opendata.cbs.nl/85039NED", title="Bevolking", description="",
+        api_type="OData", extra_metadata=None, distance=0.1
+    )
+    session = make_session(SimpleNamespace(id=2), [row])
+
+    with patch.object(metadata_lookup, "get_async_metadata_session", return_value=session), \
+            patch.object(metadata_lookup, "generate_embedding", AsyncMock(return_value=[1.0, 0.0])), \
+            patch.object(metadata_lookup, "_metadata_cache", LRUCache("lookup", 10, 60)), \
+            patch.object(metadata_lookup, "_embedding_cache", LRUCache("embedding", 10, 60)), \
+            patch.object(metadata_lookup, "_semantic_cache", SemanticCache("semantic", 10, 60, 0.95)):
+        await metadata_lookup.find_endpoint_async("CBS 2021", "cbs", 1, search_mode="hybrid")
+        await metadata_lookup.find_endpoint_async("CBS 2023", "cbs", 1, search_mode="hybrid")
+        await metadata_lookup.find_endpoint_async("cbs 2023", "cbs", 1, search_mode="hybrid")
+
+    assert session.run_sync.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_find_endpoint_async_default_mode_uses_memory_index_and_semantic_cache():
+    row = SimpleNamespace(
+        endpoint_url="https://opendata.cbs.nl/85039NED", title="Bevolking", description="",
+        api_type="OData", extra_metadata=None, distance=0.1
+    )
+    memory_index = MagicMock(source_ids_by_type={"cbs": 2})
+    memory_index.search.return_value = [row]
+    session = make_session(None, [])
+    embeddings = {"Bevolking Apeldoorn": [1.0, 0.0], "Inwoners Apeldoorn": [0.99, 0.02]}
+
+    async def embed(query):
+        return embeddings[query]
+
+    with patch.object(metadata_lookup, "get_async_metadata_session", return_value=session), \
+            patch.object(metadata_lookup, "get_memory_index", return_value=memory_index), \
+            patch.object(metadata_lookup, "generate_embedding", AsyncMock(side_effect=embed)), \
+            patch.object(metadata_lookup, "_metadata_cache", LRUCache("lookup", 10, 60)), \
+            patch.object(metadata_lookup, "_embedding_cache", LRUCache("embedding", 10, 60)), \
+            patch.object(metadata_lookup, "_semantic_cache", SemanticCache("semantic", 10, 60, 0.95)), \
+            patch.object(metadata_lookup, "SEMANTIC_CACHE_THRESHOLD", 0.95):
+        first = await metadata_lookup.find_endpoint_async("Bevolking Apeldoorn", "cbs")
+        assert await metadata_lookup.find_endpoint_async("Inwoners Apeldoorn", "cbs") == first
+
+    memory_index.search.assert_called_once_with([1.0, 0.0], 1, 2, False)
+    session.run_sync.assert_not_awaited()
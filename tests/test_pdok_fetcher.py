@@ -0,0 +1,174 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from backend.jobs.fetchers import pdok
+from backend.jobs.fetchers.pdok import collect_pdok_apis
+from backend.jobs.http_client import SyncHttpClient
+
+# Trimmed recording of https://api.pdok.nl/index.json and the documents it links to.
+# "{base}" is replaced with the address of the stub server.
+RECORDED_PDOK = {
+    "/index.json": {
+        "apis": [
+            {
+                "title": "Bestuurlijke Gebieden (OGC API)",
+                "description": "Bestuurlijke grenzen van gemeenten en provincies",
+                "keywords": [{"keyword": "gemeenten"}, "provincies"],
+                "links": [{"rel": "root", "href": "{base}/kadaster/bestuurlijkegebieden/ogc/v1"}]
+            },
+            {
+                "title": "CBS Wijken en Buurten (OGC API)",
+                "description": "Wijk- en buurtkaart",
+                "links": [{"rel": "root", "href": "{base}/cbs/wijkenbuurten/ogc/v1"}]
+            },
+            {
+                "title": "Verdwenen API",
+                "links": [{"rel": "root", "href": "{base}/verdwenen/ogc/v1"}]
+            },
+            {
+                "title": "Zonder root link",
+                "links": [{"rel": "self", "href": "{base}/geen/root"}]
+            }
+        ]
+    },
+    "/kadaster/bestuurlijkegebieden/ogc/v1": {
+        "links": [
+            {"rel": "data", "href": "{base}/kadaster/bestuurlijkegebieden/ogc/v1/collections"},
+            {"rel": "http://www.opengis.net/def/rel/ogc/1.0/tilesets-vector",
+             "href": "{base}/kadaster/bestuurlijkegebieden/ogc/v1/tiles"}
+        ]
+    },
+    "/kadaster/bestuurlijkegebieden/ogc/v1/collections": {
+        "collections": [
+            {
+                "id": "gemeentegebied",
+                "title": "Gemeentegebied",
+                "description": "Gemeentegrenzen",
+                "keywords": [{"keyword": "gemeente"}],
+                "links": [{"rel": "items", "href": "{base}/kadaster/bestuurlijkegebieden/ogc/v1/collections/gemeentegebied/items"}]
+            },
+            {
+                "id": "provinciegebied",
+                "links": [{"rel": "items", "href": "{base}/kadaster/bestuurlijkegebieden/ogc/v1/collections/provinciegebied/items"}]
+            }
+        ]
+    },
+    "/cbs/wijkenbuurten/ogc/v1": {
+        "links": [{"rel": "data", "href": "{base}/cbs/wijkenbuurten/ogc/v1/collections"}]
+    },
+    "/cbs/wijkenbuurten/ogc/v1/collections": {
+        "collections": [
+            {
+                "id": "buurten",
+                "title": "Buurten",
+                "links": [{"rel": "items", "href": "{base}/cbs/wijkenbuurten/ogc/v1/collections/buurten/items"}]
+            }
+        ]
+    }
+}
+
+
+@pytest.fixture
+def pdok_stub():
+    """Serve the recorded PDOK documents from a local HTTP server."""
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            requested.append(path)
+            document = RECORDED_PDOK.get(path)
+            if document is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            body = json.dumps(document).replace("{base}", base_url).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield base_url, requested
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_collect_pdok_apis_from_stub(pdok_stub):
+    base_url, requested = pdok_stub
+
+    fetched = await collect_pdok_apis(f"{base_url}/index.json", concurrency=4)
+
+    by_url = {f["api_url"]: f for f in fetched}
+    assert set(by_url) == {
+        f"{base_url}/kadaster/bestuurlijkegebieden/ogc/v1",
+        f"{base_url}/cbs/wijkenbuurten/ogc/v1",
+        f"{base_url}/verdwenen/ogc/v1",
+    }
+
+    bestuurlijk = by_url[f"{base_url}/kadaster/bestuurlijkegebieden/ogc/v1"]
+    assert bestuurlijk["api_info"]["collections_url"] == f"{base_url}/kadaster/bestuurlijkegebieden/ogc/v1/collections"
+    assert bestuurlijk["api_info"]["tiles_url"] == f"{base_url}/kadaster/bestuurlijkegebieden/ogc/v1/tiles"
+    assert [c["id"] for c in bestuurlijk["collections"]] == ["gemeentegebied", "provinciegebied"]
+    assert bestuurlijk["collections"][0]["keywords"] == ["gemeente"]
+    assert bestuurlijk["collections"][1]["title"] == "provinciegebied"
+
+    # A failing landing page is tolerated and yields no collections
+    verdwenen = by_url[f"{base_url}/verdwenen/ogc/v1"]
+    assert verdwenen["api_info"]["collections_url"] is None
+    assert verdwenen["collections"] == []
+
+    assert requested.count("/index.json") == 1
+
+
+@pytest.mark.asyncio
+async def test_collect_pdok_apis_reuses_given_client(pdok_stub):
+    base_url, requested = pdok_stub
+
+    async with SyncHttpClient(concurrency=2, rate_limit=0) as client:
+        first = await collect_pdok_apis(f"{base_url}/index.json", client=client)
+        second = await collect_pdok_apis(f"{base_url}/index.json", client=client)
+
+    assert len(first) == len(second) == 3
+    assert requested.count("/index.json") == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_pdok_metadata_checkpoints_and_resumes(pdok_stub):
+    base_url, requested = pdok_stub
+    index_url = f"{base_url}/index.json"
+    checkpoints = []
+
+    with patch.object(pdok, "PDOK_API_BATCH_SIZE", 1), \
+            patch.object(pdok, "get_metadata_session", MagicMock()), \
+            patch.object(pdok, "get_or_create_pdok_source", MagicMock(return_value=MagicMock(id=1))), \
+            patch.object(pdok, "embed_records", AsyncMock(side_effect=lambda records, hashes: records)), \
+            patch.object(pdok, "write_records", MagicMock(side_effect=lambda session, source_id, records, seen_at: (len(records), 0))), \
+            patch.object(pdok, "touch_endpoints", MagicMock()), \
+            patch.object(pdok, "sweep_endpoints", MagicMock(return_value=0)), \
+            patch.object(pdok, "rebuild_vector_index_after_sync", autospec=True):
+        full_result = await pdok.fetch_pdok_metadata(index_url, full_sync=True, on_checkpoint=checkpoints.append)
+
+        assert [c["api_index"] for c in checkpoints] == [1, 2, 3]
+
+        requested.clear()
+        resumed_result = await pdok.fetch_pdok_metadata(index_url, full_sync=True, checkpoint=checkpoints[1])
+
+    # The first two APIs are not fetched again, and their counts are carried over from the checkpoint
+    assert not any(path.startswith(("/kadaster", "/cbs")) for path in requested)
+    assert resumed_result == full_result
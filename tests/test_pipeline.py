@@ -0,0 +1,112 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch, AsyncMock, MagicMock
+from sqlalchemy.dialects import postgresql
+
+from backend.jobs import pipeline
+from backend.jobs.embeddings import embedding_content_hash
+from backend.jobs.pipeline import EndpointRecord, build_embedding_text, embed_records
+
+
+def make_record(url: str, title: str) -> EndpointRecord:
+    return EndpointRecord(
+        endpoint_url=url,
+        title=title,
+        description="beschrijving",
+        api_type="CBS OData",
+        embedding_text=build_embedding_text(title, "beschrijving", "bevolking")
+    )
+
+
+def test_build_embedding_text():
+    assert build_embedding_text("Titel", "Omschrijving") == "Titel: Omschrijving"
+    assert build_embedding_text("Titel", "Omschrijving", "a, b") == "Titel: Omschrijving Keywords: a, b"
+
+
+def test_content_hash_depends_on_text_and_model():
+    assert embedding_content_hash("tekst") == embedding_content_hash("tekst")
+    assert embedding_content_hash("tekst") != embedding_content_hash("tekst ")
+    assert embedding_content_hash("tekst", model="a") != embedding_content_hash("tekst", model="b")
+
+
+@pytest.mark.asyncio
+async def test_embed_records_skips_unchanged():
+    unchanged = make_record("https://example.org/1", "Bevolking")
+    changed = make_record("https://example.org/2", "Huishoudens")
+    new = make_record("https://example.org/3", "Woningen")
+
+    known_hashes = {
+        unchanged.endpoint_url: embedding_content_hash(unchanged.embedding_text),
+        changed.endpoint_url: "outdated-hash",
+    }
+
+    mock_batch = AsyncMock(side_effect=lambda texts: [[0.5] * 3 for _ in texts])
+    with patch.object(pipeline, "generate_embeddings_batch", mock_batch):
+        records = await embed_records([unchanged, changed, new], known_hashes)
+
+    mock_batch.assert_awaited_once()
+    assert mock_batch.await_args.args[0] == [changed.embedding_text, new.embedding_text]
+
+    by_url = {r.endpoint_url: r for r in records}
+    assert by_url[unchanged.endpoint_url].embedding is None
+    assert by_url[changed.endpoint_url].embedding == [0.5] * 3
+    assert by_url[new.endpoint_url].content_hash == embedding_content_hash(new.embedding_text)
+
+
+@pytest.mark.asyncio
+async def test_embed_records_drops_failed_batch():
+    records = [make_record(f"https://example.org/{i}", f"Tabel {i}") for i in range(3)]
+
+    mock_batch = AsyncMock(side_effect=RuntimeError("rate limited"))
+    with patch.object(pipeline, "generate_embeddings_batch", mock_batch):
+        result = await embed_records(records)
+
+    assert result == []
+
+
+def test_write_records_upserts_in_chunks():
+    session = MagicMock()
+    session.execute.side_effect = lambda stmt: MagicMock(all=MagicMock(return_value=[
+        MagicMock(inserted=True), MagicMock(inserted=False)
+    ]))
+
+    records = [make_record(f"https://example.org/{i}", f"Tabel {i}") for i in range(4)]
+    records.append(make_record("https://example.org/0", "Tabel 0 (nieuw)"))
+
+    with patch.object(pipeline, "WRITE_CHUNK_SIZE", 2):
+        added, updated = pipeline.write_records(session, 1, records)
+
+    # Duplicate URLs are collapsed before upserting, leaving 4 records in 2 chunks
+    assert session.execute.call_count == 2
+    assert (added, updated) == (2, 2)
+    assert session.commit.call_count == 2
+
+    first_stmt = session.execute.call_args_list[0].args[0]
+    compiled = str(first_stmt.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (source_id, endpoint_url) DO UPDATE" in compiled
+    assert "coalesce(excluded.embedding, metadata_endpoint.embedding)" in compiled
+
+
+def test_sweep_endpoints_soft_deletes_unseen():
+    session = MagicMock()
+    session.execute.side_effect = [
+        MagicMock(one=MagicMock(return_value=(10, 2))),
+        MagicMock(rowcount=2),
+    ]
+
+    removed = pipeline.sweep_endpoints(session, 1, datetime(2024, 1, 1))
+
+    assert removed == 2
+    assert "SET deleted_at" in str(session.execute.call_args_list[1].args[0])
+    session.commit.assert_called_once()
+
+
+def test_sweep_endpoints_skips_when_too_many_unseen():
+    session = MagicMock()
+    session.execute.return_value = MagicMock(one=MagicMock(return_value=(10, 8)))
+
+    with patch.object(pipeline, "SWEEP_MAX_FRACTION", 0.5):
+        removed = pipeline.sweep_endpoints(session, 1, datetime(2024, 1, 1), purge=True)
+
+    assert removed == 0
+    assert session.execute.call_count == 1
@@ -0,0 +1,191 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from backend import vector_index
+
+
+def test_hnsw_index_sql():
+    with patch.object(vector_index, "METADATA_HNSW_M", 24), patch.object(vector_index, "METADATA_HNSW_EF_CONSTRUCTION", 128):
+        sql = vector_index.get_vector_index_sql("ix_test", "hnsw")
+
+    assert sql == (
+        "CREATE INDEX CONCURRENTLY ix_test ON metadata_endpoint "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 128)"
+    )
+
+
+def test_ivfflat_lists_follow_row_count():
+    assert vector_index.get_vector_index_options("ivfflat", 500) == {"lists": 10}
+    assert vector_index.get_vector_index_options("ivfflat", 50000) == {"lists": 50}
+
+
+def test_index_matches_configured_options():
+    indexdef = (
+        "CREATE INDEX ix_metadata_endpoint_embedding ON public.metadata_endpoint "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m='16', ef_construction='64')"
+    )
+
+    with patch.object(vector_index, "METADATA_HNSW_M", 16), patch.object(vector_index, "METADATA_HNSW_EF_CONSTRUCTION", 64):
+        assert vector_index.index_matches(indexdef, "hnsw")
+        assert not vector_index.index_matches(indexdef, "ivfflat")
+        assert not vector_index.index_matches(None, "hnsw")
+
+    with patch.object(vector_index, "METADATA_HNSW_M", 32):
+        assert not vector_index.index_matches(indexdef, "hnsw")
+
+
+def test_search_settings_cover_limit():
+    with patch.object(vector_index, "METADATA_VECTOR_INDEX", "hnsw"), patch.object(vector_index, "METADATA_HNSW_EF_SEARCH", 100):
+        assert vector_index.get_search_settings(10) == {"hnsw.ef_search": 100}
+        assert vector_index.get_search_settings(250) == {"hnsw.ef_search": 250}
+
+    with patch.object(vector_index, "METADATA_VECTOR_INDEX", "none"):
+        assert vector_index.get_search_settings(10) == {}
+
+
+def test_iterative_scan_requires_pgvector_0_8():
+    with patch.object(vector_index, "METADATA_VECTOR_INDEX", "hnsw"), \
+            patch.object(vector_index, "METADATA_ITERATIVE_SCAN", "strict_order"):
+        assert "hnsw.iterative_scan" not in vector_index.get_search_settings(10, (0, 7, 4))
+        assert vector_index.get_search_settings(10, (0, 8, 0))["hnsw.iterative_scan"] == "strict_order"
+
+
+def test_partial_index_specs_per_source():
+    conn = MagicMock()
+    conn.execute.return_value.fetchall.return_value = [(1, "pdok", True), (2, "cbs", False)]
+
+    specs = vector_index.get_vector_index_specs(conn)
+
+    assert [(spec.name, spec.predicate) for spec in specs] == [
+        ("ix_metadata_endpoint_embedding", None),
+        ("ix_metadata_endpoint_embedding_pdok_1", "source_id = 1 AND deleted_at IS NULL"),
+        ("ix_metadata_endpoint_embedding_pdok_1_ogc", "source_id = 1 AND is_ogc AND deleted_at IS NULL"),
+        ("ix_metadata_endpoint_embedding_cbs_2", "source_id = 2 AND deleted_at IS NULL"),
+    ]
+    assert vector_index.get_vector_index_sql("ix_test", "hnsw", predicate=specs[1].predicate).endswith(
+        "WHERE source_id = 1 AND deleted_at IS NULL"
+    )
+
+
+def test_rebuild_after_sync_only_above_threshold():
+    engine = MagicMock()
+    engine.connect.return_value.__enter__.return_value.execute.return_value.scalar.return_value = 1000
+
+    with patch.object(vector_index, "METADATA_VECTOR_INDEX", "hnsw"), \
+            patch.object(vector_index, "METADATA_REINDEX_THRESHOLD", 0.2), \
+            patch.object(vector_index, "metadata_engine", engine), \
+            patch.object(vector_index, "ensure_vector_index") as mock_ensure, \
+            patch.object(vector_index, "rebuild_vector_index") as mock_rebuild:
+        assert not vector_index.rebuild_vector_index_after_sync(1, 100)
+        assert vector_index.rebuild_vector_index_after_sync(1, 300)
+
+    mock_ensure.assert_called_once()
+    mock_rebuild.assert_called_once_with(1)
+
+
+def test_ensure_vector_index_skips_while_another_process_holds_the_lock():
+    engine = MagicMock()
+    conn = engine.connect.return_value.execution_options.return_value.__enter__.return_value
+    conn.execute.return_value.scalar.return_value = False
+
+    with patch.object(vector_index, "metadata_engine", engine), \
+            patch.object(vector_index, "build_vector_index") as mock_build:
+        vector_index.ensure_vector_index()
+
+    mock_build.assert_not_called()
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert statements == ["SELECT pg_try_advisory_lock(:key)"]
+
+
+def test_vector_search_sql_without_quantization():
+    sql = vector_index.get_vector_search_sql("e.id", "e.source_id = 1")
+
+    assert sql == (
+        "SELECT e.id, e.embedding <=> cast(:embedding_str as vector) AS distance FROM metadata_endpoint e "
+        "WHERE e.source_id = 1 ORDER BY e.embedding <=> cast(:embedding_str as vector) LIMIT :limit"
+    )
+
+
+def test_vector_search_sql_reranks_quantized_candidates():
+    sql = vector_index.get_vector_search_sql("e.id", "e.deleted_at IS NULL", "binary")
+
+    assert "ORDER BY (binary_quantize(e.embedding)::bit(1536)) <~> binary_quantize(cast(:embedding_str as vector)) LIMIT :candidates" in sql
+    assert sql.endswith(") candidates ORDER BY distance LIMIT :limit")
+
+    index_sql = vector_index.get_vector_index_sql("ix_test", "hnsw", quantization="halfvec")
+    assert "USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops)" in index_sql
+
+
+def test_quantization_falls_back_on_old_pgvector():
+    with patch.object(vector_index, "METADATA_VECTOR_QUANTIZATION", "halfvec"), \
+            patch.object(vector_index, "_quantization", None), \
+            patch.object(vector_index, "_pgvector_version", (0, 6, 2)):
+        assert vector_index.get_quantization(MagicMock()) == "none"
+
+    with patch.object(vector_index, "METADATA_VECTOR_QUANTIZATION", "halfvec"), \
+            patch.object(vector_index, "_quantization", None), \
+            patch.object(vector_index, "_pgvector_version", (0, 8, 0)):
+        assert vector_index.get_quantization(MagicMock()) == "halfvec"
+
+
+def test_hybrid_search_sql_fuses_both_rankings():
+    sql = vector_index.get_hybrid_search_sql(
+        "e.id, s.name", "e.source_id = 1 AND e.deleted_at IS NULL", joins="JOIN metadata_source s ON e.source_id = s.id"
+    )
+
+    # Both rankings use the partial index filter and are limited to the candidates
+    assert "WHERE e.source_id = 1 AND e.deleted_at IS NULL ORDER BY e.embedding <=> cast(:embedding_str as vector) LIMIT :candidates" in sql
+    assert "WHERE e.source_id = 1 AND e.deleted_at IS NULL AND e.search_tsv @@ q.query ORDER BY text_rank DESC LIMIT :candidates" in sql
+    assert "coalesce(1.0 / (:rrf_k + semantic.rank), 0) + coalesce(1.0 / (:rrf_k + lexical.rank), 0) AS score" in sql
+    assert sql.endswith(
+        "FROM fused JOIN metadata_endpoint e ON e.id = fused.id JOIN metadata_source s ON e.source_id = s.id "
+        "ORDER BY fused.score DESC, distance LIMIT :limit"
+    )
+
+
+def test_lexical_search_skips_embedding():
+    session = MagicMock()
+
+    with patch.object(vector_index, "get_quantization") as mock_quantization:
+        vector_index.search_endpoints(session, "e.id", "e.deleted_at IS NULL", "85039NED", None, 5, "lexical")
+
+    mock_quantization.assert_not_called()
+    sql, params = session.execute.call_args.args
+    assert "plainto_tsquery('dutch', :query)" in str(sql)
+    assert params == {"query": "85039NED", "limit": 5}
+
+
+def test_search_mode_defaults_to_setting():
+    with patch.object(vector_index, "METADATA_SEARCH_MODE", "hybrid"):
+        assert vector_index.get_search_mode() == "hybrid"
+        assert vector_index.get_search_mode("Vector") == "vector"
+
+    with pytest.raises(ValueError):
+        vector_index.get_search_mode("fuzzy")
+
+
+def test_batch_vector_search_sql_groups_queries_by_filter():
+    sql = vector_index.get_batch_vector_search_sql(
+        "e.id", [("e.source_id = 1 AND e.deleted_at IS NULL", [0, 2]), ("e.source_id = 2 AND e.deleted_at IS NULL", [1])]
+    )
+
+    assert sql.count("CROSS JOIN LATERAL") == 2
+    assert "FROM (VALUES (0, :embedding_0), (2, :embedding_2)) AS q(query_index, embedding)" in sql
+    assert "WHERE e.source_id = 2 AND e.deleted_at IS NULL ORDER BY e.embedding <=> cast(q.embedding as vector) LIMIT :limit" in sql
+    assert sql.endswith(" ORDER BY query_index, distance")
+
+
+def test_vector_search_batch_returns_rows_per_search():
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = [
+        MagicMock(query_index=0, id=5), MagicMock(query_index=1, id=7), MagicMock(query_index=0, id=6)
+    ]
+
+    with patch.object(vector_index, "get_quantization", return_value="none"), \
+            patch.object(vector_index, "apply_search_settings"):
+        results = vector_index.vector_search_batch(session, "e.id", [("w1", "[1]"), ("w2", "[2]"), ("w1", "[3]")], 2)
+
+    assert [[row.id for row in rows] for rows in results] == [[5, 6], [7], []]
+    params = session.execute.call_args.args[1]
+    assert (params["embedding_0"], params["embedding_2"], params["limit"]) == ("[1]", "[3]", 2)